@@ -1,23 +1,76 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+import fcntl
+import gzip
+import hashlib
+import hmac
 import os
+import re
 import shutil
+import uuid
+import weakref
 from typing import Optional, List
-import uvicorn
+from urllib.parse import quote
+
+import aiofiles
 
 from config import settings
-from services.pdf_service import PDFService
-from services.ppt_service import PPTService
-from services.ai_service import AIService
-from services.content_generator import ContentGenerator
-from services.large_file_handler import LargeFileHandler
+from services.lazy_service import LazyService
+from services.job_tracker import job_tracker
+from services.ai_limiter import limiter_snapshots
+from services.tracing import TracingMiddleware, span
+from services.profiler import ProfilingMiddleware, profiler, folded, top_functions
+from services.compression import CompressionMiddleware, PrecompressedStaticFiles, precompress_static, brotli
+
+async def _warm_up():
+    """Carregar serviços e caches em segundo plano, depois que o worker já responde"""
+    await asyncio.sleep(settings.WARMUP_DELAY)
+    try:
+        await asyncio.to_thread(preload_caches)
+    except Exception as e:
+        print(f"Aviso: falha no aquecimento dos serviços: {e}")
+
+STATIC_DIR = "static"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.to_thread(precompress_static, STATIC_DIR)
+    except Exception as e:
+        print(f"Aviso: falha ao pré-comprimir arquivos estáticos: {e}")
+    if settings.WARMUP_MODE == "background":
+        job_tracker.spawn(_warm_up(), name="warm-up")
+    yield
+    if thumbnail_service.loaded:
+        thumbnail_service.shutdown()
+    if conversion_service.loaded:
+        conversion_service.shutdown()
+    if batch_processor.loaded:
+        batch_processor.shutdown()
+    if large_file_handler.loaded:
+        large_file_handler.shutdown()
+    if ocr_service.loaded:
+        ocr_service.shutdown()
+    if prefetcher.loaded:
+        prefetcher.shutdown()
+    if profiler.active:
+        profiler.stop()
+    # Encerramento: aguardar tarefas em segundo plano antes de o worker sair
+    cancelled = await job_tracker.drain(settings.DRAIN_TIMEOUT)
+    if cancelled:
+        print(f"Aviso: {cancelled} tarefa(s) cancelada(s) no encerramento")
 
 app = FastAPI(
     title="IA Pedagógico",
     description="Plataforma de IA para auxiliar o setor pedagógico na edição de materiais",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -29,90 +82,469 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Serviços
-pdf_service = PDFService()
-ppt_service = PPTService()
-ai_service = AIService()
-content_generator = ContentGenerator()
-large_file_handler = LargeFileHandler()
+# Compressão de JSON/texto (brotli ou gzip); PDFs, ZIPs e imagens passam direto
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+
+# Perfilamento restrito a uma rota (/api/admin/profile com route=...)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Rastreamento (TRACING_ENABLED): adicionado por último para medir a requisição inteira
+app.add_middleware(TracingMiddleware)
+
+# Serviços (carregados no primeiro uso, junto com PyPDF2, reportlab, python-pptx, openai...)
+pdf_service = LazyService("services.pdf_service", "PDFService")
+ppt_service = LazyService("services.ppt_service", "PPTService")
+translation_memory = LazyService("services.translation_memory", "TranslationMemory")
+ai_service = LazyService("services.ai_service", "AIService", translation_memory=translation_memory)
+content_generator = LazyService("services.content_generator", "ContentGenerator", ai_service=ai_service)
+large_file_handler = LazyService("services.large_file_handler", "LargeFileHandler")
+vector_index = LazyService("services.vector_index", "VectorIndex", ai_service=ai_service)
+ocr_service = LazyService("services.ocr_service", "OCRService")
+thumbnail_service = LazyService("services.thumbnail_service", "ThumbnailService")
+conversion_service = LazyService("services.conversion_service", "ConversionService")
+batch_exporter = LazyService("services.export_service", "BatchExporter", conversion_service=conversion_service)
+document_store = LazyService("services.document_store", "DocumentStore")
+batch_processor = LazyService("services.batch_processor", "BatchProcessor")
+unit_cache = LazyService("services.unit_cache", "UnitCache")
+document_processor = LazyService("services.document_processor", "DocumentProcessor",
+                                 ai_service=ai_service, unit_cache=unit_cache)
+question_generator = LazyService("services.question_generator", "QuestionGenerator", ai_service=ai_service)
+ai_cache = LazyService("services.ai_cache", "AICache")
+prefetcher = LazyService("services.prefetch", "Prefetcher", ai_service=ai_service, ai_cache=ai_cache)
+
+def preload_caches():
+    """Carregar serviços e caches compartilhados (no master do Gunicorn ou em segundo plano no worker)"""
+    for service in (pdf_service, ppt_service, ai_service, content_generator, large_file_handler, vector_index,
+                    ocr_service):
+        service.load()
+    ppt_service.warm_templates()
 
 # Servir arquivos estáticos
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
+
+INDEX_PAGE_PATH = os.path.join(STATIC_DIR, "index.html")
+# Página inicial em memória: {"mtime", "body", "gzip", "br", "etag"}
+_index_page = {}
+
+async def _load_index_page() -> dict:
+    """Ler (e comprimir) a página inicial só quando o arquivo mudar"""
+    mtime = (await asyncio.to_thread(os.stat, INDEX_PAGE_PATH)).st_mtime
+    if _index_page.get("mtime") != mtime:
+        async with aiofiles.open(INDEX_PAGE_PATH, "rb") as f:
+            body = await f.read()
+        _index_page.update({
+            "mtime": mtime,
+            "body": body,
+            "gzip": await asyncio.to_thread(gzip.compress, body, 9),
+            "br": await asyncio.to_thread(brotli.compress, body) if brotli is not None else None,
+            "etag": f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        })
+    return _index_page
 
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    with open("static/index.html", "r", encoding="utf-8") as f:
-        return f.read()
+async def root(request: Request):
+    page = await _load_index_page()
+    headers = {"ETag": page["etag"], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == page["etag"]:
+        return Response(status_code=304, headers=headers)
+    
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if page["br"] is not None and "br" in accept_encoding:
+        return HTMLResponse(page["br"], headers={**headers, "Content-Encoding": "br"})
+    if "gzip" in accept_encoding:
+        return HTMLResponse(page["gzip"], headers={**headers, "Content-Encoding": "gzip"})
+    return HTMLResponse(page["body"], headers=headers)
+
+# ==================== DOWNLOADS ====================
+
+# Arquivos gerados com nome único (uuid4 + extensão): só esses podem ser baixados de novo por URL
+_OUTPUT_NAME = re.compile(r"[0-9a-f]{32}\.[a-z0-9]+")
+
+def _output_path(extension: str) -> str:
+    """Caminho único em OUTPUT_DIR para o resultado de uma requisição"""
+    return os.path.join(settings.OUTPUT_DIR, f"{uuid.uuid4().hex}{extension}")
+
+def _download_response(path: str, filename: str, media_type: str, headers: Optional[dict] = None) -> FileResponse:
+    """
+    Resposta com arquivo gerado (filename é o nome amigável do download). Para arquivos com nome
+    único em OUTPUT_DIR, Content-Location indica a URL GET do mesmo arquivo, que aceita Range
+    para retomar um download interrompido; o nome aleatório serve de chave de acesso.
+    """
+    headers = dict(headers or {})
+    if os.path.dirname(os.path.abspath(path)) == os.path.abspath(settings.OUTPUT_DIR) \
+            and _OUTPUT_NAME.fullmatch(os.path.basename(path)):
+        headers["Content-Location"] = f"/api/downloads/{quote(os.path.basename(path))}?name={quote(filename)}"
+    return FileResponse(path, filename=filename, media_type=media_type, headers=headers)
+
+@app.get("/api/downloads/{output_id}")
+async def download_output(output_id: str, name: Optional[str] = None):
+    """Baixar um arquivo gerado (suporta Range/If-Range para downloads retomáveis)"""
+    if not _OUTPUT_NAME.fullmatch(output_id):
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    file_path = os.path.join(settings.OUTPUT_DIR, output_id)
+    if not await asyncio.to_thread(os.path.isfile, file_path):
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    return FileResponse(file_path, filename=os.path.basename(name or output_id))
+
+# ==================== ROTAS DOCUMENTOS ====================
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def _save_upload(file: UploadFile, file_path: str, max_size: Optional[int] = None) -> int:
+    """Gravar o arquivo enviado em blocos, sem bloquear o event loop; retorna o tamanho em bytes"""
+    with span("upload.save", attributes={"file.name": file.filename}) as active:
+        size = 0
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    break
+                await buffer.write(chunk)
+        if max_size is not None and size > max_size:
+            await asyncio.to_thread(os.unlink, file_path)
+            raise HTTPException(status_code=413, detail="Arquivo muito grande")
+        active.set_attribute("file.size", size)
+        return size
+
+def _upload_path(directory: str, filename: Optional[str], prefix: str) -> str:
+    """
+    Caminho de gravação de um arquivo enviado: prefixo único + nome sem diretórios,
+    para envios com o mesmo nome (na mesma requisição ou em requisições simultâneas) não se sobrescreverem
+    """
+    return os.path.join(directory, f"{prefix}_{os.path.basename(filename or 'arquivo')}")
+
+async def _resolve_input(file: Optional[UploadFile], document_id: Optional[str]) -> tuple:
+    """
+    Arquivo de entrada de uma operação: documento já armazenado (document_id)
+    ou arquivo enviado na requisição. Retorna (caminho, nome do arquivo, documento ou None).
+    """
+    if document_id:
+        document = await asyncio.to_thread(document_store.get, document_id)
+        if document is None:
+            raise HTTPException(status_code=404, detail="Documento não encontrado")
+        return document["path"], document["filename"], document
+    if file is None:
+        raise HTTPException(status_code=400, detail="Envie um arquivo ou informe document_id")
+    
+    file_path = _upload_path(settings.UPLOAD_DIR, file.filename, uuid.uuid4().hex)
+    await _save_upload(file, file_path)
+    return file_path, file.filename, None
+
+async def _resolve_inputs(files: List[UploadFile], document_ids: str, directory: Optional[str] = None) -> list:
+    """
+    Vários arquivos de entrada: documentos armazenados (IDs separados por vírgula) seguidos dos enviados,
+    gravados em paralelo. Retorna [(caminho, nome do arquivo)] na mesma ordem.
+    """
+    resolved = [await _resolve_input(None, d.strip()) for d in document_ids.split(",") if d.strip()]
+    if directory is None:
+        # Pasta compartilhada entre requisições: prefixo único por arquivo
+        batch_id = uuid.uuid4().hex
+        paths = [_upload_path(settings.UPLOAD_DIR, file.filename, f"{batch_id}_{i}") for i, file in enumerate(files)]
+    else:
+        # Pasta do lote: o prefixo da posição basta para arquivos com o mesmo nome não se sobrescreverem
+        paths = [_upload_path(directory, file.filename, str(i)) for i, file in enumerate(files)]
+    await asyncio.gather(*(_save_upload(file, path) for file, path in zip(files, paths)))
+    resolved += [(path, file.filename, None) for file, path in zip(files, paths)]
+    return [(path, filename) for path, filename, _ in resolved]
+
+async def _parse_cached(document: Optional[dict], key: str, factory):
+    """
+    Reaproveitar o resultado de parse de um documento armazenado (mesmo conteúdo, mesmo resultado).
+    A leitura/parse roda em thread, fora do event loop.
+    """
+    if document is None:
+        return await asyncio.to_thread(factory)
+    return await asyncio.to_thread(document_store.cached, document["hash"], key, factory)
+
+async def _document_units(file_path: str, filename: str) -> tuple:
+    """
+    Texto por página (PDF) ou slide (PPTX): [(número, texto)] e quantas unidades vieram do cache.
+    Páginas/slides sem alteração desde um envio anterior não são extraídos de novo.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".pdf":
+        result = await asyncio.to_thread(pdf_service.extract_pages_incremental, file_path, unit_cache)
+        return list(enumerate(result["pages"], start=1)), result["reused"]
+    if extension == ".pptx":
+        result = await asyncio.to_thread(ppt_service.extract_slides_incremental, file_path, unit_cache)
+        units = [(slide["slide_number"], _presentation_to_text([slide])) for slide in result["slides"]]
+        return units, result["reused"]
+    raise HTTPException(status_code=400, detail="Formato não suportado (use PDF ou PPTX)")
+
+@app.post("/api/documents")
+async def upload_document(file: UploadFile = File(...)):
+    """Armazenar um arquivo uma única vez para usar em várias operações (via document_id)"""
+    try:
+        if file.size is not None and file.size > settings.MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail="Arquivo muito grande")
+        result = await asyncio.to_thread(document_store.save, file.file, file.filename, settings.MAX_FILE_SIZE)
+        return JSONResponse({"success": True, **result})
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/documents")
+async def list_documents(limit: int = 100):
+    """Listar documentos armazenados"""
+    try:
+        documents = await asyncio.to_thread(document_store.list, limit)
+        return JSONResponse({"success": True, "documents": documents})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/documents/{document_id}")
+async def get_document(document_id: str):
+    """Metadados de um documento armazenado"""
+    document = await asyncio.to_thread(document_store.get, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    document.pop("path")
+    return JSONResponse({"success": True, **document})
+
+@app.get("/api/documents/{document_id}/download")
+async def download_document(document_id: str):
+    """Baixar o conteúdo de um documento armazenado"""
+    document = await asyncio.to_thread(document_store.get, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    return FileResponse(document["path"], filename=document["filename"])
+
+@app.delete("/api/documents/{document_id}")
+async def delete_document(document_id: str):
+    """Remover um documento (o conteúdo é apagado quando nenhum outro documento o referencia)"""
+    try:
+        if not await asyncio.to_thread(document_store.delete, document_id):
+            raise HTTPException(status_code=404, detail="Documento não encontrado")
+        return JSONResponse({"success": True})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 # ==================== ROTAS PDF ====================
 
 @app.post("/api/pdf/extract-text")
-async def extract_text_from_pdf(file: UploadFile = File(...)):
-    """Extrair texto de um PDF"""
+async def extract_text_from_pdf(
+    file: Optional[UploadFile] = File(None),
+    document_id: Optional[str] = Form(None),
+    ocr: bool = Form(False),
+    dpi: int = Form(300),
+    incremental: bool = Form(False),
+    prefetch: bool = Form(False)
+):
+    """
+    Extrair texto de um PDF (ocr=true reconhece páginas digitalizadas;
+    incremental=true reaproveita páginas inalteradas de envios anteriores;
+    prefetch=true já começa a resumir e gerar questões em segundo plano)
+    """
     try:
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        if ocr and not settings.OCR_MIN_DPI <= dpi <= settings.OCR_MAX_DPI:
+            raise HTTPException(status_code=400,
+                                detail=f"dpi deve estar entre {settings.OCR_MIN_DPI} e {settings.OCR_MAX_DPI}")
+        file_path, filename, document = await _resolve_input(file, document_id)
         
-        text = pdf_service.extract_text(file_path)
-        return JSONResponse({"success": True, "text": text, "filename": file.filename})
+        if ocr:
+            result = await asyncio.to_thread(ocr_service.extract_text, file_path, dpi)
+            result = {"success": True, "filename": filename, **result}
+        elif incremental:
+            pages = await asyncio.to_thread(pdf_service.extract_pages_incremental, file_path, unit_cache)
+            result = {"success": True, "text": "\n\n".join(pages["pages"]).strip(), "filename": filename,
+                      "num_pages": len(pages["pages"]), "reused_pages": pages["reused"]}
+        else:
+            text = await _parse_cached(document, "pdf_text", lambda: pdf_service.extract_text(file_path))
+            result = {"success": True, "text": text, "filename": filename}
+        
+        if prefetch and result.get("text"):
+            result["prefetch_id"] = await prefetcher.schedule(result["text"])
+        return JSONResponse(result)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/pdf/merge")
-async def merge_pdfs(files: List[UploadFile] = File(...)):
-    """Mesclar múltiplos PDFs"""
+async def merge_pdfs(files: List[UploadFile] = File([]), document_ids: str = Form("")):
+    """Mesclar múltiplos PDFs (documentos armazenados em document_ids, separados por vírgula, vêm primeiro)"""
     try:
-        file_paths = []
-        for file in files:
-            file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            file_paths.append(file_path)
+        file_paths = [path for path, _ in await _resolve_inputs(files, document_ids)]
+        if not file_paths:
+            raise HTTPException(status_code=400, detail="Envie arquivos ou informe document_ids")
         
-        output_path = pdf_service.merge_pdfs(file_paths, settings.OUTPUT_DIR)
-        return FileResponse(output_path, filename="merged.pdf", media_type="application/pdf")
+        output_path = await asyncio.to_thread(pdf_service.merge_pdfs, file_paths, settings.OUTPUT_DIR)
+        return _download_response(output_path, filename="merged.pdf", media_type="application/pdf")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/pdf/split")
-async def split_pdf(file: UploadFile = File(...), pages: str = Form(...)):
+async def split_pdf(
+    file: Optional[UploadFile] = File(None),
+    pages: str = Form(...),
+    document_id: Optional[str] = Form(None)
+):
     """Dividir PDF em páginas específicas"""
     try:
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_path, filename, document = await _resolve_input(file, document_id)
         
         # Converter string de páginas para lista de inteiros
         page_list = [int(p.strip()) for p in pages.split(",")]
         
-        output_path = pdf_service.split_pdf(file_path, page_list, settings.OUTPUT_DIR)
-        return FileResponse(output_path, filename="split.pdf", media_type="application/pdf")
+        output_path = await asyncio.to_thread(pdf_service.split_pdf, file_path, page_list, settings.OUTPUT_DIR)
+        return _download_response(output_path, filename="split.pdf", media_type="application/pdf")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/pdf/add-watermark")
 async def add_watermark_to_pdf(
-    file: UploadFile = File(...),
-    watermark_text: str = Form(...)
+    file: Optional[UploadFile] = File(None),
+    watermark_text: str = Form(...),
+    document_id: Optional[str] = Form(None)
 ):
     """Adicionar marca d'água ao PDF"""
     try:
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_path, filename, document = await _resolve_input(file, document_id)
         
-        output_path = pdf_service.add_watermark(file_path, watermark_text, settings.OUTPUT_DIR)
-        return FileResponse(output_path, filename="watermarked.pdf", media_type="application/pdf")
+        output_path = await asyncio.to_thread(pdf_service.add_watermark, file_path, watermark_text, settings.OUTPUT_DIR)
+        return _download_response(output_path, filename="watermarked.pdf", media_type="application/pdf")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/pdf/thumbnails")
+async def register_pdf_thumbnails(
+    file: Optional[UploadFile] = File(None),
+    document_id: Optional[str] = Form(None),
+    size: str = Form("small"),
+    prefetch: int = Form(10)
+):
+    """Registrar PDF para miniaturas e já renderizar as primeiras páginas em segundo plano"""
+    try:
+        from services.thumbnail_service import THUMBNAIL_SIZES
+        if size not in THUMBNAIL_SIZES:
+            raise HTTPException(status_code=400, detail=f"Tamanho inválido: {size} (use {', '.join(THUMBNAIL_SIZES)})")
+        file_path, filename, document = await _resolve_input(file, document_id)
+        
+        result = await asyncio.to_thread(thumbnail_service.register_document, file_path)
+        if result["num_pages"] == 0:
+            raise HTTPException(status_code=400, detail="PDF sem páginas")
+        if prefetch > 0:
+            # Só agenda as renderizações, mas confere o cache em disco: fora do event loop
+            await asyncio.to_thread(thumbnail_service.get_thumbnail, result["doc_hash"], 1, size)
+            await asyncio.to_thread(thumbnail_service.prefetch, result["doc_hash"], 1, size, prefetch - 1)
+        return JSONResponse({"success": True, "filename": filename, **result})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/pdf/thumbnails/{doc_hash}/{page}")
+async def get_pdf_thumbnail(request: Request, doc_hash: str, page: int, size: str = "medium", prefetch: int = 5):
+    """Miniatura de uma página (com ETag); renderiza as próximas páginas antecipadamente"""
+    try:
+        etag = f'"{doc_hash[:16]}-{page}-{size}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        from services.thumbnail_service import THUMBNAIL_SIZES
+        if size not in THUMBNAIL_SIZES:
+            raise HTTPException(status_code=400, detail=f"Tamanho inválido: {size} (use {', '.join(THUMBNAIL_SIZES)})")
+        # Contagem de páginas (leitura do PDF na primeira vez) fora do event loop
+        try:
+            num_pages = await asyncio.to_thread(thumbnail_service.page_count, doc_hash)
+        except Exception:
+            raise HTTPException(status_code=404, detail="Documento não encontrado")
+        if page < 1 or page > num_pages:
+            raise HTTPException(status_code=404, detail="Página não encontrada")
+        
+        future = await asyncio.to_thread(thumbnail_service.get_thumbnail, doc_hash, page, size)
+        if prefetch > 0:
+            await asyncio.to_thread(thumbnail_service.prefetch, doc_hash, page, size, prefetch)
+        thumbnail_path = await asyncio.wrap_future(future)
+        
+        return FileResponse(thumbnail_path, media_type="image/jpeg", headers={
+            "ETag": etag,
+            # Conteúdo endereçado pelo hash do documento: pode ficar em cache indefinidamente
+            "Cache-Control": "public, max-age=31536000, immutable"
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/pdf/pipeline")
+async def run_pdf_pipeline(
+    steps: str = Form(...),
+    files: List[UploadFile] = File([]),
+    document_ids: str = Form("")
+):
+    """Encadear operações (merge, split, watermark, compress) e retornar só o PDF final"""
+    try:
+        # steps é um JSON string com array de {"op", ...}, ex.:
+        # [{"op": "merge"}, {"op": "watermark", "text": "Rascunho"}, {"op": "compress"}]
+        import json
+        step_list = json.loads(steps)
+        if not isinstance(step_list, list) or not step_list:
+            raise HTTPException(status_code=400, detail="Informe ao menos uma etapa")
+        
+        # Entradas: documentos armazenados primeiro, depois os arquivos enviados
+        file_paths = [path for path, _ in await _resolve_inputs(files, document_ids)]
+        if not file_paths:
+            raise HTTPException(status_code=400, detail="Envie arquivos ou informe document_ids")
+        
+        output_path = _output_path(".pdf")
+        result = await asyncio.to_thread(pdf_service.run_pipeline, file_paths, step_list, output_path)
+        return _download_response(output_path, filename="resultado.pdf", media_type="application/pdf",
+                          headers={"X-Num-Pages": str(result["num_pages"])})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/pdf/batch/{operation}")
+async def process_pdf_batch(
+    operation: str,
+    files: List[UploadFile] = File([]),
+    document_ids: str = Form(""),
+    watermark_text: str = Form(""),
+    output_format: str = Form("ndjson")
+):
+    """
+    Extrair texto, aplicar marca d'água ou comprimir vários PDFs de uma vez (operation: extract, watermark, compress).
+    output_format=ndjson envia uma linha por arquivo concluído; zip envia todos os resultados em um ZIP.
+    """
+    batch_dir = await asyncio.to_thread(batch_processor.new_batch_dir)
+    stream = None
+    try:
+        inputs = await _resolve_inputs(files, document_ids, batch_dir)
+        stream = await batch_processor.process(operation, inputs, batch_dir, output_format,
+                                               {"watermark_text": watermark_text})
+        if output_format == "zip":
+            return StreamingResponse(stream, media_type="application/zip",
+                                     headers={"Content-Disposition": f'attachment; filename="lote_{operation}.zip"'})
+        return StreamingResponse(stream, media_type="application/x-ndjson")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # A pasta do lote é removida pelo gerador ao terminar o envio; se ele não foi criado, remover aqui
+        if stream is None:
+            await asyncio.to_thread(shutil.rmtree, batch_dir, True)
+
 # ==================== ROTAS PPT ====================
 
 @app.post("/api/ppt/create")
 async def create_presentation(
     title: str = Form(...),
-    slides_content: str = Form(...)
+    slides_content: str = Form(...),
+    template: Optional[str] = Form(None)
 ):
     """Criar apresentação PowerPoint"""
     try:
@@ -120,45 +552,192 @@ async def create_presentation(
         import json
         slides = json.loads(slides_content)
         
-        output_path = ppt_service.create_presentation(title, slides, settings.OUTPUT_DIR)
-        return FileResponse(output_path, filename=f"{title}.pptx", 
+        output_path = await asyncio.to_thread(ppt_service.create_presentation, title, slides, settings.OUTPUT_DIR, template)
+        return _download_response(output_path, filename=f"{title}.pptx", 
                           media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/ppt/create-bulk")
+async def create_presentations_bulk(decks: str = Form(...)):
+    """Criar várias apresentações em uma única chamada (retorna ZIP)"""
+    try:
+        # decks é um JSON string com array de {"title", "slides", "template"}
+        import json
+        deck_list = json.loads(decks)
+        if not isinstance(deck_list, list) or not deck_list:
+            raise HTTPException(status_code=400, detail="Informe ao menos uma apresentação")
+        
+        output_path = await asyncio.to_thread(ppt_service.create_presentations_bulk, deck_list, settings.OUTPUT_DIR)
+        return _download_response(output_path, filename="presentations.zip", media_type="application/zip")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/ppt/templates")
+async def list_ppt_templates():
+    """Listar templates de apresentação disponíveis"""
+    templates = await asyncio.to_thread(ppt_service.list_templates)
+    return JSONResponse({"success": True, "templates": templates})
+
 @app.post("/api/ppt/extract-text")
-async def extract_text_from_ppt(file: UploadFile = File(...)):
-    """Extrair texto de um PowerPoint"""
+async def extract_text_from_ppt(
+    file: Optional[UploadFile] = File(None),
+    document_id: Optional[str] = Form(None),
+    fast: bool = Form(False),
+    incremental: bool = Form(False)
+):
+    """
+    Extrair texto de um PowerPoint (fast=true lê o XML direto, com anotações e tabelas;
+    incremental=true faz o mesmo reaproveitando slides inalterados de envios anteriores)
+    """
     try:
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_path, filename, document = await _resolve_input(file, document_id)
         
-        content = ppt_service.extract_text(file_path)
-        return JSONResponse({"success": True, "content": content, "filename": file.filename})
+        if incremental:
+            result = await asyncio.to_thread(ppt_service.extract_slides_incremental, file_path, unit_cache)
+            return JSONResponse({"success": True, "content": result["slides"], "filename": filename,
+                                 "reused_slides": result["reused"]})
+        if fast:
+            content = await _parse_cached(document, "ppt_slides", lambda: ppt_service.extract_text_fast(file_path))
+        else:
+            content = await _parse_cached(document, "ppt_text", lambda: ppt_service.extract_text(file_path))
+        return JSONResponse({"success": True, "content": content, "filename": filename})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ppt/add-slide")
 async def add_slide_to_ppt(
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
     slide_title: str = Form(...),
-    slide_content: str = Form(...)
+    slide_content: str = Form(...),
+    document_id: Optional[str] = Form(None)
 ):
     """Adicionar slide a uma apresentação existente"""
     try:
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_path, filename, document = await _resolve_input(file, document_id)
         
-        output_path = ppt_service.add_slide(file_path, slide_title, slide_content, settings.OUTPUT_DIR)
-        return FileResponse(output_path, filename="updated.pptx",
+        output_path = await asyncio.to_thread(ppt_service.add_slide, file_path, slide_title, slide_content, settings.OUTPUT_DIR)
+        return _download_response(output_path, filename="updated.pptx",
                           media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _deck_path(deck_id: str) -> str:
+    """Caminho de uma apresentação armazenada (valida o ID; a existência é conferida fora do event loop)"""
+    if not re.fullmatch(r"[0-9a-f]{32}", deck_id):
+        raise HTTPException(status_code=400, detail="ID de apresentação inválido")
+    return os.path.join(settings.DECKS_DIR, f"{deck_id}.pptx")
+
+# deck_id -> lock das edições em andamento neste worker (some quando ninguém mais o usa)
+_deck_locks = weakref.WeakValueDictionary()
+
+def _edit_deck(file_path: str, operation_list: list) -> Optional[dict]:
+    """
+    Ler, aplicar as operações e substituir o deck com um lock de arquivo (vale entre workers):
+    edições simultâneas do mesmo deck são aplicadas uma após a outra, nenhuma se perde.
+    Retorna None se o deck não existir.
+    """
+    if not os.path.exists(file_path):
+        return None
+    with open(f"{file_path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if not os.path.exists(file_path):
+            return None
+        # Gravar em arquivo temporário e substituir só se todas as operações funcionarem
+        temp_path = f"{file_path[:-len('.pptx')]}.{uuid.uuid4().hex}.tmp.pptx"
+        try:
+            result = ppt_service.apply_operations(file_path, operation_list, temp_path)
+            os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        return result
+
+@app.post("/api/ppt/decks")
+async def store_deck(file: Optional[UploadFile] = File(None), document_id: Optional[str] = Form(None)):
+    """Armazenar apresentação para edições posteriores em lote"""
+    try:
+        deck_id = uuid.uuid4().hex
+        file_path = os.path.join(settings.DECKS_DIR, f"{deck_id}.pptx")
+        if document_id:
+            # A apresentação é editada no lugar: copiar para não alterar o conteúdo armazenado
+            _, filename, _ = await _resolve_input(None, document_id)
+            await asyncio.to_thread(document_store.copy_to, document_id, file_path)
+        elif file is not None:
+            filename = file.filename
+            await _save_upload(file, file_path)
+        else:
+            raise HTTPException(status_code=400, detail="Envie um arquivo ou informe document_id")
+        
+        info = await asyncio.to_thread(ppt_service.get_presentation_info, file_path)
+        return JSONResponse({"success": True, "deck_id": deck_id, "num_slides": info["num_slides"],
+                             "filename": filename})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/ppt/decks/{deck_id}")
+async def download_deck(deck_id: str):
+    """Baixar a versão atual de uma apresentação armazenada"""
+    file_path = _deck_path(deck_id)
+    if not await asyncio.to_thread(os.path.exists, file_path):
+        raise HTTPException(status_code=404, detail="Apresentação não encontrada")
+    return FileResponse(file_path, filename=f"{deck_id}.pptx",
+                      media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation")
+
+@app.post("/api/ppt/decks/{deck_id}/batch-edit")
+async def batch_edit_deck(deck_id: str, operations: str = Form(...), download: bool = Form(False)):
+    """Aplicar várias operações (add, modify, delete, reorder, replace_text) em uma única leitura/gravação"""
+    try:
+        file_path = _deck_path(deck_id)
+        
+        # operations é um JSON string com array de operações
+        import json
+        operation_list = json.loads(operations)
+        if not isinstance(operation_list, list):
+            raise HTTPException(status_code=400, detail="operations deve ser uma lista JSON")
+        
+        # Um lock por deck neste worker (não ocupa threads esperando o lock de arquivo)
+        lock = _deck_locks.get(deck_id)
+        if lock is None:
+            lock = _deck_locks[deck_id] = asyncio.Lock()
+        async with lock:
+            result = await asyncio.to_thread(_edit_deck, file_path, operation_list)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Apresentação não encontrada")
+        
+        if download:
+            return FileResponse(file_path, filename=f"{deck_id}.pptx",
+                              media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation")
+        return JSONResponse({"success": True, "deck_id": deck_id, **result})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ==================== ROTAS IA ====================
 
+@app.delete("/api/ai/prefetch/{prefetch_id}")
+async def cancel_prefetch(prefetch_id: str):
+    """Cancelar o pré-cálculo iniciado por uma extração de texto (ex.: o usuário mudou de documento)"""
+    # Sem o serviço carregado, nada foi iniciado neste worker: não vale carregá-lo (SQLite) só para isso.
+    # O cancelamento em si mexe nas tarefas do event loop e fica aqui, fora de threads
+    if not prefetcher.loaded:
+        return {"success": True, "cancelled": 0}
+    return {"success": True, "cancelled": prefetcher.cancel(prefetch_id)}
+
+@app.get("/api/ai/models")
+async def ai_models():
+    """Regras de escolha de modelo por operação e latência/custo observados de cada modelo"""
+    return await asyncio.to_thread(lambda: ai_service.router.snapshot())
+
 @app.post("/api/ai/improve-text")
 async def improve_text(text: str = Form(...), context: str = Form("educacional")):
     """Melhorar texto usando IA"""
@@ -168,34 +747,268 @@ async def improve_text(text: str = Form(...), context: str = Form("educacional")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _resolve_ai_text(text: str, index_id: Optional[str], query: str, top_k: int) -> str:
+    """Usar o texto enviado ou, se houver index_id, apenas os trechos relevantes do índice"""
+    if index_id:
+        if not (query or text):
+            raise HTTPException(status_code=400, detail="Informe 'query' para buscar no índice")
+        return await vector_index.retrieve_text(index_id, query or text, top_k)
+    if not text:
+        raise HTTPException(status_code=400, detail="Informe 'text' ou 'index_id'")
+    return text
+
 @app.post("/api/ai/summarize")
-async def summarize_text(text: str = Form(...), max_words: int = Form(200)):
-    """Resumir texto usando IA"""
+async def summarize_text(
+    text: str = Form(""),
+    max_words: int = Form(200),
+    index_id: Optional[str] = Form(None),
+    query: str = Form(""),
+    top_k: int = Form(5),
+    prefetch_id: Optional[str] = Form(None)
+):
+    """
+    Resumir texto usando IA (ou os trechos de um índice relevantes para 'query');
+    prefetch_id (da extração) aproveita o pré-cálculo mesmo se feito em outro worker
+    """
     try:
-        summary = await ai_service.summarize(text, max_words)
+        text = await _resolve_ai_text(text, index_id, query, top_k)
+        summary = await prefetcher.take("summarize", text, prefetch_id=prefetch_id, max_words=max_words)
+        if summary is None:
+            summary = await ai_service.summarize(text, max_words)
         return JSONResponse({"success": True, "summary": summary})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ai/generate-questions")
 async def generate_questions(
-    text: str = Form(...),
+    text: str = Form(""),
     num_questions: int = Form(5),
-    difficulty: str = Form("média")
+    difficulty: str = Form("média"),
+    index_id: Optional[str] = Form(None),
+    query: str = Form(""),
+    top_k: int = Form(5),
+    prefetch_id: Optional[str] = Form(None)
 ):
-    """Gerar questões a partir de um texto"""
+    """
+    Gerar questões a partir de um texto (ou dos trechos de um índice relevantes para 'query');
+    prefetch_id (da extração) aproveita o pré-cálculo mesmo se feito em outro worker
+    """
     try:
-        questions = await ai_service.generate_questions(text, num_questions, difficulty)
+        text = await _resolve_ai_text(text, index_id, query, top_k)
+        questions = await prefetcher.take("generate_questions", text, prefetch_id=prefetch_id,
+                                          num_questions=num_questions, difficulty=difficulty)
+        if questions is None:
+            questions = await ai_service.generate_questions(text, num_questions, difficulty)
         return JSONResponse({"success": True, "questions": questions})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/ai/generate-exam")
+async def generate_exam(
+    file: Optional[UploadFile] = File(None),
+    document_id: Optional[str] = Form(None),
+    text: str = Form(""),
+    num_questions: int = Form(20),
+    difficulty: str = Form("média")
+):
+    """Gerar questões cobrindo um PDF/PowerPoint inteiro (ou texto longo), distribuídas por seção"""
+    try:
+        if file is not None or document_id:
+            file_path, filename, _ = await _resolve_input(file, document_id)
+            units, _ = await _document_units(file_path, filename)
+        elif text.strip():
+            units = [(1, text)]
+        else:
+            raise HTTPException(status_code=400, detail="Envie um arquivo, document_id ou texto")
+        
+        result = await question_generator.generate(units, num_questions, difficulty)
+        return JSONResponse({"success": True, **result})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/ai/process-document")
+async def process_document(
+    file: Optional[UploadFile] = File(None),
+    document_id: Optional[str] = Form(None),
+    operation: str = Form(...),
+    context: str = Form("educacional"),
+    target_language: str = Form("inglês"),
+    target_grade: str = Form("fundamental")
+):
+    """
+    Aplicar improve_text, translate, correct_grammar ou simplify_text a cada página/slide.
+    Ao reenviar o documento editado, só as páginas/slides alterados são reprocessados.
+    """
+    try:
+        file_path, filename, _ = await _resolve_input(file, document_id)
+        units, reused_units = await _document_units(file_path, filename)
+        
+        params = {"context": context, "target_language": target_language, "target_grade": target_grade}
+        result = await document_processor.process(units, operation, params)
+        return JSONResponse({"success": True, "filename": filename, "reused_extraction": reused_units, **result})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ai/translate")
-async def translate_text(text: str = Form(...), target_language: str = Form("inglês")):
-    """Traduzir texto"""
+async def translate_text(text: str = Form(...), target_language: str = Form("inglês"), use_memory: bool = Form(True)):
+    """Traduzir texto (use_memory reaproveita parágrafos já traduzidos antes)"""
+    try:
+        if not use_memory:
+            translation = await ai_service.translate(text, target_language)
+            return JSONResponse({"success": True, "translation": translation})
+        
+        result = await ai_service.translate_with_memory(text, target_language)
+        return JSONResponse({"success": True, **result})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== ROTAS ÍNDICE SEMÂNTICO ====================
+
+def _presentation_to_text(slides: list) -> str:
+    """Converter o resultado da extração de slides em texto corrido"""
+    parts = []
+    for slide in slides:
+        lines = [slide.get("title", "")] + slide.get("content", [])
+        for table in slide.get("tables", []):
+            lines.extend(" | ".join(row) for row in table)
+        if slide.get("notes"):
+            lines.append(slide["notes"])
+        parts.append("\n".join(line for line in lines if line))
+    return "\n\n".join(parts)
+
+@app.post("/api/index/documents")
+async def index_document(
+    file: Optional[UploadFile] = File(None),
+    document_id: Optional[str] = Form(None),
+    text: str = Form(""),
+    name: str = Form("")
+):
+    """Indexar um PDF, PowerPoint ou texto para busca por trechos relevantes"""
+    try:
+        if file is not None or document_id:
+            file_path, filename, document = await _resolve_input(file, document_id)
+            
+            extension = os.path.splitext(filename)[1].lower()
+            if extension == ".pdf":
+                text = await _parse_cached(document, "pdf_text", lambda: pdf_service.extract_text(file_path))
+            elif extension == ".pptx":
+                slides = await _parse_cached(document, "ppt_slides", lambda: ppt_service.extract_text_fast(file_path))
+                text = _presentation_to_text(slides)
+            else:
+                raise HTTPException(status_code=400, detail="Formato não suportado para indexação")
+            name = name or filename
+        
+        if not text.strip():
+            raise HTTPException(status_code=400, detail="Nenhum texto para indexar")
+        
+        result = await vector_index.add_document(text, name)
+        return JSONResponse({"success": True, **result})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/index/{index_id}/search")
+async def search_index(index_id: str, query: str = Form(...), top_k: int = Form(5)):
+    """Buscar os trechos mais relevantes de um documento indexado"""
+    try:
+        results = await vector_index.search(index_id, query, top_k)
+        return JSONResponse({"success": True, "results": results})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/index/{index_id}")
+async def delete_index(index_id: str):
+    """Remover um índice"""
+    try:
+        await asyncio.to_thread(vector_index.delete, index_id)
+        return JSONResponse({"success": True})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== ROTAS CONVERSÃO ====================
+
+_MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "txt": "text/plain; charset=utf-8",
+}
+
+@app.post("/api/convert/file")
+async def convert_file(
+    file: Optional[UploadFile] = File(None),
+    document_id: Optional[str] = Form(None),
+    target: str = Form("pdf")
+):
+    """Converter PPTX (apostila), DOCX ou PDF para pdf, docx ou txt"""
+    try:
+        from services.conversion_service import TARGET_FORMATS
+        if target not in TARGET_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Formato de destino não suportado: {target}")
+        file_path, filename, document = await _resolve_input(file, document_id)
+        
+        output_path = await conversion_service.convert_file(file_path, target)
+        base_name = os.path.splitext(filename)[0]
+        return FileResponse(output_path, filename=f"{base_name}.{target}", media_type=_MEDIA_TYPES[target])
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/convert/content")
+async def convert_content(
+    kind: str = Form(...),
+    content: str = Form(...),
+    target: str = Form("docx"),
+    title: str = Form("")
+):
+    """Converter conteúdo gerado (lesson_plan, exercises, answer_key, outline, text) para docx, pdf ou txt"""
     try:
-        translation = await ai_service.translate(text, target_language)
-        return JSONResponse({"success": True, "translation": translation})
+        # content é o JSON retornado pelas rotas de geração (ou texto, para kind=text)
+        import json
+        data = content if kind == "text" else json.loads(content)
+        
+        output_path = await conversion_service.convert_content(kind, data, target, title)
+        return FileResponse(output_path, filename=f"{title or kind}.{target}", media_type=_MEDIA_TYPES[target])
+    except ValueError as e:
+        # Tipo, formato ou JSON inválido: recusado antes de chegar ao pool de processos
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/export/batch")
+async def export_batch(
+    items: str = Form(...),
+    target: str = Form("docx"),
+    separate_answer_keys: bool = Form(True),
+    template: Optional[str] = Form(None)
+):
+    """Exportar vários planos de aula/listas de exercícios para DOCX ou PDF em um único ZIP"""
+    try:
+        # items é um JSON string com array de {"kind", "title", "data"}
+        import json
+        item_list = json.loads(items)
+        if not isinstance(item_list, list) or not item_list:
+            raise HTTPException(status_code=400, detail="Informe ao menos um item para exportar")
+        
+        stream = await batch_exporter.export_zip(item_list, target, separate_answer_keys, template)
+        return StreamingResponse(stream, media_type="application/zip",
+                                 headers={"Content-Disposition": 'attachment; filename="exportacao.zip"'})
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # JSON ou itens inválidos: recusados antes de qualquer parte do ZIP ser enviada
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -250,48 +1063,156 @@ async def health_check():
     return {
         "status": "healthy",
         "openai_configured": bool(settings.OPENAI_API_KEY),
-        "anthropic_configured": bool(settings.ANTHROPIC_API_KEY)
+        "anthropic_configured": bool(settings.ANTHROPIC_API_KEY),
+        "active_jobs": job_tracker.active,
+        "ai_limits": limiter_snapshots()
     }
 
+_import_ms = round((time.perf_counter() - _import_started) * 1000, 1)
+
+@app.get("/api/startup-profile")
+async def startup_profile():
+    """Tempos de importação do app e de carga de cada serviço"""
+    return {
+        "app_import_ms": _import_ms,
+        "warmup_mode": settings.WARMUP_MODE,
+        "services_ms": LazyService.load_times
+    }
+
+# ==================== ADMINISTRAÇÃO ====================
+
+def _check_admin(request: Request):
+    """Rotas administrativas: exigem ADMIN_TOKEN configurado e enviado em X-Admin-Token"""
+    token = request.headers.get("x-admin-token", "")
+    if not settings.ADMIN_TOKEN or not hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
+
+@app.post("/api/admin/profile")
+async def start_profile(
+    request: Request,
+    duration: float = Form(30),
+    interval_ms: float = Form(10),
+    route: str = Form(""),
+    memory: bool = Form(False),
+    include_idle: bool = Form(False)
+):
+    """
+    Iniciar perfilamento por amostragem no worker que receber o pedido, por 'duration' segundos.
+    route: amostrar só enquanto houver requisições (neste worker) cujo caminho começa com esse prefixo;
+    memory=true inclui os maiores alocadores (tracemalloc) ao fim da janela.
+    A resposta traz o id usado nas demais rotas, que funcionam a partir de qualquer worker.
+    """
+    _check_admin(request)
+    try:
+        return await asyncio.to_thread(profiler.start, duration, interval_ms / 1000, route, memory, include_idle)
+    except Exception as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/admin/profile")
+async def list_profiles(request: Request):
+    """Perfilamentos gravados (de todos os workers), do mais recente para o mais antigo"""
+    _check_admin(request)
+    sessions = await asyncio.to_thread(profiler.list)
+    return {"served_by": os.getpid(), "profiles": sessions}
+
+async def _profile_status(profile_id: str) -> dict:
+    try:
+        status = await asyncio.to_thread(profiler.status, profile_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Perfilamento não encontrado")
+    return status
+
+@app.post("/api/admin/profile/{profile_id}/stop")
+async def stop_profile(request: Request, profile_id: str):
+    """Encerrar o perfilamento antes do prazo (o worker que perfila atende em até meio segundo)"""
+    _check_admin(request)
+    await _profile_status(profile_id)
+    await asyncio.to_thread(profiler.stop, profile_id)
+    return await _profile_status(profile_id)
+
+@app.get("/api/admin/profile/{profile_id}")
+async def get_profile(request: Request, profile_id: str, limit: int = 30):
+    """Estado do perfilamento e resumo do resultado (funções com mais amostras e memória)"""
+    _check_admin(request)
+    status = await _profile_status(profile_id)
+    result = await asyncio.to_thread(profiler.result, profile_id)
+    if result is None:
+        return status
+    summary = {key: value for key, value in result.items() if key != "stacks"}
+    return {**status, "result": {**summary, "top_functions": top_functions(result, limit)}}
+
+@app.get("/api/admin/profile/{profile_id}/flamegraph")
+async def get_profile_flamegraph(request: Request, profile_id: str):
+    """Resultado em pilhas "folded" (flamegraph.pl, speedscope, inferno)"""
+    _check_admin(request)
+    await _profile_status(profile_id)
+    result = await asyncio.to_thread(profiler.result, profile_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Perfilamento ainda não concluído")
+    return PlainTextResponse(folded(result))
+
 # ==================== ROTAS PARA ARQUIVOS GRANDES ====================
 
+async def _resolve_large_input(file: Optional[UploadFile], document_id: Optional[str]) -> tuple:
+    """
+    Arquivo grande de entrada: documento armazenado ou envio gravado em disco em blocos
+    (até LARGE_FILE_MAX_SIZE, sem manter uma cópia do arquivo em memória)
+    """
+    if document_id or file is None:
+        return await _resolve_input(file, document_id)
+    
+    temp_path = os.path.join(settings.TEMP_DIR, f"large_{uuid.uuid4().hex}_{os.path.basename(file.filename or 'arquivo.pdf')}")
+    await _save_upload(file, temp_path, settings.LARGE_FILE_MAX_SIZE)
+    return temp_path, file.filename, None
+
+async def _needs_bounded_mode(file_path: str) -> bool:
+    """PDFs acima de MAX_FILE_SIZE são processados no modo com memória limitada"""
+    return (await asyncio.to_thread(os.path.getsize, file_path)) > settings.MAX_FILE_SIZE
+
 @app.post("/api/pdf/extract-text-large")
-async def extract_text_from_large_pdf(file: UploadFile = File(...)):
-    """Extrair texto de PDF grande (até 25MB)"""
+async def extract_text_from_large_pdf(file: Optional[UploadFile] = File(None), document_id: Optional[str] = Form(None)):
+    """Extrair texto de PDF grande (acima de MAX_FILE_SIZE, com memória limitada)"""
     try:
-        # Verificar tamanho
-        file_content = await file.read()
-        if len(file_content) > settings.MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="Arquivo muito grande")
-        
-        # Salvar arquivo temporário
-        temp_path = await large_file_handler.save_large_file(file_content, file.filename)
-        if not temp_path:
-            raise HTTPException(status_code=500, detail="Erro ao processar arquivo")
+        temp_path, filename, document = await _resolve_large_input(file, document_id)
+        text_path = None
         
         try:
             # Extrair texto
-            text = pdf_service.extract_text(temp_path)
+            if await _needs_bounded_mode(temp_path):
+                # Texto gravado em arquivo; só a primeira parte é lida para a resposta
+                text_path = os.path.join(settings.TEMP_DIR, f"text_{uuid.uuid4().hex}.txt")
+                result = await large_file_handler.extract_text_bounded(temp_path, text_path)
+                async with aiofiles.open(text_path, "r", encoding="utf-8") as f:
+                    text = await f.read(10000)
+                text_length = result["chars"]
+            else:
+                text = await asyncio.to_thread(pdf_service.extract_text, temp_path)
+                text_length = len(text)
             
             # Se o texto for muito longo, dividir em partes
-            if len(text) > 10000:  # 10k caracteres
-                chunks = [text[i:i+10000] for i in range(0, len(text), 10000)]
+            if text_length > 10000:  # 10k caracteres
+                total_chunks = -(-text_length // 10000)
                 return JSONResponse({
                     "success": True, 
                     "text": text[:10000],  # Primeira parte
-                    "total_chunks": len(chunks),
-                    "filename": file.filename,
-                    "message": f"Texto extraído em {len(chunks)} partes. Mostrando primeira parte."
+                    "total_chunks": total_chunks,
+                    "filename": filename,
+                    "message": f"Texto extraído em {total_chunks} partes. Mostrando primeira parte."
                 })
             else:
                 return JSONResponse({
                     "success": True, 
                     "text": text, 
-                    "filename": file.filename
+                    "filename": filename
                 })
         finally:
-            # Limpar arquivo temporário
-            large_file_handler.cleanup_temp_file(temp_path)
+            # Limpar arquivos temporários (o documento armazenado permanece)
+            if text_path is not None:
+                await asyncio.to_thread(large_file_handler.cleanup_temp_file, text_path)
+            if document is None:
+                await asyncio.to_thread(large_file_handler.cleanup_temp_file, temp_path)
             
     except HTTPException:
         raise
@@ -299,45 +1220,46 @@ async def extract_text_from_large_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/pdf/split-large")
-async def split_large_pdf(file: UploadFile = File(...), pages_per_chunk: int = Form(50)):
+async def split_large_pdf(file: Optional[UploadFile] = File(None), pages_per_chunk: int = Form(50), document_id: Optional[str] = Form(None)):
     """Dividir PDF grande em partes menores"""
     try:
-        file_content = await file.read()
-        if len(file_content) > settings.MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="Arquivo muito grande")
-        
-        temp_path = await large_file_handler.save_large_file(file_content, file.filename)
-        if not temp_path:
-            raise HTTPException(status_code=500, detail="Erro ao processar arquivo")
+        temp_path, filename, document = await _resolve_large_input(file, document_id)
         
         try:
             # Dividir PDF
-            chunks = large_file_handler.split_large_pdf(temp_path, pages_per_chunk)
+            if await _needs_bounded_mode(temp_path):
+                chunks = await large_file_handler.split_bounded(temp_path, pages_per_chunk)
+            else:
+                chunks = await asyncio.to_thread(large_file_handler.split_large_pdf, temp_path, pages_per_chunk)
             
             if len(chunks) == 1:
                 return JSONResponse({
                     "success": True,
                     "message": "PDF não precisa ser dividido",
-                    "filename": file.filename
+                    "filename": filename
                 })
             
             # Criar ZIP com todas as partes
             import zipfile
-            zip_path = os.path.join(settings.OUTPUT_DIR, f"split_{file.filename}.zip")
+            zip_path = _output_path(".zip")
             
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, chunk in enumerate(chunks):
-                    zipf.write(chunk, f"parte_{i+1}.pdf")
+            def write_zip():
+                try:
+                    with zipfile.ZipFile(zip_path, 'w') as zipf:
+                        for i, chunk in enumerate(chunks):
+                            zipf.write(chunk, f"parte_{i+1}.pdf")
+                finally:
+                    # Limpar chunks temporários (e a pasta do job)
+                    large_file_handler.cleanup_chunks(chunks)
             
-            # Limpar chunks temporários
-            for chunk in chunks:
-                large_file_handler.cleanup_temp_file(chunk)
+            await asyncio.to_thread(write_zip)
             
-            return FileResponse(zip_path, filename=f"split_{file.filename}.zip", 
+            return _download_response(zip_path, filename=f"split_{filename}.zip", 
                               media_type="application/zip")
             
         finally:
-            large_file_handler.cleanup_temp_file(temp_path)
+            if document is None:
+                await asyncio.to_thread(large_file_handler.cleanup_temp_file, temp_path)
             
     except HTTPException:
         raise
@@ -345,33 +1267,33 @@ async def split_large_pdf(file: UploadFile = File(...), pages_per_chunk: int = F
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/pdf/compress")
-async def compress_pdf(file: UploadFile = File(...)):
+async def compress_pdf(file: Optional[UploadFile] = File(None), document_id: Optional[str] = Form(None)):
     """Comprimir PDF para reduzir tamanho"""
     try:
-        file_content = await file.read()
-        if len(file_content) > settings.MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="Arquivo muito grande")
-        
-        temp_path = await large_file_handler.save_large_file(file_content, file.filename)
-        if not temp_path:
-            raise HTTPException(status_code=500, detail="Erro ao processar arquivo")
+        temp_path, filename, document = await _resolve_large_input(file, document_id)
         
         try:
             # Comprimir PDF
-            compressed_path = large_file_handler.compress_pdf(temp_path)
+            output_path = _output_path(".pdf")
+            if await _needs_bounded_mode(temp_path):
+                await large_file_handler.compress_bounded(temp_path, output_path)
+                compressed_path = output_path
+            else:
+                compressed_path = await asyncio.to_thread(large_file_handler.compress_pdf, temp_path)
             
             if compressed_path:
                 # Mover para diretório de output
-                output_path = os.path.join(settings.OUTPUT_DIR, f"compressed_{file.filename}")
-                shutil.move(compressed_path, output_path)
+                if compressed_path != output_path:
+                    await asyncio.to_thread(shutil.move, compressed_path, output_path)
                 
-                return FileResponse(output_path, filename=f"compressed_{file.filename}", 
+                return _download_response(output_path, filename=f"compressed_{filename}", 
                                   media_type="application/pdf")
             else:
                 raise HTTPException(status_code=500, detail="Erro ao comprimir PDF")
                 
         finally:
-            large_file_handler.cleanup_temp_file(temp_path)
+            if document is None:
+                await asyncio.to_thread(large_file_handler.cleanup_temp_file, temp_path)
             
     except HTTPException:
         raise
@@ -383,10 +1305,10 @@ async def get_file_info(filename: str):
     """Obter informações sobre um arquivo"""
     try:
         file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        if not os.path.exists(file_path):
+        if not await asyncio.to_thread(os.path.exists, file_path):
             raise HTTPException(status_code=404, detail="Arquivo não encontrado")
         
-        info = large_file_handler.get_file_info(file_path)
+        info = await asyncio.to_thread(large_file_handler.get_file_info, file_path)
         return JSONResponse({"success": True, "info": info})
         
     except HTTPException:
@@ -397,17 +1319,21 @@ async def get_file_info(filename: str):
 @app.delete("/api/cleanup")
 async def cleanup_files():
     """Limpar arquivos temporários"""
-    try:
+    def remove_files():
         for directory in [settings.UPLOAD_DIR, settings.OUTPUT_DIR, settings.TEMP_DIR]:
             for filename in os.listdir(directory):
                 file_path = os.path.join(directory, filename)
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
+    
+    try:
+        await asyncio.to_thread(remove_files)
         return JSONResponse({"success": True, "message": "Arquivos temporários removidos"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.environ.get("PORT", settings.PORT))
     uvicorn.run("app:app", host="0.0.0.0", port=port, reload=settings.DEBUG)
 
@@ -0,0 +1,144 @@
+"""
+Configurações base (Settings), compartilhadas por config.py e config_production.py.
+Fica em módulo próprio para que os dois possam importá-la sem depender da ordem de importação.
+"""
+import os
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class Settings:
+    # API Keys
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+    ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
+    
+    # Server - Adaptado para hospedagem
+    HOST = os.getenv("HOST", "0.0.0.0")
+    PORT = int(os.getenv("PORT", 8000))
+    DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+    # Tempo para concluir tarefas em segundo plano no encerramento (menor que o graceful_timeout do Gunicorn)
+    DRAIN_TIMEOUT = int(os.getenv("DRAIN_TIMEOUT", 50))
+    # Carga dos serviços: "background" (após o worker responder), "fork" (no master do Gunicorn) ou "off"
+    WARMUP_MODE = os.getenv("WARMUP_MODE", "background").lower()
+    WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", 1.0))
+    # Rastreamento (spans no formato OTLP/JSON gravados em TRACE_PATH); TRACE_SAMPLE_RATE = fração de requisições
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "False").lower() == "true"
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+    # Rotas /api/admin/* (perfilamento): exigem o cabeçalho X-Admin-Token; desativadas se vazio
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    PROFILE_MAX_DURATION = int(os.getenv("PROFILE_MAX_DURATION", 300))
+    PROFILE_MEMORY_FRAMES = int(os.getenv("PROFILE_MEMORY_FRAMES", 1))
+    PROFILE_MEMORY_TOP = int(os.getenv("PROFILE_MEMORY_TOP", 25))
+    # Respostas de texto/JSON menores que isso (bytes) não são comprimidas
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1000))
+    
+    # Diretórios - Usar /tmp para hospedagem compartilhada
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+    OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+    TEMP_DIR = os.path.join(BASE_DIR, "temp")
+    DECKS_DIR = os.path.join(BASE_DIR, "decks")
+    INDEX_DIR = os.path.join(BASE_DIR, "indexes")
+    CACHE_DIR = os.path.join(BASE_DIR, "cache")
+    OCR_CACHE_DIR = os.path.join(CACHE_DIR, "ocr")
+    THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, "thumbnails")
+    CONVERSION_CACHE_DIR = os.path.join(CACHE_DIR, "conversions")
+    TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(BASE_DIR, "traces", "spans.jsonl"))
+    STORE_DIR = os.getenv("STORE_DIR", os.path.join(BASE_DIR, "store"))
+    TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", os.path.join(BASE_DIR, "templates"))
+    
+    # Limites para hospedagem compartilhada
+    MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB (aumentado para PDFs grandes)
+    # Rotas de PDFs grandes: acima de MAX_FILE_SIZE usam o modo com memória limitada
+    # (arquivo mapeado, páginas em janelas, processo separado com orçamento de RSS)
+    LARGE_FILE_MAX_SIZE = int(os.getenv("LARGE_FILE_MAX_SIZE", 500 * 1024 * 1024))
+    LARGE_FILE_RSS_BUDGET = int(os.getenv("LARGE_FILE_RSS_BUDGET_MB", 256)) * 1024 * 1024
+    LARGE_FILE_PAGE_WINDOW = int(os.getenv("LARGE_FILE_PAGE_WINDOW", 16))
+    LARGE_FILE_WORKERS = int(os.getenv("LARGE_FILE_WORKERS", 1))
+    ALLOWED_EXTENSIONS = {
+        'pdf': ['.pdf'],
+        'presentation': ['.pptx', '.ppt'],
+        'document': ['.docx', '.doc'],
+        'image': ['.jpg', '.jpeg', '.png', '.gif']
+    }
+    
+    # OCR de PDFs digitalizados
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+    OCR_LANG = os.getenv("OCR_LANG", "por")
+    # Faixa de DPI aceita (acima disso as imagens rasterizadas ficam enormes)
+    OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", 72))
+    OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", 400))
+    
+    # Miniaturas de páginas
+    THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", 2))
+    
+    # Conversão de documentos
+    CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", 2))
+    
+    # Processamento de PDFs em lote
+    BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 1))
+    BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 100))
+    
+    # Orçamento de tokens por chamada de IA
+    MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", 12000))
+    MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", 4000))
+    DEFAULT_OUTPUT_TOKENS = 2000
+    # Chamadas de IA simultâneas na geração de questões sobre documentos inteiros
+    QUESTION_CONCURRENCY = int(os.getenv("QUESTION_CONCURRENCY", 4))
+    # Memória de tradução (segmentos já traduzidos) e lotes de tradução simultâneos
+    TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", os.path.join(CACHE_DIR, "translation_memory.db"))
+    TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", 4))
+    # Resultados por página/slide (reprocessamento incremental de documentos editados)
+    UNIT_CACHE_PATH = os.getenv("UNIT_CACHE_PATH", os.path.join(CACHE_DIR, "units.db"))
+    UNIT_CONCURRENCY = int(os.getenv("UNIT_CONCURRENCY", 4))
+    # Limite adaptativo de chamadas simultâneas por provedor/modelo de IA (começa em INITIAL, até MAX).
+    # O limite vale por worker: com N workers do Gunicorn, o total no provedor pode chegar a N vezes esse valor
+    AI_CONCURRENCY_INITIAL = int(os.getenv("AI_CONCURRENCY_INITIAL", 4))
+    AI_CONCURRENCY_MAX = int(os.getenv("AI_CONCURRENCY_MAX", 32))
+    # Novas tentativas para 429/5xx e espera base do backoff (segundos)
+    AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", 3))
+    AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", 0.5))
+    
+    # Modelos por perfil de tarefa: {perfil: {provedor: [modelos]}} ("fast" = mais rápido, "standard" = mais
+    # barato, "strong" = ordem configurada). AI_MODEL_TIERS (JSON) substitui perfis inteiros.
+    # Atenção: a ordem deixou de ser sempre OpenAI primeiro. Em "fast", modelos ainda sem latência medida
+    # vêm antes (para serem medidos) e depois o mais rápido; em "standard", o de menor custo estimado.
+    # Só "strong" segue a ordem dos provedores (OpenAI, depois Anthropic).
+    AI_MODEL_TIERS = {
+        "fast": {"openai": ["gpt-4o-mini"], "anthropic": ["claude-3-haiku-20240307"]},
+        "standard": {"openai": ["gpt-4o-mini"], "anthropic": ["claude-3-5-sonnet-20241022"]},
+        "strong": {"openai": ["gpt-4o"], "anthropic": ["claude-3-5-sonnet-20241022"]},
+        **json.loads(os.getenv("AI_MODEL_TIERS") or "{}")
+    }
+    # Operação -> perfil (AI_ROUTES em JSON acrescenta/substitui regras)
+    AI_ROUTES = {
+        "default": "standard",
+        "correct_grammar": "fast",
+        "translate": "fast",
+        "simplify_text": "fast",
+        "summarize": "fast",
+        "improve_text": "standard",
+        "generate_questions": "standard",
+        "generate_exercises": "standard",
+        "generate_presentation_outline": "standard",
+        "generate_lesson_plan": "strong",
+        "generate_study_guide": "strong",
+        **json.loads(os.getenv("AI_ROUTES") or "{}")
+    }
+    # Pré-cálculo de resumo/questões após extrair texto: resultados no cache de IA por PREFETCH_TTL segundos
+    AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(CACHE_DIR, "ai_cache.db"))
+    PREFETCH_TTL = int(os.getenv("PREFETCH_TTL", 900))
+    PREFETCH_MAX_TASKS = int(os.getenv("PREFETCH_MAX_TASKS", 4))
+    # Pedido que chega (em qualquer worker) com o pré-cálculo em andamento espera até PREFETCH_WAIT segundos,
+    # consultando o cache a cada PREFETCH_POLL_INTERVAL; a marca "em andamento" expira nesse mesmo prazo
+    PREFETCH_WAIT = float(os.getenv("PREFETCH_WAIT", 60))
+    PREFETCH_POLL_INTERVAL = float(os.getenv("PREFETCH_POLL_INTERVAL", 0.5))
+    # Preço por milhão de tokens (entrada, saída), em dólares
+    AI_MODEL_PRICES = {
+        "gpt-4o-mini": (0.15, 0.60),
+        "gpt-4o": (2.50, 10.00),
+        "gpt-3.5-turbo": (0.50, 1.50),
+        "claude-3-haiku-20240307": (0.25, 1.25),
+        "claude-3-5-sonnet-20241022": (3.00, 15.00),
+    }
@@ -0,0 +1,63 @@
+"""
+Configuração do Gunicorn para produção (vários workers Uvicorn)
+
+Uso: gunicorn app:app -c gunicorn.conf.py
+"""
+import os
+
+# Configurações de produção (config_production.py) nos workers
+os.environ.setdefault("APP_ENV", "production")
+
+
+def _available_cpus() -> int:
+    """CPUs realmente disponíveis para o container (afinidade e cota do cgroup)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" ou "<cota> <período>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Um worker por CPU (WEB_CONCURRENCY sobrescreve)
+workers = int(os.getenv("WEB_CONCURRENCY", 0)) or _available_cpus()
+
+# Carregar a aplicação (e caches compartilhados) no master antes do fork
+preload_app = True
+
+# Reciclar workers após um número de requisições para limitar o crescimento de memória
+max_requests = int(os.getenv("MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 100))
+
+# Encerramento gracioso: tempo para concluir requisições e tarefas em andamento
+timeout = int(os.getenv("REQUEST_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 60))
+keepalive = 5
+
+# Heartbeat em memória (evita travamentos com /tmp em disco lento)
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    """Com WARMUP_MODE=fork, pré-carregar caches no master para que os workers os herdem (copy-on-write)"""
+    from config import settings
+    if settings.WARMUP_MODE != "fork":
+        return
+    from app import preload_caches
+    preload_caches()
+    server.log.info("Caches pré-carregados; iniciando %s workers", workers)
@@ -0,0 +1,97 @@
+"""
+Cache de resultados de IA calculados antecipadamente (prefetch), em SQLite para ser
+compartilhado entre os workers. Cada resultado é entregue uma única vez e expira após o TTL.
+Cálculos em andamento também ficam registrados, para que qualquer worker saiba que deve esperar.
+"""
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Optional
+
+from config import settings
+from services.tracing import traced, current_span
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ai_pending (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class AICache:
+    def __init__(self, db_path: Optional[str] = None, ttl: Optional[int] = None, pending_ttl: Optional[float] = None):
+        self.db_path = db_path or settings.AI_CACHE_PATH
+        self.ttl = ttl or settings.PREFETCH_TTL
+        # Validade da marca "em andamento" (worker que caiu no meio não deixa ninguém esperando para sempre)
+        self.pending_ttl = pending_ttl or settings.PREFETCH_WAIT
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Nova conexão por operação (seguro entre threads e workers), em uma transação"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def claim(self, keys: list) -> list:
+        """Marcar as chaves como em andamento; retorna as que não estavam (as que este worker vai calcular)"""
+        now = time.time()
+        claimed = []
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ai_pending WHERE expires_at < ?", (now,))
+            for key in keys:
+                cursor = conn.execute("INSERT OR IGNORE INTO ai_pending (key, expires_at) VALUES (?, ?)",
+                                      (key, now + self.pending_ttl))
+                if cursor.rowcount:
+                    claimed.append(key)
+        return claimed
+
+    def release(self, key: str):
+        """Retirar a marca de em andamento (cálculo cancelado ou com falha)"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ai_pending WHERE key = ?", (key,))
+
+    def pending(self, key: str) -> bool:
+        """Algum worker está calculando este resultado agora?"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM ai_pending WHERE key = ? AND expires_at >= ?",
+                               (key, time.time())).fetchone()
+        return row is not None
+
+    def put(self, key: str, value):
+        """Guardar um resultado (serializável em JSON), retirar a marca de em andamento e remover os expirados"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ai_results WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl)
+            )
+            conn.execute("DELETE FROM ai_pending WHERE key = ?", (key,))
+
+    @traced("cache.ai")
+    def take(self, key: str):
+        """Retirar o resultado guardado (None se não houver ou se expirou)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM ai_results WHERE key = ?", (key,)).fetchone()
+            current_span().set_attribute("cache.hit", row is not None)
+            if row is None:
+                return None
+            conn.execute("DELETE FROM ai_results WHERE key = ?", (key,))
+        value, expires_at = row
+        return json.loads(value) if expires_at >= time.time() else None
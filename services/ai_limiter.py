@@ -0,0 +1,241 @@
+"""
+Controle adaptativo de chamadas simultâneas às APIs de IA (AIMD por provedor/modelo),
+com fila por prioridade e novas tentativas com espera aleatória
+"""
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+from config import settings
+from services.tracing import current_span
+
+# Prioridades (menor = atendida antes): pedidos do usuário passam na frente de trabalhos em lote
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+PRIORITY_BACKGROUND = 20
+
+_priority = contextvars.ContextVar("ai_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def ai_priority(level: int):
+    """Definir a prioridade das chamadas de IA feitas dentro do bloco (e das tarefas criadas nele)"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Espera antes da próxima tentativa: retry-after do provedor ou backoff exponencial com jitter total"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, settings.AI_RETRY_BASE_DELAY)
+    return random.uniform(0, settings.AI_RETRY_BASE_DELAY * (2 ** attempt))
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """Código HTTP de um erro dos SDKs (None se não houver, ex.: falha de conexão)"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def error_retry_after(error: Exception) -> Optional[float]:
+    """Valor do cabeçalho retry-after (em segundos), se o provedor informou"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# Classes de erro de conexão/timeout dos SDKs (openai, anthropic) e do httpx, comparadas pelo nome
+# para não importar os SDKs aqui
+_TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "TimeoutException", "TransportError"}
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Só falhas passageiras valem nova tentativa: limite de taxa (429), timeout (408), erro do servidor (5xx)
+    e falhas de conexão/timeout. Erros de programação ou de validação (TypeError, KeyError...) não.
+    """
+    status = error_status(error)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class AdaptiveLimiter:
+    """
+    Limite de chamadas simultâneas AIMD: cresce aos poucos enquanto as chamadas vão bem,
+    cai pela metade com 429 e recua um pouco quando a latência dispara.
+    """
+
+    def __init__(self, name: str, initial: Optional[int] = None, minimum: int = 1, maximum: Optional[int] = None):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum or settings.AI_CONCURRENCY_MAX
+        self.limit = float(initial or settings.AI_CONCURRENCY_INITIAL)
+        self.in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        # Latência de referência (média móvel lenta) e a recente (rápida)
+        self._baseline_latency = None
+        self._recent_latency = None
+        self._last_decrease = 0.0
+        self.stats = {"calls": 0, "rate_limited": 0, "errors": 0}
+
+    def _can_start(self) -> bool:
+        return self.in_flight < max(self.minimum, int(self.limit))
+
+    async def acquire(self, priority: Optional[int] = None):
+        """Aguardar uma vaga (na ordem de prioridade) e respeitar pausas pedidas pelo provedor"""
+        priority = current_priority() if priority is None else priority
+        if self._can_start() and not self._waiters:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # A vaga chegou junto com o cancelamento: devolver
+                    self.in_flight -= 1
+                    self._wake()
+                raise
+
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.in_flight -= 1
+                self._wake()
+                raise
+
+    def _wake(self):
+        """Liberar as próximas chamadas da fila enquanto houver vagas"""
+        while self._waiters and self._can_start():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def release(self, latency: float, rate_limited: bool = False, retry_after: Optional[float] = None,
+                failed: bool = False, ignored: bool = False):
+        """
+        Devolver a vaga e ajustar o limite conforme o resultado da chamada.
+        ignored: a falha não diz nada sobre o provedor (ex.: erro de programação), só devolve a vaga.
+        """
+        self.in_flight -= 1
+        self.stats["calls"] += 1
+        now = time.monotonic()
+
+        if ignored:
+            pass
+        elif rate_limited:
+            self.stats["rate_limited"] += 1
+            # Uma redução por "janela" (várias 429 simultâneas contam como um único sinal)
+            if now - self._last_decrease > (self._recent_latency or 1.0):
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+        elif failed:
+            self.stats["errors"] += 1
+        else:
+            self._recent_latency = latency if self._recent_latency is None else 0.7 * self._recent_latency + 0.3 * latency
+            self._baseline_latency = latency if self._baseline_latency is None else \
+                0.95 * self._baseline_latency + 0.05 * min(latency, 2 * self._baseline_latency)
+            if self._recent_latency > 2 * self._baseline_latency and now - self._last_decrease > self._recent_latency:
+                # Latência subindo: o provedor está enfileirando, recuar antes das 429
+                self.limit = max(self.minimum, self.limit * 0.9)
+                self._last_decrease = now
+            else:
+                # Aumento aditivo: cerca de +1 a cada "limit" chamadas bem-sucedidas
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def busy(self) -> bool:
+        """Sem vaga livre agora (limite atingido, fila ou pausa pedida pelo provedor)"""
+        return not self._can_start() or any(not future.done() for _, _, future in self._waiters) \
+            or self._paused_until > time.monotonic()
+
+    def snapshot(self) -> dict:
+        """Estado atual (para monitoramento)"""
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": sum(1 for _, _, future in self._waiters if not future.done()),
+            "latency": round(self._recent_latency, 3) if self._recent_latency is not None else None,
+            **self.stats
+        }
+
+
+_limiters = {}
+
+
+def get_limiter(provider: str, model: str) -> AdaptiveLimiter:
+    """Limitador de um provedor/modelo (criado no primeiro uso)"""
+    key = f"{provider}:{model}"
+    if key not in _limiters:
+        _limiters[key] = AdaptiveLimiter(key)
+    return _limiters[key]
+
+
+def has_idle_capacity() -> bool:
+    """Nenhum provedor/modelo está no limite, com fila ou pausado (espaço para trabalho especulativo)"""
+    return not any(limiter.busy() for limiter in _limiters.values())
+
+
+def limiter_snapshots() -> dict:
+    return {key: limiter.snapshot() for key, limiter in _limiters.items()}
+
+
+async def call_with_limits(provider: str, model: str, request):
+    """
+    Executar request() (coroutine factory) sob o limitador do provedor/modelo,
+    com novas tentativas para 429, erros 5xx e falhas de conexão.
+    """
+    limiter = get_limiter(provider, model)
+    queued = 0.0
+    for attempt in range(settings.AI_MAX_RETRIES + 1):
+        waiting = time.monotonic()
+        await limiter.acquire()
+        started = time.monotonic()
+        queued += started - waiting
+        current_span().set_attributes({"ai.attempts": attempt + 1, "ai.queue_ms": round(queued * 1000, 1)})
+        try:
+            result = await request()
+        except asyncio.CancelledError:
+            limiter.release(time.monotonic() - started, failed=True)
+            raise
+        except Exception as e:
+            status = error_status(e)
+            retry_after = error_retry_after(e)
+            retryable = is_retryable(e)
+            limiter.release(time.monotonic() - started, rate_limited=status == 429, retry_after=retry_after,
+                            failed=status != 429, ignored=not retryable and status is None)
+            if not retryable or attempt == settings.AI_MAX_RETRIES:
+                raise
+            await asyncio.sleep(retry_delay(attempt, retry_after))
+            continue
+        limiter.release(time.monotonic() - started)
+        return result
@@ -1,69 +1,170 @@
 import os
+import re
+import time
+import json
+import asyncio
 from typing import Optional
 from config import settings
+from services.ai_limiter import call_with_limits
+from services.model_router import ModelRouter
+from services.tracing import span, traced
+from services.token_budget import (
+    count_tokens, input_budget, output_budget, sample_to_budget, split_to_budget
+)
+
+# Tokens reservados para o texto fixo dos templates de prompt
+PROMPT_TEMPLATE_TOKENS = 250
+
+# Segmentos da memória de tradução: parágrafos separados por linha em branco
+_PARAGRAPH_SEPARATOR_RE = re.compile(r"(\n\s*\n)")
+# Máximo de segmentos por chamada de tradução em lote
+TRANSLATION_BATCH_SEGMENTS = 40
 
 class AIService:
-    def __init__(self):
+    def __init__(self, translation_memory=None, router: Optional[ModelRouter] = None):
         self.openai_client = None
         self.anthropic_client = None
+        # Escolha do modelo por operação (regras + latência/custo observados)
+        self.router = router or ModelRouter()
+        # Memória de tradução (opcional): segmentos repetidos não voltam para a IA
+        self.translation_memory = translation_memory
         
         # Inicializar clientes se as chaves estiverem configuradas
         if settings.OPENAI_API_KEY:
             try:
                 from openai import AsyncOpenAI
-                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
             except:
                 pass
         
         if settings.ANTHROPIC_API_KEY:
             try:
                 from anthropic import AsyncAnthropic
-                self.anthropic_client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
+                self.anthropic_client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY, max_retries=0)
             except:
                 pass
     
-    async def _call_ai(self, prompt: str, system_prompt: str = "") -> str:
-        """Chamar API de IA (prioriza OpenAI, depois Anthropic)"""
+    def _providers(self) -> list:
+        """Provedores configurados, na ordem de preferência"""
+        return [name for name, client in (("openai", self.openai_client), ("anthropic", self.anthropic_client))
+                if client]
+    
+    async def _call_ai(self, prompt: str, system_prompt: str = "", max_tokens: int = 2000,
+                       operation: str = "default") -> str:
+        """
+        Chamar API de IA com o modelo escolhido para a operação; se falhar, tentar os próximos candidatos.
+        Cada provedor/modelo tem limite adaptativo de chamadas simultâneas e novas tentativas
+        para 429/5xx antes de passar para o próximo.
+        """
+        providers = self._providers()
+        if not providers:
+            raise Exception("Nenhuma API de IA configurada. Configure OPENAI_API_KEY ou ANTHROPIC_API_KEY no arquivo .env")
         
-        # Tentar OpenAI primeiro
-        if self.openai_client:
+        errors = []
+        for provider, model in self.router.candidates(operation, providers):
+            call = self._call_openai if provider == "openai" else self._call_anthropic
+            attributes = {"gen_ai.system": provider, "gen_ai.request.model": model, "gen_ai.operation.name": operation,
+                          "gen_ai.request.max_tokens": max_tokens}
+            started = time.monotonic()
             try:
-                messages = []
-                if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                messages.append({"role": "user", "content": prompt})
-                
-                response = await self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=2000
-                )
-                return response.choices[0].message.content
+                with span(f"chat {model}", "client", attributes) as active:
+                    text, input_tokens, output_tokens = await call(model, prompt, system_prompt, max_tokens)
+                    active.set_attributes({"gen_ai.usage.input_tokens": input_tokens,
+                                           "gen_ai.usage.output_tokens": output_tokens})
             except Exception as e:
-                print(f"Erro ao chamar OpenAI: {e}")
+                self.router.record(provider, model, time.monotonic() - started, failed=True)
+                errors.append(f"{provider}/{model}: {e}")
+                continue
+            self.router.record(provider, model, time.monotonic() - started, input_tokens, output_tokens)
+            return text
         
-        # Tentar Anthropic se OpenAI falhar ou não estiver configurado
-        if self.anthropic_client:
-            try:
-                full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
-                
-                response = await self.anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=2000,
-                    temperature=0.7,
-                    messages=[{"role": "user", "content": full_prompt}]
-                )
-                return response.content[0].text
-            except Exception as e:
-                print(f"Erro ao chamar Anthropic: {e}")
+        if not errors:
+            raise Exception(f"Nenhum modelo configurado para a operação {operation}")
+        raise Exception(f"Erro ao chamar APIs de IA: {'; '.join(errors)}")
+    
+    async def _call_openai(self, model: str, prompt: str, system_prompt: str, max_tokens: int) -> tuple:
+        """Chamada à OpenAI: (texto, tokens de entrada, tokens de saída)"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        response = await call_with_limits("openai", model, lambda: self.openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens
+        ))
+        usage = response.usage
+        return (response.choices[0].message.content,
+                usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0)
+    
+    async def _call_anthropic(self, model: str, prompt: str, system_prompt: str, max_tokens: int) -> tuple:
+        """Chamada à Anthropic: (texto, tokens de entrada, tokens de saída)"""
+        full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+        
+        response = await call_with_limits("anthropic", model, lambda: self.anthropic_client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            messages=[{"role": "user", "content": full_prompt}]
+        ))
+        usage = response.usage
+        return (response.content[0].text,
+                usage.input_tokens if usage else 0, usage.output_tokens if usage else 0)
+    
+    async def embed(self, texts: list, model: str = "text-embedding-3-small") -> list:
+        """Gerar embeddings para uma lista de textos (OpenAI), sob o mesmo limite adaptativo das demais chamadas"""
+        if not self.openai_client:
+            raise Exception("Embeddings requerem OPENAI_API_KEY configurada")
         
-        raise Exception("Nenhuma API de IA configurada. Configure OPENAI_API_KEY ou ANTHROPIC_API_KEY no arquivo .env")
+        with span(f"embeddings {model}", "client", {"gen_ai.system": "openai", "gen_ai.request.model": model,
+                                                     "gen_ai.operation.name": "embeddings"}):
+            response = await call_with_limits("openai", model, lambda: self.openai_client.embeddings.create(
+                model=model, input=texts
+            ))
+        return [item.embedding for item in response.data]
     
+    def _text_budget(self, max_output_tokens: int, system_prompt: str, operation: str = "default") -> int:
+        """
+        Tokens disponíveis para o texto do usuário dentro do prompt. Vale a menor janela entre os
+        modelos que podem atender a operação, para o prompt caber também nos modelos de reserva.
+        """
+        models = [model for _, model in self.router.candidates(operation, self._providers())]
+        budget = min((input_budget(max_output_tokens, model) for model in models),
+                     default=input_budget(max_output_tokens))
+        return budget - count_tokens(system_prompt) - PROMPT_TEMPLATE_TOKENS
+    
+    async def _rewrite_in_parts(self, text: str, build_prompt, system_prompt: str, operation: str) -> str:
+        """
+        Executar operações cuja saída acompanha o tamanho da entrada
+        (melhorar, traduzir, corrigir, simplificar). Textos que não cabem
+        em uma chamada são processados em partes concorrentes.
+        """
+        max_output = settings.MAX_OUTPUT_TOKENS
+        part_tokens = min(self._text_budget(max_output, system_prompt, operation), int((max_output - 100) / 1.3))
+        parts = split_to_budget(text, part_tokens)
+        
+        async def run(part: str) -> str:
+            max_tokens = output_budget(operation, count_tokens(part))
+            return await self._call_ai(build_prompt(part), system_prompt, max_tokens, operation)
+        
+        if len(parts) == 1:
+            return await run(parts[0])
+        results = await asyncio.gather(*(run(part) for part in parts))
+        return "\n\n".join(result.strip() for result in results)
+    
+    @traced()
     async def improve_text(self, text: str, context: str = "educacional") -> str:
         """Melhorar texto usando IA"""
         system_prompt = "Você é um assistente pedagógico especializado em melhorar textos educacionais."
-        prompt = f"""
+        return await self._rewrite_in_parts(
+            text, lambda part: self._improve_prompt(part, context), system_prompt, "improve_text"
+        )
+    
+    def _improve_prompt(self, text: str, context: str) -> str:
+        """Prompt de melhoria de texto"""
+        return f"""
 Melhore o seguinte texto no contexto {context}:
 
 {text}
@@ -76,11 +177,22 @@ Faça melhorias em:
 
 Retorne apenas o texto melhorado, sem explicações adicionais.
 """
-        return await self._call_ai(prompt, system_prompt)
     
+    @traced()
     async def summarize(self, text: str, max_words: int = 200) -> str:
         """Resumir texto usando IA"""
         system_prompt = "Você é um especialista em criar resumos concisos e informativos de textos educacionais."
+        max_tokens = output_budget("summarize", max_words=max_words)
+        budget = self._text_budget(max_tokens, system_prompt, "summarize")
+        
+        if count_tokens(text) > budget:
+            # Texto grande demais: resumir cada parte e depois resumir os resumos
+            parts = split_to_budget(text, budget)
+            part_words = max(80, (max_words * 2) // len(parts))
+            partials = await asyncio.gather(*(self.summarize(part, part_words) for part in parts))
+            text = "\n\n".join(partial.strip() for partial in partials)
+            text = sample_to_budget(text, budget)
+        
         prompt = f"""
 Crie um resumo do seguinte texto com no máximo {max_words} palavras:
 
@@ -94,11 +206,15 @@ O resumo deve:
 
 Retorne apenas o resumo, sem introduções ou conclusões adicionais.
 """
-        return await self._call_ai(prompt, system_prompt)
+        return await self._call_ai(prompt, system_prompt, max_tokens, "summarize")
     
+    @traced()
     async def generate_questions(self, text: str, num_questions: int = 5, difficulty: str = "média") -> list:
         """Gerar questões a partir de um texto"""
         system_prompt = "Você é um especialista em criar questões educacionais relevantes e bem estruturadas."
+        max_tokens = output_budget("generate_questions", num_questions=num_questions)
+        # Textos longos: manter trechos de todo o documento dentro do orçamento
+        text = sample_to_budget(text, self._text_budget(max_tokens, system_prompt, "generate_questions"))
         prompt = f"""
 Com base no seguinte texto, crie {num_questions} questões de nível {difficulty}:
 
@@ -127,7 +243,7 @@ Formate a resposta como uma lista JSON com o seguinte formato:
 
 Retorne apenas o JSON, sem texto adicional.
 """
-        response = await self._call_ai(prompt, system_prompt)
+        response = await self._call_ai(prompt, system_prompt, max_tokens, "generate_questions")
         
         # Tentar parsear JSON
         import json
@@ -144,10 +260,131 @@ Retorne apenas o JSON, sem texto adicional.
         except:
             return [{"error": "Não foi possível gerar questões no formato esperado", "raw_response": response}]
     
+    @traced()
     async def translate(self, text: str, target_language: str = "inglês") -> str:
         """Traduzir texto"""
         system_prompt = f"Você é um tradutor especializado em textos educacionais."
-        prompt = f"""
+        return await self._rewrite_in_parts(
+            text, lambda part: self._translate_prompt(part, target_language), system_prompt, "translate"
+        )
+    
+    @traced()
+    async def translate_with_memory(self, text: str, target_language: str = "inglês") -> dict:
+        """
+        Traduzir por parágrafos, reaproveitando a memória de tradução.
+        Só os parágrafos inéditos vão para a IA, em lotes concorrentes.
+        """
+        if self.translation_memory is None:
+            return {"translation": await self.translate(text, target_language), "segments": 0, "reused": 0}
+        from services.translation_memory import segment_hash
+        
+        # Partes pares são texto, ímpares são os separadores (preservados como estão)
+        parts = _PARAGRAPH_SEPARATOR_RE.split(text)
+        segments = {}
+        for i in range(0, len(parts), 2):
+            core = parts[i].strip()
+            # Trechos sem letras (números, marcadores) ficam como estão
+            if core and re.search(r"[^\W\d_]", core):
+                segments.setdefault(segment_hash(core), core)
+        
+        known = await asyncio.to_thread(self.translation_memory.lookup, list(segments), target_language)
+        pending = [(content_hash, segment) for content_hash, segment in segments.items() if content_hash not in known]
+        if pending:
+            translations = await self._translate_segments([segment for _, segment in pending], target_language)
+            await asyncio.to_thread(
+                self.translation_memory.store,
+                [(segment, translation) for (_, segment), translation in zip(pending, translations)],
+                target_language
+            )
+            known.update({content_hash: translation for (content_hash, _), translation in zip(pending, translations)})
+        
+        for i in range(0, len(parts), 2):
+            core = parts[i].strip()
+            if core:
+                content_hash = segment_hash(core)
+                if content_hash in known:
+                    # Manter os espaços em volta do parágrafo original
+                    leading = parts[i][:len(parts[i]) - len(parts[i].lstrip())]
+                    trailing = parts[i][len(parts[i].rstrip()):]
+                    parts[i] = f"{leading}{known[content_hash].strip()}{trailing}"
+        
+        return {
+            "translation": "".join(parts),
+            "segments": len(segments),
+            "reused": len(segments) - len(pending)
+        }
+    
+    async def _translate_segments(self, segments: list, target_language: str) -> list:
+        """Traduzir vários segmentos agrupados em lotes (lista JSON) executados em paralelo"""
+        system_prompt = "Você é um tradutor especializado em textos educacionais."
+        max_output = settings.MAX_OUTPUT_TOKENS
+        batch_tokens = min(self._text_budget(max_output, system_prompt, "translate"), int((max_output - 100) / 1.3))
+        
+        # Agrupar segmentos consecutivos até o orçamento; segmentos grandes vão sozinhos
+        batches = []
+        current, current_tokens = [], 0
+        for segment in segments:
+            tokens = count_tokens(segment) + 4
+            if current and (current_tokens + tokens > batch_tokens or len(current) >= TRANSLATION_BATCH_SEGMENTS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(segment)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        
+        semaphore = asyncio.Semaphore(settings.TRANSLATION_CONCURRENCY)
+        
+        async def run(batch: list) -> list:
+            async with semaphore:
+                if len(batch) == 1:
+                    return [await self.translate(batch[0], target_language)]
+                max_tokens = output_budget("translate", sum(count_tokens(segment) for segment in batch) + 4 * len(batch))
+                response = await self._call_ai(
+                    self._translate_batch_prompt(batch, target_language), system_prompt, max_tokens, "translate"
+                )
+            translations = self._parse_json_list(response)
+            if translations is not None and len(translations) == len(batch) \
+                    and all(isinstance(item, str) for item in translations):
+                return translations
+            # Resposta fora do formato: traduzir os segmentos um a um
+            singles = await asyncio.gather(*(run([segment]) for segment in batch))
+            return [single[0] for single in singles]
+        
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [translation for batch in results for translation in batch]
+    
+    def _translate_batch_prompt(self, segments: list, target_language: str) -> str:
+        """Prompt de tradução de vários segmentos de uma vez"""
+        return f"""
+Traduza para {target_language} cada item da lista JSON abaixo:
+
+{json.dumps(segments, ensure_ascii=False, indent=0)}
+
+Mantenha:
+- O tom educacional
+- A formatação de cada item
+- Termos técnicos apropriados
+
+Retorne apenas uma lista JSON de strings com as traduções, na mesma ordem e com o mesmo número de itens ({len(segments)}).
+"""
+    
+    def _parse_json_list(self, response: str) -> Optional[list]:
+        """Lista JSON da resposta da IA (None se não for possível interpretar)"""
+        clean_response = response.strip()
+        if clean_response.startswith("```"):
+            clean_response = clean_response.split("```")[1]
+            if clean_response.startswith("json"):
+                clean_response = clean_response[4:]
+        try:
+            result = json.loads(clean_response.strip())
+        except ValueError:
+            return None
+        return result if isinstance(result, list) else None
+    
+    def _translate_prompt(self, text: str, target_language: str) -> str:
+        """Prompt de tradução"""
+        return f"""
 Traduza o seguinte texto para {target_language}:
 
 {text}
@@ -159,24 +396,34 @@ Mantenha:
 
 Retorne apenas a tradução, sem explicações adicionais.
 """
-        return await self._call_ai(prompt, system_prompt)
     
+    @traced()
     async def correct_grammar(self, text: str) -> str:
         """Corrigir gramática e ortografia"""
         system_prompt = "Você é um especialista em língua portuguesa com foco em textos educacionais."
-        prompt = f"""
+        return await self._rewrite_in_parts(text, self._grammar_prompt, system_prompt, "correct_grammar")
+    
+    def _grammar_prompt(self, text: str) -> str:
+        """Prompt de correção gramatical"""
+        return f"""
 Corrija os erros gramaticais e ortográficos no seguinte texto:
 
 {text}
 
 Retorne apenas o texto corrigido, sem destacar ou explicar as correções.
 """
-        return await self._call_ai(prompt, system_prompt)
     
+    @traced()
     async def simplify_text(self, text: str, target_grade: str = "fundamental") -> str:
         """Simplificar texto para um nível de ensino específico"""
         system_prompt = "Você é um especialista em adaptar textos para diferentes níveis educacionais."
-        prompt = f"""
+        return await self._rewrite_in_parts(
+            text, lambda part: self._simplify_prompt(part, target_grade), system_prompt, "simplify_text"
+        )
+    
+    def _simplify_prompt(self, text: str, target_grade: str) -> str:
+        """Prompt de simplificação de texto"""
+        return f"""
 Simplifique o seguinte texto para o nível {target_grade}:
 
 {text}
@@ -189,5 +436,4 @@ O texto simplificado deve:
 
 Retorne apenas o texto simplificado.
 """
-        return await self._call_ai(prompt, system_prompt)
 
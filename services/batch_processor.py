@@ -0,0 +1,173 @@
+"""
+Processamento de PDFs em lote (extração de texto, marca d'água, compressão) em um pool de processos,
+com resultados enviados à medida que cada arquivo fica pronto (NDJSON ou ZIP)
+"""
+import os
+import json
+import uuid
+import shutil
+import asyncio
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from urllib.parse import quote
+
+from config import settings
+from services.export_service import ZipStreamWriter, safe_filename
+
+BATCH_OPERATIONS = {"extract", "watermark", "compress"}
+BATCH_FORMATS = {"ndjson", "zip"}
+
+
+def _batch_job(operation: str, input_path: str, work_dir: str, options: dict) -> dict:
+    """Processar um arquivo (executado em outro processo)"""
+    if operation == "extract":
+        from services.pdf_service import PDFService
+
+        return {"text": PDFService().extract_text(input_path)}
+
+    if operation == "watermark":
+        from services.pdf_service import PDFService
+
+        return {"path": PDFService().add_watermark(input_path, options["watermark_text"], work_dir)}
+
+    from services.large_file_handler import LargeFileHandler
+
+    handler = LargeFileHandler()
+    handler.temp_dir = work_dir
+    compressed_path = handler.compress_pdf(input_path)
+    if not compressed_path:
+        raise Exception("Erro ao comprimir PDF")
+    return {
+        "path": compressed_path,
+        "original_size": os.path.getsize(input_path),
+        "compressed_size": os.path.getsize(compressed_path)
+    }
+
+
+class BatchProcessor:
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.BATCH_WORKERS
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Pool de processos criado no primeiro uso (spawn: seguro com threads no processo pai)"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def new_batch_dir(self) -> str:
+        """Pasta de trabalho de um lote (entradas enviadas e saídas intermediárias)"""
+        return tempfile.mkdtemp(prefix="batch_", dir=settings.TEMP_DIR)
+
+    async def process(self, operation: str, inputs: list, batch_dir: str, output_format: str = "ndjson",
+                      options: Optional[dict] = None):
+        """
+        Processar todos os arquivos em paralelo. inputs: lista de (caminho, nome do arquivo).
+        Retorna um gerador assíncrono com as linhas NDJSON (uma por arquivo concluído) ou os bytes do ZIP.
+        """
+        options = options or {}
+        if operation not in BATCH_OPERATIONS:
+            raise Exception(f"Operação não suportada: {operation} (use {', '.join(sorted(BATCH_OPERATIONS))})")
+        if output_format not in BATCH_FORMATS:
+            raise Exception("Formato de saída deve ser 'ndjson' ou 'zip'")
+        if operation == "watermark" and not options.get("watermark_text"):
+            raise Exception("Informe o texto da marca d'água")
+        if not inputs:
+            raise Exception("Nenhum arquivo para processar")
+        if len(inputs) > settings.BATCH_MAX_FILES:
+            raise Exception(f"Máximo de {settings.BATCH_MAX_FILES} arquivos por lote")
+
+        loop = asyncio.get_running_loop()
+
+        async def run(index: int, path: str, filename: str):
+            work_dir = os.path.join(batch_dir, f"job_{index}")
+            os.makedirs(work_dir, exist_ok=True)
+            try:
+                result = await loop.run_in_executor(self.executor, _batch_job, operation, path, work_dir, options)
+                return index, filename, result, None
+            except Exception as e:
+                return index, filename, None, str(e)
+
+        tasks = [asyncio.ensure_future(run(i, path, filename)) for i, (path, filename) in enumerate(inputs)]
+        if output_format == "zip":
+            return self._stream_zip(tasks, batch_dir)
+        return self._stream_ndjson(tasks, batch_dir)
+
+    async def _stream_ndjson(self, tasks: list, batch_dir: str):
+        """Uma linha JSON por arquivo concluído, com o progresso do lote"""
+        try:
+            for completed, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+                index, filename, result, error = await next_done
+                line = {"index": index, "filename": filename, "completed": completed, "total": len(tasks)}
+                if error is not None:
+                    line.update({"success": False, "error": error})
+                else:
+                    result = dict(result)
+                    if "path" in result:
+                        # Saída disponível para download em OUTPUT_DIR
+                        # (nome único no servidor; o nome original vai só no parâmetro do download)
+                        name = f"{uuid.uuid4().hex}.pdf"
+                        friendly = safe_filename(filename, f'arquivo_{index + 1}.pdf')
+                        await asyncio.to_thread(shutil.move, result.pop("path"), os.path.join(settings.OUTPUT_DIR, name))
+                        result["download"] = f"/api/downloads/{name}?name={quote(friendly)}"
+                    line.update({"success": True, **result})
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            await self._finish(tasks, batch_dir)
+
+    async def _stream_zip(self, tasks: list, batch_dir: str):
+        """ZIP gerado em partes; relatorio.json no final lista o resultado de cada arquivo"""
+        stream = ZipStreamWriter()
+        report = []
+        used_names = set()
+        try:
+            with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for next_done in asyncio.as_completed(tasks):
+                    index, filename, result, error = await next_done
+                    if error is not None:
+                        report.append({"index": index, "filename": filename, "success": False, "error": error})
+                        continue
+
+                    stem = safe_filename(os.path.splitext(filename)[0], f"arquivo_{index + 1}")
+                    if stem in used_names:
+                        stem = f"{stem}_{index + 1}"
+                    used_names.add(stem)
+
+                    if "text" in result:
+                        arcname = f"{stem}.txt"
+                        await asyncio.to_thread(zipf.writestr, arcname, result["text"])
+                    else:
+                        arcname = f"{stem}.pdf"
+                        # PDFs já são comprimidos: guardar sem recomprimir
+                        await asyncio.to_thread(zipf.write, result["path"], arcname, zipfile.ZIP_STORED)
+                    report.append({"index": index, "filename": filename, "success": True, "file": arcname})
+                    yield stream.drain()
+
+                report.sort(key=lambda item: item["index"])
+                zipf.writestr("relatorio.json", json.dumps(report, ensure_ascii=False, indent=2))
+            yield stream.drain()
+        finally:
+            await self._finish(tasks, batch_dir)
+
+    async def _finish(self, tasks: list, batch_dir: str):
+        """Cancelar o que ainda não começou (cliente desconectado) e remover a pasta do lote"""
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(shutil.rmtree, batch_dir, True)
+
+    def shutdown(self):
+        """Encerrar o pool de processos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,265 @@
+"""
+Compressão de respostas (brotli/gzip) e arquivos estáticos pré-comprimidos
+"""
+import os
+import gzip
+import zlib
+import asyncio
+import mimetypes
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele, apenas gzip
+    brotli = None
+
+# Formatos que já são comprimidos (PDF, OOXML/ZIP, imagens, áudio/vídeo) ou fluxos de eventos
+# não ganham nada com gzip/brotli. "tipo/*" vale para todo o grupo.
+EXCLUDED_CONTENT_TYPES = (
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/octet-stream",
+    "audio/*",
+    "font/woff",
+    "font/woff2",
+    "image/avif",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "text/event-stream",
+    "video/*",
+)
+
+# Extensões de arquivos estáticos pré-comprimidos
+PRECOMPRESSED_EXTENSIONS = (".js", ".css", ".html", ".svg", ".json")
+
+# Partes maiores que isso são comprimidas em outra thread, sem bloquear o event loop
+THREAD_MINIMUM_SIZE = 128 * 1024
+
+
+def _accepts(headers: Headers, encoding: str) -> bool:
+    """Verificar se o cliente aceita a codificação (ignora q=0)"""
+    for item in headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def _is_excluded(content_type: str, excluded: tuple) -> bool:
+    media_type = content_type.partition(";")[0].strip().lower()
+    return media_type in excluded or f"{media_type.partition('/')[0]}/*" in excluded
+
+
+class _GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        return self._compressor.compress(body) + self._compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self._compressor.process(body)
+        return data + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+class _CompressionResponder:
+    """
+    Envia a resposta de uma requisição, comprimida quando cabe. O início (status e cabeçalhos)
+    só é enviado junto com a primeira parte do corpo, quando já se sabe se haverá compressão.
+    """
+
+    def __init__(self, app, new_compressor, minimum_size: int, excluded: tuple):
+        self.app = app
+        # Compressor criado só quando a resposta vai de fato ser comprimida
+        self.new_compressor = new_compressor
+        self.compressor = None
+        self.minimum_size = minimum_size
+        self.excluded = excluded
+        self.send = None
+        self.start_message = None
+        self.passthrough = False
+        self.started = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def _compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= THREAD_MINIMUM_SIZE:
+            return await asyncio.to_thread(self.compressor.compress, body, more_body)
+        return self.compressor.compress(body, more_body)
+
+    async def send_compressed(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            # Já codificada, parcial (Range) ou formato já comprimido: enviar como está
+            self.passthrough = ("content-encoding" in headers or message["status"] == 206
+                                or _is_excluded(headers.get("content-type", ""), self.excluded))
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if self.passthrough or message_type != "http.response.body":
+            if message_type == "http.response.pathsend" and not self.passthrough and not self.started:
+                # Arquivo enviado direto pelo servidor: sem compressão
+                self.started = True
+                await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.started:
+            message["body"] = await self._compress(body, more_body)
+            await self.send(message)
+            return
+
+        self.started = True
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        if len(body) < self.minimum_size and not more_body:
+            # Respostas pequenas não compensam
+            self.passthrough = True
+            await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        self.compressor = self.new_compressor()
+        headers.add_vary_header("Accept-Encoding")
+        headers["Content-Encoding"] = self.compressor.encoding
+        # ETag forte e faixas de bytes se referem ao arquivo sem compressão: o corpo codificado
+        # só pode ter validador fraco e não aceita Range (retomar download, caches intermediários)
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        if "accept-ranges" in headers:
+            del headers["Accept-Ranges"]
+        message["body"] = await self._compress(body, more_body)
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(message["body"]))
+        await self.send(self.start_message)
+        await self.send(message)
+
+
+class CompressionMiddleware:
+    """
+    Comprime respostas de texto/JSON com brotli (se disponível e aceito pelo cliente) ou gzip.
+    Respostas já codificadas, parciais (206), pedidos com Range e formatos binários comprimidos passam direto.
+    """
+
+    def __init__(self, app, minimum_size: int = 1000, compresslevel: int = 6, brotli_quality: int = 4,
+                 exclude_content_types: tuple = EXCLUDED_CONTENT_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.brotli_quality = brotli_quality
+        self.exclude_content_types = exclude_content_types
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if "range" in headers:
+            # Pedido de faixa de bytes: a resposta (parcial ou completa) segue sem compressão
+            await self.app(scope, receive, send)
+            return
+        if brotli is not None and _accepts(headers, "br"):
+            new_compressor = lambda: _BrotliCompressor(self.brotli_quality)
+        elif _accepts(headers, "gzip"):
+            new_compressor = lambda: _GzipCompressor(self.compresslevel)
+        else:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self.app, new_compressor, self.minimum_size, self.exclude_content_types)
+        await responder(scope, receive, send)
+
+
+def _write_atomic(path: str, data: bytes):
+    """Gravar em arquivo temporário e substituir (vários workers podem gerar ao mesmo tempo)"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def precompress_static(directory: str) -> int:
+    """Gerar versões .gz (e .br, com brotli) dos arquivos estáticos novos ou alterados"""
+    generated = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(PRECOMPRESSED_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            mtime = os.path.getmtime(path)
+            variants = [(".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                variants.append((".br", lambda data: brotli.compress(data, quality=11)))
+
+            data = None
+            for suffix, compress in variants:
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                    continue
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                _write_atomic(target, compress(data))
+                generated += 1
+    return generated
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Arquivos estáticos servindo a versão .br/.gz pré-comprimida quando o cliente aceita"""
+
+    async def get_response(self, path: str, scope):
+        headers = Headers(scope=scope)
+        if not path.endswith(PRECOMPRESSED_EXTENSIONS) or "range" in headers:
+            return await super().get_response(path, scope)
+
+        _, original_stat = await anyio.to_thread.run_sync(self.lookup_path, path)
+        for suffix, encoding in ((".br", "br"), (".gz", "gzip")):
+            if original_stat is None or not _accepts(headers, encoding):
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            # Versão comprimida ausente ou mais antiga que o original: ignorar
+            if stat_result is None or stat_result.st_mtime < original_stat.st_mtime:
+                continue
+            response = self.file_response(full_path, stat_result, scope)
+            if response.status_code == 200:
+                response.headers["content-type"] = _media_type(path)
+            response.headers["content-encoding"] = encoding
+            response.headers["vary"] = "Accept-Encoding"
+            return response
+
+        # Sem versão pré-comprimida: a CompressionMiddleware comprime (e ajusta o Vary) se couber
+        return await super().get_response(path, scope)
+
+
+def _media_type(path: str) -> str:
+    """Tipo do arquivo original (não do .br/.gz)"""
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type.endswith(("javascript", "json")):
+        return f"{media_type}; charset=utf-8"
+    return media_type
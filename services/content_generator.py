@@ -1,9 +1,14 @@
+from typing import Optional
 from services.ai_service import AIService
+from services.token_budget import output_budget
+from services.tracing import traced
 
 class ContentGenerator:
-    def __init__(self):
-        self.ai_service = AIService()
+    def __init__(self, ai_service: Optional[AIService] = None):
+        # Reaproveitar o AIService da aplicação (evita criar clientes duplicados)
+        self.ai_service = ai_service or AIService()
     
+    @traced()
     async def generate_lesson_plan(self, subject: str, grade: str, topic: str, duration: str) -> dict:
         """Gerar plano de aula completo"""
         system_prompt = "Você é um especialista em planejamento pedagógico."
@@ -42,7 +47,7 @@ Formate como JSON com a seguinte estrutura:
 
 Retorne apenas o JSON.
 """
-        response = await self.ai_service._call_ai(prompt, system_prompt)
+        response = await self.ai_service._call_ai(prompt, system_prompt, operation="generate_lesson_plan")
         
         # Parsear JSON
         import json
@@ -58,6 +63,7 @@ Retorne apenas o JSON.
         except:
             return {"error": "Não foi possível gerar o plano de aula", "raw_response": response}
     
+    @traced()
     async def generate_exercises(self, subject: str, topic: str, num_exercises: int, difficulty: str) -> list:
         """Gerar lista de exercícios"""
         system_prompt = "Você é um especialista em criar exercícios educacionais."
@@ -99,7 +105,8 @@ Formate como JSON:
 
 Retorne apenas o JSON.
 """
-        response = await self.ai_service._call_ai(prompt, system_prompt)
+        max_tokens = output_budget("generate_exercises", num_exercises=num_exercises)
+        response = await self.ai_service._call_ai(prompt, system_prompt, max_tokens, "generate_exercises")
         
         # Parsear JSON
         import json
@@ -115,6 +122,7 @@ Retorne apenas o JSON.
         except:
             return [{"error": "Não foi possível gerar os exercícios", "raw_response": response}]
     
+    @traced()
     async def generate_presentation_outline(self, topic: str, num_slides: int, audience: str) -> list:
         """Gerar estrutura de apresentação"""
         system_prompt = "Você é um especialista em criar apresentações educacionais impactantes."
@@ -154,7 +162,8 @@ Formate como JSON:
 
 Retorne apenas o JSON.
 """
-        response = await self.ai_service._call_ai(prompt, system_prompt)
+        max_tokens = output_budget("generate_presentation_outline", num_slides=num_slides)
+        response = await self.ai_service._call_ai(prompt, system_prompt, max_tokens, "generate_presentation_outline")
         
         # Parsear JSON
         import json
@@ -170,6 +179,7 @@ Retorne apenas o JSON.
         except:
             return [{"error": "Não foi possível gerar a estrutura da apresentação", "raw_response": response}]
     
+    @traced()
     async def generate_study_guide(self, subject: str, topics: list, grade: str) -> dict:
         """Gerar guia de estudos"""
         system_prompt = "Você é um especialista em criar materiais de apoio ao estudo."
@@ -191,7 +201,7 @@ Formate como JSON com estrutura clara e organizada.
 
 Retorne apenas o JSON.
 """
-        response = await self.ai_service._call_ai(prompt, system_prompt)
+        response = await self.ai_service._call_ai(prompt, system_prompt, operation="generate_study_guide")
         
         # Parsear JSON
         import json
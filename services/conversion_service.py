@@ -0,0 +1,482 @@
+"""
+Conversão de documentos (PPTX, DOCX, PDF e conteúdos gerados pela IA) para PDF, DOCX e texto
+
+Todos os formatos passam por um modelo intermediário de blocos:
+    ("heading", nível, texto) | ("paragraph", texto) | ("bullets", [itens]) | ("table", [linhas])
+As conversões rodam em processos separados e o resultado fica em cache pelo hash do conteúdo.
+"""
+import os
+import json
+import hashlib
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from xml.sax.saxutils import escape
+
+from config import settings
+
+TARGET_FORMATS = {"pdf", "docx", "txt"}
+SOURCE_FORMATS = {".pdf", ".pptx", ".docx"}
+CONTENT_KINDS = {"lesson_plan", "exercises", "worksheet", "answer_key", "outline", "text"}
+
+# Templates DOCX e estilos PDF já carregados neste processo
+_docx_templates = {}
+_pdf_styles = None
+
+
+# ==================== LEITURA PARA BLOCOS ====================
+
+def pptx_to_blocks(file_path: str) -> list:
+    """Apostila a partir dos slides: título, textos, tabelas e anotações"""
+    from services.ppt_service import PPTService
+
+    blocks = []
+    for slide in PPTService().extract_text_fast(file_path):
+        heading = f"Slide {slide['slide_number']}"
+        blocks.append(("heading", 2, f"{heading}: {slide['title']}" if slide["title"] else heading))
+        items = [line for text in slide["content"] for line in text.split("\n") if line.strip()]
+        if items:
+            blocks.append(("bullets", items))
+        for table in slide["tables"]:
+            blocks.append(("table", table))
+        if slide["notes"]:
+            blocks.append(("paragraph", f"Anotações: {slide['notes']}"))
+    return blocks
+
+
+def docx_to_blocks(file_path: str) -> list:
+    """Ler parágrafos, títulos, listas e tabelas de um DOCX na ordem do documento"""
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(file_path)
+    blocks = []
+    for element in document.element.body.iterchildren():
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            paragraph = Paragraph(element, document)
+            text = paragraph.text.strip()
+            if not text:
+                continue
+            style = paragraph.style.name if paragraph.style is not None else ""
+            if style == "Title":
+                blocks.append(("heading", 1, text))
+            elif style.startswith("Heading"):
+                level = style.split()[-1]
+                blocks.append(("heading", int(level) if level.isdigit() else 2, text))
+            elif style.startswith("List"):
+                if blocks and blocks[-1][0] == "bullets":
+                    blocks[-1][1].append(text)
+                else:
+                    blocks.append(("bullets", [text]))
+            else:
+                blocks.append(("paragraph", text))
+        elif tag == "tbl":
+            table = Table(element, document)
+            blocks.append(("table", [[cell.text for cell in row.cells] for row in table.rows]))
+    return blocks
+
+
+def pdf_to_blocks(file_path: str) -> list:
+    """Texto de cada página do PDF como parágrafos"""
+    from PyPDF2 import PdfReader
+
+    blocks = []
+    for page in PdfReader(file_path).pages:
+        for paragraph in (page.extract_text() or "").split("\n\n"):
+            if paragraph.strip():
+                blocks.append(("paragraph", paragraph.strip()))
+    return blocks
+
+
+def text_to_blocks(text: str) -> list:
+    """Texto simples ou Markdown básico (#, -, *) para blocos"""
+    blocks = []
+    for paragraph in text.split("\n\n"):
+        plain_lines = []
+        for line in paragraph.split("\n"):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if stripped.startswith("#") or stripped[:2] in ("- ", "* "):
+                if plain_lines:
+                    blocks.append(("paragraph", " ".join(plain_lines)))
+                    plain_lines = []
+                if stripped.startswith("#"):
+                    level = len(stripped) - len(stripped.lstrip("#"))
+                    blocks.append(("heading", min(level, 3), stripped.lstrip("#").strip()))
+                elif blocks and blocks[-1][0] == "bullets":
+                    blocks[-1][1].append(stripped[2:])
+                else:
+                    blocks.append(("bullets", [stripped[2:]]))
+            else:
+                plain_lines.append(stripped)
+        if plain_lines:
+            blocks.append(("paragraph", " ".join(plain_lines)))
+    return blocks
+
+
+def _as_list(value) -> list:
+    """Normalizar valor (lista ou texto) para lista de strings"""
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return [str(value)] if value else []
+
+
+def lesson_plan_blocks(plan: dict, title: str = "") -> list:
+    """Plano de aula gerado por ContentGenerator.generate_lesson_plan"""
+    blocks = [("heading", 1, plan.get("title") or title or "Plano de Aula")]
+    sections = [
+        ("Objetivos", "objectives"),
+        ("Conteúdos", "content"),
+        ("Metodologia", "methodology"),
+        ("Recursos", "resources"),
+    ]
+    for label, key in sections:
+        value = plan.get(key)
+        if not value:
+            continue
+        blocks.append(("heading", 2, label))
+        if isinstance(value, list):
+            blocks.append(("bullets", _as_list(value)))
+        else:
+            blocks.append(("paragraph", str(value)))
+
+    development = plan.get("development") or []
+    if development:
+        blocks.append(("heading", 2, "Desenvolvimento"))
+        rows = [["Etapa", "Duração", "Descrição"]]
+        for step in development:
+            if isinstance(step, dict):
+                rows.append([str(step.get("step", "")), str(step.get("duration", "")), str(step.get("description", ""))])
+            else:
+                rows.append(["", "", str(step)])
+        blocks.append(("table", rows))
+
+    for label, key in (("Avaliação", "assessment"), ("Referências", "references")):
+        value = plan.get(key)
+        if not value:
+            continue
+        blocks.append(("heading", 2, label))
+        if isinstance(value, list):
+            blocks.append(("bullets", _as_list(value)))
+        else:
+            blocks.append(("paragraph", str(value)))
+    return blocks
+
+
+def exercises_blocks(exercises: list, title: str = "", include_answers: bool = True) -> list:
+    """Lista de exercícios (ContentGenerator.generate_exercises ou AIService.generate_questions)"""
+    blocks = [("heading", 1, title or "Lista de Exercícios")]
+    for i, exercise in enumerate(exercises):
+        number = exercise.get("number", i + 1)
+        kind = exercise.get("type")
+        heading = f"Questão {number}" + (f" ({kind})" if kind else "")
+        blocks.append(("heading", 2, heading))
+        blocks.append(("paragraph", str(exercise.get("question", ""))))
+        alternatives = exercise.get("alternatives") or {}
+        if isinstance(alternatives, dict) and alternatives:
+            blocks.append(("bullets", [f"{letter}) {text}" for letter, text in alternatives.items()]))
+        if include_answers:
+            blocks.extend(_answer_blocks(exercise))
+    return blocks
+
+
+def _answer_blocks(exercise: dict) -> list:
+    """Resposta e explicação de um exercício"""
+    answer = exercise.get("answer", exercise.get("correct_answer"))
+    blocks = []
+    if answer:
+        blocks.append(("paragraph", f"Resposta: {answer}"))
+    if exercise.get("explanation"):
+        blocks.append(("paragraph", f"Explicação: {exercise['explanation']}"))
+    return blocks
+
+
+def answer_key_blocks(exercises: list, title: str = "") -> list:
+    """Gabarito separado da lista de exercícios"""
+    blocks = [("heading", 1, f"Gabarito - {title}" if title else "Gabarito")]
+    for i, exercise in enumerate(exercises):
+        blocks.append(("heading", 2, f"Questão {exercise.get('number', i + 1)}"))
+        blocks.extend(_answer_blocks(exercise) or [("paragraph", "Sem resposta informada")])
+    return blocks
+
+
+def outline_blocks(outline: list, title: str = "") -> list:
+    """Estrutura de apresentação (ContentGenerator.generate_presentation_outline)"""
+    blocks = [("heading", 1, title or "Estrutura da Apresentação")]
+    for i, slide in enumerate(outline):
+        blocks.append(("heading", 2, f"Slide {slide.get('slide_number', i + 1)}: {slide.get('title', '')}"))
+        items = _as_list(slide.get("content"))
+        if items:
+            blocks.append(("bullets", items))
+        if slide.get("visual_suggestions"):
+            blocks.append(("paragraph", f"Sugestão visual: {slide['visual_suggestions']}"))
+    return blocks
+
+
+def validate_conversion(extension: str, target: str):
+    """Conferir origem e destino de uma conversão de arquivo (ValueError se não suportada)"""
+    if extension not in SOURCE_FORMATS:
+        raise ValueError(f"Formato de origem não suportado: {extension or 'sem extensão'}")
+    if target not in TARGET_FORMATS or f".{target}" == extension:
+        raise ValueError(f"Conversão de {extension} para {target} não suportada")
+
+
+def validate_content(kind: str, data):
+    """Conferir tipo e formato dos dados antes de converter (ValueError se inválidos)"""
+    if kind not in CONTENT_KINDS:
+        raise ValueError(f"Tipo de conteúdo não suportado: {kind}")
+    if data is None:
+        raise ValueError("Conteúdo ausente")
+    if kind == "lesson_plan" and not isinstance(data, dict):
+        raise ValueError("Plano de aula deve ser um objeto JSON")
+    if kind in ("exercises", "worksheet", "answer_key", "outline"):
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise ValueError(f"Conteúdo do tipo '{kind}' deve ser uma lista de objetos JSON")
+
+
+def content_to_blocks(kind: str, data, title: str = "") -> list:
+    """Converter conteúdo gerado pela IA em blocos conforme o tipo"""
+    if kind == "lesson_plan":
+        return lesson_plan_blocks(data, title)
+    if kind == "exercises":
+        return exercises_blocks(data, title)
+    if kind == "worksheet":
+        # Lista para o aluno, sem respostas (o gabarito vai em "answer_key")
+        return exercises_blocks(data, title, include_answers=False)
+    if kind == "answer_key":
+        return answer_key_blocks(data, title)
+    if kind == "outline":
+        return outline_blocks(data, title)
+    if kind == "text":
+        blocks = text_to_blocks(data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, indent=2))
+        return ([("heading", 1, title)] if title else []) + blocks
+    raise Exception(f"Tipo de conteúdo não suportado: {kind}")
+
+
+# ==================== ESCRITA DOS BLOCOS ====================
+
+def blocks_to_text(blocks: list) -> str:
+    """Blocos para texto simples"""
+    lines = []
+    for block in blocks:
+        if block[0] == "heading":
+            lines.append(("\n" if lines else "") + block[2].upper() if block[1] == 1 else f"\n{block[2]}")
+        elif block[0] == "paragraph":
+            lines.append(block[1])
+        elif block[0] == "bullets":
+            lines.extend(f"- {item}" for item in block[1])
+        elif block[0] == "table":
+            lines.extend(" | ".join(row) for row in block[1])
+    return "\n".join(lines).strip() + "\n"
+
+
+def _docx_template(template: Optional[str] = None):
+    """
+    Cópia de um template DOCX (padrão do python-docx ou da escola, em TEMPLATES_DIR).
+    Cada processo lê o template uma vez e copia o documento já parseado.
+    """
+    import copy
+    import docx
+
+    key = template or ""
+    if key not in _docx_templates:
+        if template:
+            name = os.path.basename(template)
+            if not name.lower().endswith(".docx"):
+                name += ".docx"
+            template_path = os.path.join(settings.TEMPLATES_DIR, name)
+            if not os.path.exists(template_path):
+                raise Exception(f"Template não encontrado: {template}")
+            _docx_templates[key] = docx.Document(template_path)
+        else:
+            _docx_templates[key] = docx.Document()
+    return copy.deepcopy(_docx_templates[key])
+
+
+def write_docx(blocks: list, output_path: str, template: Optional[str] = None):
+    """Blocos para DOCX (python-docx)"""
+    document = _docx_template(template)
+    style_names = {style.name for style in document.styles}
+    bullet_style = "List Bullet" if "List Bullet" in style_names else None
+    table_style = "Table Grid" if "Table Grid" in style_names else None
+
+    for block in blocks:
+        if block[0] == "heading":
+            document.add_heading(block[2], level=min(block[1], 9))
+        elif block[0] == "paragraph":
+            document.add_paragraph(block[1])
+        elif block[0] == "bullets":
+            for item in block[1]:
+                document.add_paragraph(item if bullet_style else f"• {item}", style=bullet_style)
+        elif block[0] == "table":
+            rows = block[1]
+            if not rows:
+                continue
+            columns = max(len(row) for row in rows)
+            table = document.add_table(rows=len(rows), cols=columns)
+            if table_style:
+                table.style = table_style
+            for r, row in enumerate(rows):
+                for c, value in enumerate(row):
+                    table.cell(r, c).text = value
+    document.save(output_path)
+
+
+def write_pdf(blocks: list, output_path: str):
+    """Blocos para PDF (reportlab/platypus)"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, ListFlowable, ListItem
+
+    global _pdf_styles
+    if _pdf_styles is None:
+        _pdf_styles = getSampleStyleSheet()
+    styles = _pdf_styles
+    heading_styles = {1: styles["Title"], 2: styles["Heading2"], 3: styles["Heading3"]}
+    body = styles["BodyText"]
+
+    def paragraph(text, style=body):
+        return Paragraph(escape(text).replace("\n", "<br/>"), style)
+
+    story = []
+    for block in blocks:
+        if block[0] == "heading":
+            story.append(paragraph(block[2], heading_styles.get(block[1], styles["Heading4"])))
+        elif block[0] == "paragraph":
+            story.append(paragraph(block[1]))
+            story.append(Spacer(1, 0.2 * cm))
+        elif block[0] == "bullets":
+            story.append(ListFlowable(
+                [ListItem(paragraph(item), leftIndent=12) for item in block[1]], bulletType="bullet", start="•"
+            ))
+        elif block[0] == "table":
+            rows = block[1]
+            if not rows:
+                continue
+            columns = max(len(row) for row in rows)
+            data = [[paragraph(value) for value in row] + [""] * (columns - len(row)) for row in rows]
+            table = Table(data, colWidths=[(A4[0] - 4 * cm) / columns] * columns, repeatRows=1)
+            table.setStyle(TableStyle([
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ]))
+            story.append(table)
+            story.append(Spacer(1, 0.3 * cm))
+
+    document = SimpleDocTemplate(output_path, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm,
+                                 topMargin=2 * cm, bottomMargin=2 * cm)
+    document.build(story or [Spacer(1, 1)])
+
+
+def write_blocks(blocks: list, target: str, output_path: str, template: Optional[str] = None):
+    """Gravar blocos no formato de destino"""
+    if target == "pdf":
+        write_pdf(blocks, output_path)
+    elif target == "docx":
+        write_docx(blocks, output_path, template)
+    elif target == "txt":
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(blocks_to_text(blocks))
+    else:
+        raise Exception(f"Formato de destino não suportado: {target}")
+
+
+# ==================== TAREFAS EXECUTADAS NOS PROCESSOS ====================
+
+def _convert_file_job(file_path: str, extension: str, target: str, output_path: str) -> str:
+    """Converter um arquivo (executado no pool de processos)"""
+    readers = {".pptx": pptx_to_blocks, ".docx": docx_to_blocks, ".pdf": pdf_to_blocks}
+    blocks = readers[extension](file_path)
+    _write_atomic(blocks, target, output_path)
+    return output_path
+
+
+def _convert_content_job(kind: str, data, title: str, target: str, template: Optional[str], output_path: str) -> str:
+    """Converter conteúdo gerado pela IA (executado no pool de processos)"""
+    _write_atomic(content_to_blocks(kind, data, title), target, output_path, template)
+    return output_path
+
+
+def _write_atomic(blocks: list, target: str, output_path: str, template: Optional[str] = None):
+    """Gravar em arquivo temporário e renomear, para o cache nunca ter arquivos pela metade"""
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        write_blocks(blocks, target, temp_path, template)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+class ConversionService:
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: Optional[int] = None):
+        self.cache_dir = cache_dir or settings.CONVERSION_CACHE_DIR
+        self.max_workers = max_workers or settings.CONVERSION_WORKERS
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Pool de processos criado no primeiro uso (spawn: seguro com threads no processo pai)"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def _cache_path(self, content_hash: str, target: str) -> str:
+        """Arquivo de cache de uma conversão"""
+        return os.path.join(self.cache_dir, f"{content_hash}.{target}")
+
+    async def _run(self, output_path: str, job, *args) -> str:
+        """Executar conversão no pool, a menos que o resultado já esteja em cache"""
+        if os.path.exists(output_path):
+            return output_path
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, job, *args, output_path)
+
+    async def convert_file(self, file_path: str, target: str) -> str:
+        """Converter PDF/PPTX/DOCX para pdf, docx ou txt (ValueError, antes de usar o pool, se não suportado)"""
+        extension = os.path.splitext(file_path)[1].lower()
+        validate_conversion(extension, target)
+        try:
+            from services.ocr_service import file_hash
+
+            # Hash em outra thread: ler um arquivo grande não pode bloquear o event loop
+            content_hash = await asyncio.to_thread(file_hash, file_path)
+            output_path = self._cache_path(f"{content_hash}{extension.replace('.', '_')}", target)
+            return await self._run(output_path, _convert_file_job, file_path, extension, target)
+        except Exception as e:
+            raise Exception(f"Erro ao converter documento: {str(e)}")
+
+    async def convert_content(self, kind: str, data, target: str, title: str = "", template: Optional[str] = None) -> str:
+        """
+        Converter conteúdo gerado pela IA (plano de aula, exercícios...) para pdf, docx ou txt
+        (ValueError, antes de usar o pool, se tipo, dados ou destino forem inválidos)
+        """
+        if target not in TARGET_FORMATS:
+            raise ValueError(f"Formato de destino não suportado: {target}")
+        validate_content(kind, data)
+        try:
+            payload = json.dumps([kind, data, title, template], sort_keys=True, ensure_ascii=False)
+            content_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+            output_path = self._cache_path(content_hash, target)
+            return await self._run(output_path, _convert_content_job, kind, data, title, target, template)
+        except Exception as e:
+            raise Exception(f"Erro ao converter conteúdo: {str(e)}")
+
+    def shutdown(self):
+        """Encerrar o pool de processos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
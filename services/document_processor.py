@@ -0,0 +1,69 @@
+"""
+Operações de IA aplicadas por página/slide, com resultado guardado por unidade:
+ao reenviar um documento editado, só as unidades alteradas voltam para a IA
+"""
+import json
+import asyncio
+from typing import Optional
+
+from config import settings
+from services.unit_cache import unit_key
+from services.ai_limiter import ai_priority, PRIORITY_BATCH
+
+# Operação -> parâmetros aceitos (com valores padrão)
+UNIT_OPERATIONS = {
+    "improve_text": {"context": "educacional"},
+    "translate": {"target_language": "inglês"},
+    "correct_grammar": {},
+    "simplify_text": {"target_grade": "fundamental"},
+}
+
+
+class DocumentProcessor:
+    def __init__(self, ai_service, unit_cache, max_concurrency: Optional[int] = None):
+        self.ai_service = ai_service
+        self.unit_cache = unit_cache
+        self.max_concurrency = max_concurrency or settings.UNIT_CONCURRENCY
+
+    async def process(self, units: list, operation: str, params: Optional[dict] = None) -> dict:
+        """
+        Aplicar a operação a cada unidade [(número da página/slide, texto)].
+        Unidades com o mesmo texto e parâmetros de uma execução anterior vêm do cache.
+        """
+        try:
+            if operation not in UNIT_OPERATIONS:
+                raise Exception(f"Operação não suportada: {operation} (use {', '.join(UNIT_OPERATIONS)})")
+            params = {name: (params or {}).get(name) or default for name, default in UNIT_OPERATIONS[operation].items()}
+            method = getattr(self.ai_service, operation)
+
+            params_key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+            keys = [unit_key(f"ai-{operation}", params_key, text.strip()) for _, text in units]
+            known = await asyncio.to_thread(self.unit_cache.get_many, [k for k, (_, text) in zip(keys, units) if text.strip()])
+
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def run(text: str) -> str:
+                async with semaphore:
+                    return (await method(text.strip(), **params)).strip()
+
+            # Textos repetidos dentro do documento também são processados uma única vez
+            pending = {key: text for key, (_, text) in zip(keys, units) if text.strip() and key not in known}
+            # Muitas chamadas de uma vez: ficam atrás dos pedidos interativos na fila do provedor
+            with ai_priority(PRIORITY_BATCH):
+                results = await asyncio.gather(*(run(text) for text in pending.values()))
+            new_results = dict(zip(pending, results))
+            await asyncio.to_thread(self.unit_cache.put_many, new_results)
+
+            processed = []
+            for (number, text), key in zip(units, keys):
+                result = known.get(key, new_results.get(key, ""))
+                processed.append({"number": number, "result": result, "cached": key in known})
+
+            return {
+                "result": "\n\n".join(unit["result"] for unit in processed if unit["result"]),
+                "units": processed,
+                "total": len(units),
+                "reprocessed": len(pending)
+            }
+        except Exception as e:
+            raise Exception(f"Erro ao processar documento: {str(e)}")
@@ -0,0 +1,248 @@
+"""
+Armazenamento de documentos: envio único, blobs endereçados por conteúdo e metadados em SQLite
+"""
+import os
+import re
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import settings
+from services.tracing import traced, current_span
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    hash TEXT NOT NULL REFERENCES blobs(hash),
+    filename TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(hash);
+"""
+
+
+class DocumentStore:
+    def __init__(self, store_dir: Optional[str] = None, parse_cache_size: int = 64):
+        self.store_dir = store_dir or settings.STORE_DIR
+        self.blobs_dir = os.path.join(self.store_dir, "blobs")
+        self.db_path = os.path.join(self.store_dir, "documents.db")
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+        # Resultados de parse (texto extraído etc.) por hash do blob, em LRU
+        self._parse_cache = OrderedDict()
+        self._parse_cache_size = parse_cache_size
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self, immediate: bool = False):
+        """
+        Nova conexão por operação (seguro entre threads e workers), em uma transação.
+        immediate=True reserva a escrita já no início (BEGIN IMMEDIATE): leituras e escritas
+        de save/delete sobre o mesmo blob não se intercalam entre threads ou workers.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                if immediate:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            conn.close()
+
+    def _blob_path(self, content_hash: str, extension: str) -> str:
+        """Blobs distribuídos em subpastas pelos dois primeiros caracteres do hash"""
+        return os.path.join(self.blobs_dir, content_hash[:2], f"{content_hash}{extension}")
+
+    def save(self, source, filename: str, max_size: Optional[int] = None) -> dict:
+        """
+        Guardar um arquivo (objeto de arquivo ou caminho) e registrar um documento.
+        Conteúdos repetidos reaproveitam o mesmo blob (só a contagem de referências aumenta).
+        Acima de max_size bytes a cópia é interrompida e nada é registrado (ValueError).
+        """
+        try:
+            extension = os.path.splitext(filename)[1].lower()
+            digest = hashlib.sha256()
+            size = 0
+
+            # Copiar para arquivo temporário calculando o hash em streaming
+            fd, temp_path = tempfile.mkstemp(dir=self.blobs_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as temp_file:
+                    reader = open(source, "rb") if isinstance(source, str) else source
+                    try:
+                        for block in iter(lambda: reader.read(1024 * 1024), b""):
+                            size += len(block)
+                            if max_size is not None and size > max_size:
+                                raise ValueError("Arquivo muito grande")
+                            digest.update(block)
+                            temp_file.write(block)
+                    finally:
+                        if isinstance(source, str):
+                            reader.close()
+
+                content_hash = digest.hexdigest()
+                document_id = uuid.uuid4().hex
+                now = datetime.now(timezone.utc).isoformat()
+
+                with self._connect(immediate=True) as conn:
+                    row = conn.execute("SELECT path FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+                    deduplicated = row is not None and os.path.exists(row["path"])
+                    if deduplicated:
+                        blob_path = row["path"]
+                    else:
+                        blob_path = self._blob_path(content_hash, extension)
+                        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                        os.replace(temp_path, blob_path)
+                        conn.execute(
+                            "INSERT OR IGNORE INTO blobs (hash, path, size, refcount, created_at) VALUES (?, ?, ?, 0, ?)",
+                            (content_hash, blob_path, size, now)
+                        )
+                        # Blob registrado mas ausente do disco: apontar para a nova cópia
+                        conn.execute("UPDATE blobs SET path = ?, size = ? WHERE hash = ?", (blob_path, size, content_hash))
+                    conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (content_hash,))
+                    conn.execute(
+                        "INSERT INTO documents (id, hash, filename, created_at) VALUES (?, ?, ?, ?)",
+                        (document_id, content_hash, filename, now)
+                    )
+            finally:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+
+            return {
+                "document_id": document_id,
+                "hash": content_hash,
+                "filename": filename,
+                "size": size,
+                "deduplicated": deduplicated
+            }
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception(f"Erro ao armazenar documento: {str(e)}")
+
+    def get(self, document_id: str) -> Optional[dict]:
+        """Metadados e caminho do blob de um documento (None se não existir)"""
+        if not re.fullmatch(r"[0-9a-f]{32}", document_id or ""):
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT d.id, d.hash, d.filename, d.created_at, b.path, b.size "
+                "FROM documents d JOIN blobs b ON b.hash = d.hash WHERE d.id = ?",
+                (document_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "document_id": row["id"],
+            "hash": row["hash"],
+            "filename": row["filename"],
+            "size": row["size"],
+            "created_at": row["created_at"],
+            "path": row["path"]
+        }
+
+    def list(self, limit: int = 100) -> list:
+        """Documentos mais recentes"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT d.id, d.hash, d.filename, d.created_at, b.size "
+                "FROM documents d JOIN blobs b ON b.hash = d.hash ORDER BY d.created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            {"document_id": r["id"], "hash": r["hash"], "filename": r["filename"],
+             "size": r["size"], "created_at": r["created_at"]}
+            for r in rows
+        ]
+
+    def delete(self, document_id: str) -> bool:
+        """Remover documento; o blob é apagado quando não há mais referências"""
+        if not re.fullmatch(r"[0-9a-f]{32}", document_id or ""):
+            return False
+
+        trash_path = None
+        try:
+            with self._connect(immediate=True) as conn:
+                row = conn.execute(
+                    "SELECT d.hash, b.path FROM documents d JOIN blobs b ON b.hash = d.hash WHERE d.id = ?",
+                    (document_id,)
+                ).fetchone()
+                if row is None:
+                    return False
+                cursor = conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+                if cursor.rowcount != 1:
+                    return False
+                content_hash, blob_path = row["hash"], row["path"]
+                conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (content_hash,))
+                refcount = conn.execute("SELECT refcount FROM blobs WHERE hash = ?", (content_hash,)).fetchone()["refcount"]
+                if refcount <= 0:
+                    conn.execute("DELETE FROM blobs WHERE hash = ?", (content_hash,))
+                    # Tirar o arquivo do caminho do blob ainda com a escrita reservada: um save do mesmo
+                    # conteúdo logo após o commit grava uma cópia nova em vez de perder a sua para o unlink
+                    if os.path.exists(blob_path):
+                        trash_path = f"{blob_path}.{uuid.uuid4().hex}.deleted"
+                        os.replace(blob_path, trash_path)
+        except BaseException:
+            # Transação desfeita: o blob continua registrado, devolver o arquivo ao lugar
+            if trash_path is not None:
+                os.replace(trash_path, blob_path)
+            raise
+
+        if refcount <= 0:
+            if trash_path is not None:
+                os.unlink(trash_path)
+            with self._lock:
+                for key in [k for k in self._parse_cache if k[0] == content_hash]:
+                    del self._parse_cache[key]
+        return True
+
+    def copy_to(self, document_id: str, destination: str) -> str:
+        """Copiar o conteúdo de um documento para outro caminho (para operações que alteram o arquivo)"""
+        document = self.get(document_id)
+        if document is None:
+            raise Exception("Documento não encontrado")
+        shutil.copyfile(document["path"], destination)
+        return destination
+
+    @traced("cache.parse")
+    def cached(self, content_hash: str, key: str, factory):
+        """
+        Resultado de parse de um blob (ex.: texto extraído), calculado uma vez
+        e reaproveitado nas operações seguintes sobre o mesmo conteúdo.
+        """
+        cache_key = (content_hash, key)
+        with self._lock:
+            hit = cache_key in self._parse_cache
+            if hit:
+                self._parse_cache.move_to_end(cache_key)
+                value = self._parse_cache[cache_key]
+        current_span().set_attributes({"cache.key": key, "cache.hit": hit})
+        if hit:
+            return value
+
+        value = factory()
+        with self._lock:
+            self._parse_cache[cache_key] = value
+            self._parse_cache.move_to_end(cache_key)
+            while len(self._parse_cache) > self._parse_cache_size:
+                self._parse_cache.popitem(last=False)
+        return value
@@ -0,0 +1,132 @@
+"""
+Exportação em lote de conteúdos gerados (planos de aula, listas de exercícios...) para DOCX/PDF em um ZIP
+"""
+import re
+import json
+import asyncio
+import zipfile
+from typing import Optional
+
+from services.conversion_service import validate_content
+
+EXPORT_KINDS = {"lesson_plan", "exercises", "outline", "text"}
+
+
+class ZipStreamWriter:
+    """
+    Destino "somente escrita" para zipfile.ZipFile: acumula os bytes gravados
+    para que o ZIP seja enviado em partes, à medida que cada arquivo entra.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        """Retirar os bytes acumulados desde a última chamada"""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def safe_filename(name: str, default: str = "arquivo") -> str:
+    """Nome de arquivo seguro para entradas do ZIP"""
+    name = re.sub(r"[^\w\s.-]", "", name, flags=re.UNICODE).strip()
+    return re.sub(r"\s+", "_", name)[:80] or default
+
+
+class BatchExporter:
+    def __init__(self, conversion_service):
+        self.conversion_service = conversion_service
+
+    def _jobs(self, items: list, target: str, separate_answer_keys: bool, template: Optional[str]) -> list:
+        """
+        Expandir itens em arquivos a gerar: (nome no ZIP, tipo, dados, título).
+        Todos os itens são conferidos aqui, antes de qualquer byte do ZIP ser enviado (ValueError se inválidos).
+        """
+        jobs = []
+        used_names = set()
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValueError(f"Item {i + 1}: deve ser um objeto JSON")
+            kind = item.get("kind")
+            if kind not in EXPORT_KINDS:
+                raise ValueError(f"Item {i + 1}: tipo não suportado: {kind}")
+            data = item.get("data")
+            if data is None:
+                raise ValueError(f"Item {i + 1}: campo 'data' ausente")
+            try:
+                validate_content(kind, data)
+            except ValueError as e:
+                raise ValueError(f"Item {i + 1}: {e}")
+            title = item.get("title") or (data.get("title") if isinstance(data, dict) else "") or f"{kind}_{i + 1}"
+
+            name = safe_filename(title, f"{kind}_{i + 1}")
+            if name in used_names:
+                name = f"{name}_{i + 1}"
+            used_names.add(name)
+
+            if kind == "exercises" and separate_answer_keys:
+                jobs.append((f"{name}.{target}", "worksheet", data, title))
+                jobs.append((f"gabaritos/{name}_gabarito.{target}", "answer_key", data, title))
+            else:
+                jobs.append((f"{name}.{target}", kind, data, title))
+        return jobs
+
+    async def export_zip(self, items: list, target: str = "docx", separate_answer_keys: bool = True,
+                         template: Optional[str] = None):
+        """
+        Renderizar todos os itens em paralelo (pool de processos da conversão)
+        e gerar o ZIP em partes, na ordem em que os arquivos ficam prontos.
+        Itens inválidos geram ValueError antes do início do envio; falhas na renderização
+        vão para o relatorio.json dentro do ZIP.
+        """
+        if target not in ("docx", "pdf"):
+            raise ValueError("Formato de exportação deve ser 'docx' ou 'pdf'")
+        jobs = self._jobs(items, target, separate_answer_keys, template)
+
+        async def render(index: int, job):
+            arcname, kind, data, title = job
+            try:
+                path = await self.conversion_service.convert_content(kind, data, target, title, template)
+                return index, arcname, path, None
+            except Exception as e:
+                return index, arcname, None, str(e)
+
+        tasks = [asyncio.ensure_future(render(i, job)) for i, job in enumerate(jobs)]
+        return self._stream(tasks)
+
+    async def _stream(self, tasks: list):
+        """Gerador assíncrono com os bytes do ZIP; relatorio.json no final lista o resultado de cada arquivo"""
+        stream = ZipStreamWriter()
+        report = []
+        try:
+            with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for next_done in asyncio.as_completed(tasks):
+                    index, arcname, path, error = await next_done
+                    if error is not None:
+                        report.append({"index": index, "file": arcname, "success": False, "error": error})
+                        continue
+                    await asyncio.to_thread(zipf.write, path, arcname)
+                    report.append({"index": index, "file": arcname, "success": True})
+                    yield stream.drain()
+
+                report.sort(key=lambda item: item["index"])
+                zipf.writestr("relatorio.json", json.dumps(report, ensure_ascii=False, indent=2))
+            yield stream.drain()
+        finally:
+            # Cliente desconectado: cancelar o que falta e esperar o cancelamento terminar
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,52 @@
+"""
+Acompanhamento de tarefas em segundo plano, para encerrar workers sem perder trabalho em andamento
+"""
+import asyncio
+from typing import Optional
+
+
+class JobTracker:
+    def __init__(self):
+        self._tasks = set()
+        self._accepting = True
+
+    @property
+    def active(self) -> int:
+        """Número de tarefas em andamento"""
+        return len(self._tasks)
+
+    @property
+    def accepting(self) -> bool:
+        """Indica se novas tarefas ainda são aceitas (falso durante o encerramento)"""
+        return self._accepting
+
+    def spawn(self, coro, name: Optional[str] = None) -> asyncio.Task:
+        """Iniciar uma tarefa em segundo plano e acompanhá-la até terminar"""
+        if not self._accepting:
+            coro.close()
+            raise Exception("Servidor em encerramento: novas tarefas não são aceitas")
+
+        task = asyncio.get_running_loop().create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Parar de aceitar tarefas e aguardar as que estão em andamento.
+        Tarefas que não terminarem dentro do prazo são canceladas.
+        Retorna quantas tarefas foram canceladas.
+        """
+        self._accepting = False
+        if not self._tasks:
+            return 0
+
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+
+job_tracker = JobTracker()
@@ -1,22 +1,362 @@
 """
 Serviço para lidar com arquivos grandes
 """
+import gc
+import io
 import os
+import mmap
+import zlib
+import asyncio
 import tempfile
 import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from typing import Optional
-import asyncio
+
+import aiofiles
+
+from config import settings
+from services.tracing import traced, current_span
+
+MB = 1024 * 1024
+
+
+def _rss_bytes() -> int:
+    """Memória residente atual do processo (Linux: /proc/self/statm; senão, o pico)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def _mapped_reader(file_path: str):
+    """
+    PdfReader sobre o arquivo mapeado em memória: as páginas do arquivo são lidas
+    sob demanda pelo sistema (PdfReader(caminho) copiaria o arquivo inteiro para a memória)
+    """
+    from PyPDF2 import PdfReader
+
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield PdfReader(mapped)
+
+
+class MemoryGuard:
+    """
+    Processa páginas em janelas: ao fim de cada janela libera os objetos já lidos do PDF
+    e confere a memória do processo; acima do orçamento, a janela diminui e, se nem
+    página a página couber, o job é interrompido (em vez de o worker ser morto por falta de memória).
+    """
+
+    def __init__(self, budget: int, window: int):
+        self.budget = budget
+        self.window = max(1, window)
+        self.peak = _rss_bytes()
+        self._pending = 0
+
+    def page_done(self, reader):
+        self._pending += 1
+        if self._pending >= self.window:
+            self.release(reader)
+
+    def release(self, reader):
+        """
+        Descartar os objetos resolvidos (voltam a ser lidos do arquivo se forem usados de novo)
+        e as páginas do arquivo mapeado já lidas (continuam no cache do sistema, fora da memória do processo)
+        """
+        self._pending = 0
+        reader.resolved_objects.clear()
+        if isinstance(reader.stream, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+            reader.stream.madvise(mmap.MADV_DONTNEED)
+        gc.collect()
+        rss = _rss_bytes()
+        self.peak = max(self.peak, rss)
+        if rss > self.budget:
+            if self.window == 1:
+                raise Exception(f"Orçamento de memória excedido: {rss // MB} MB (limite {self.budget // MB} MB)")
+            self.window = max(1, self.window // 2)
+
+
+def _extract_text_job(file_path: str, budget: int, window: int, output_path: str) -> dict:
+    """Extrair o texto página a página, gravando direto no arquivo de saída"""
+    guard = MemoryGuard(budget, window)
+    chars = 0
+    with _mapped_reader(file_path) as reader, open(output_path, "w", encoding="utf-8") as output:
+        num_pages = len(reader.pages)
+        for number in range(num_pages):
+            text = (reader.pages[number].extract_text() or "") + ("\n\n" if number < num_pages - 1 else "")
+            output.write(text)
+            chars += len(text)
+            guard.page_done(reader)
+        del reader
+    return {"num_pages": num_pages, "chars": chars, "peak_rss_mb": guard.peak // MB}
+
+
+def _page_keys(reader) -> set:
+    """Referências (número, geração) de todas as páginas do PDF"""
+    return {(page.indirect_ref.idnum, page.indirect_ref.generation)
+            for page in reader.pages if page.indirect_ref is not None}
+
+
+class StreamingPdfWriter:
+    """
+    Grava um PDF objeto a objeto, direto no arquivo: cada objeto alcançado a partir de uma
+    página é escrito assim que lido e não fica em memória (o PdfWriter guardaria todos até o fim).
+    Em memória ficam só o mapa de numeração e as posições para a tabela xref.
+    Streams sem filtro saem comprimidos (FlateDecode). Referências a páginas que não fazem
+    parte da saída (ex.: links para outra parte de um split) viram null.
+    """
+
+    _CATALOG_ID = 1
+    _PAGES_ID = 2
+
+    def __init__(self, output, pages: list, all_page_keys: set):
+        self.output = output
+        self._offsets = {}
+        self._ids = {}
+        self._next_id = self._PAGES_ID + 1
+        self._pending = []
+        self._excluded = all_page_keys
+        self._page_ids = []
+        for page in pages:
+            page_id = self._new_id()
+            self._page_ids.append(page_id)
+            if page.indirect_ref is not None:
+                self._ids[(page.indirect_ref.idnum, page.indirect_ref.generation)] = page_id
+        self._written_pages = 0
+        output.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id - 1
+
+    def _ref(self, reference) -> Optional[int]:
+        """Número do objeto na saída (agendando a gravação na primeira vez que é alcançado)"""
+        key = (reference.idnum, reference.generation)
+        if key in self._ids:
+            return self._ids[key]
+        if key in self._excluded:
+            return None
+        object_id = self._ids[key] = self._new_id()
+        self._pending.append((object_id, reference))
+        return object_id
+
+    def _serialize(self, obj, out):
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+        if isinstance(obj, IndirectObject):
+            object_id = self._ref(obj)
+            out.write(b"null" if object_id is None else b"%d 0 R" % object_id)
+        elif isinstance(obj, DictionaryObject):
+            out.write(b"<<")
+            for key, value in obj.items():
+                key.write_to_stream(out, None)
+                out.write(b" ")
+                self._serialize(value, out)
+                out.write(b"\n")
+            out.write(b">>")
+        elif isinstance(obj, ArrayObject):
+            out.write(b"[")
+            for i, value in enumerate(obj):
+                if i:
+                    out.write(b" ")
+                self._serialize(value, out)
+            out.write(b"]")
+        elif obj is None:
+            out.write(b"null")
+        else:
+            obj.write_to_stream(out, None)
+
+    def _write_object(self, object_id: int, obj, extra: bytes = b""):
+        """Gravar um objeto; extra é acrescentado ao final de um dicionário (ex.: /Parent)"""
+        from PyPDF2.generic import DictionaryObject, NameObject, NumberObject, StreamObject
+
+        self._offsets[object_id] = self.output.tell()
+        self.output.write(b"%d 0 obj\n" % object_id)
+        if isinstance(obj, DictionaryObject) and obj.get("/Type") == "/Pages":
+            # Nós intermediários da árvore original não são copiados
+            obj = None
+        header = io.BytesIO()
+        if isinstance(obj, StreamObject):
+            data = obj._data  # bytes como estão no arquivo (já decifrados pelo leitor)
+            entries = DictionaryObject({key: value for key, value in obj.items() if key != "/Length"})
+            if "/Filter" not in obj:
+                data = zlib.compress(data)
+                entries[NameObject("/Filter")] = NameObject("/FlateDecode")
+            entries[NameObject("/Length")] = NumberObject(len(data))
+            self._serialize(entries, header)
+            self.output.write(header.getvalue())
+            self.output.write(b"\nstream\n")
+            self.output.write(data)
+            self.output.write(b"\nendstream")
+        else:
+            self._serialize(obj, header)
+            value = header.getvalue()
+            if extra and value.endswith(b">>"):
+                value = value[:-2] + extra + b">>"
+            self.output.write(value)
+        self.output.write(b"\nendobj\n")
+
+    def add_page(self, page):
+        """Gravar a próxima página e todos os objetos que ela usa e ainda não foram gravados"""
+        from PyPDF2.generic import DictionaryObject
+
+        page_id = self._page_ids[self._written_pages]
+        self._written_pages += 1
+        entries = DictionaryObject({key: value for key, value in page.items() if key != "/Parent"})
+        self._write_object(page_id, entries, b"/Parent %d 0 R" % self._PAGES_ID)
+        while self._pending:
+            object_id, reference = self._pending.pop()
+            self._write_object(object_id, reference.get_object())
+
+    def close(self):
+        """Gravar a árvore de páginas, o catálogo, a tabela xref e o trailer"""
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self._page_ids[:self._written_pages])
+        self._offsets[self._PAGES_ID] = self.output.tell()
+        self.output.write(b"%d 0 obj\n<</Type /Pages /Kids [%s] /Count %d>>\nendobj\n"
+                          % (self._PAGES_ID, kids, self._written_pages))
+        self._offsets[self._CATALOG_ID] = self.output.tell()
+        self.output.write(b"%d 0 obj\n<</Type /Catalog /Pages %d 0 R>>\nendobj\n"
+                          % (self._CATALOG_ID, self._PAGES_ID))
+
+        xref_offset = self.output.tell()
+        self.output.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_id)
+        for object_id in range(1, self._next_id):
+            offset = self._offsets.get(object_id)
+            self.output.write(b"%010d 00000 n \n" % offset if offset is not None else b"0000000000 65535 f \n")
+        self.output.write(b"trailer\n<</Size %d /Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n"
+                          % (self._next_id, self._CATALOG_ID, xref_offset))
+
+
+def _write_pages(reader, numbers: range, output_path: str, guard: MemoryGuard):
+    """Gravar as páginas indicadas em um novo PDF, liberando a memória a cada janela"""
+    pages = [reader.pages[number] for number in numbers]
+    with open(output_path, "wb") as output:
+        writer = StreamingPdfWriter(output, pages, _page_keys(reader))
+        for page in pages:
+            writer.add_page(page)
+            guard.page_done(reader)
+        writer.close()
+    guard.release(reader)
+
+
+def _split_job(file_path: str, pages_per_chunk: int, output_dir: str, budget: int, window: int) -> dict:
+    """Gravar cada parte (em output_dir, exclusivo do job) objeto a objeto, sem montá-la em memória"""
+    guard = MemoryGuard(budget, window)
+    chunks = []
+    with _mapped_reader(file_path) as reader:
+        num_pages = len(reader.pages)
+        if num_pages <= pages_per_chunk:
+            return {"num_pages": num_pages, "chunks": [file_path], "peak_rss_mb": guard.peak // MB}
+        for start in range(0, num_pages, pages_per_chunk):
+            end = min(start + pages_per_chunk, num_pages)
+            chunk_path = os.path.join(output_dir, f"chunk_{start}_{end}.pdf")
+            _write_pages(reader, range(start, end), chunk_path, guard)
+            chunks.append(chunk_path)
+        del reader
+    return {"num_pages": num_pages, "chunks": chunks, "peak_rss_mb": guard.peak // MB}
+
+
+def _compress_job(file_path: str, output_path: str, budget: int, window: int) -> dict:
+    """
+    Regravar o PDF objeto a objeto comprimindo os streams sem filtro. Nem o original nem
+    a saída ficam em memória: cada janela de páginas é gravada e liberada antes da próxima.
+    """
+    guard = MemoryGuard(budget, window)
+    with _mapped_reader(file_path) as reader:
+        num_pages = len(reader.pages)
+        _write_pages(reader, range(num_pages), output_path, guard)
+        del reader
+    return {"num_pages": num_pages, "peak_rss_mb": max(guard.peak, _rss_bytes()) // MB}
+
 
 class LargeFileHandler:
-    def __init__(self, max_size: int = 25 * 1024 * 1024):
-        self.max_size = max_size
+    def __init__(self, max_size: Optional[int] = None, max_workers: Optional[int] = None):
+        self.max_size = max_size or settings.LARGE_FILE_MAX_SIZE
         self.temp_dir = tempfile.gettempdir()
+        self.max_workers = max_workers or settings.LARGE_FILE_WORKERS
+        self._executor = None
+        self._executor_lock = threading.Lock()
+    
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """
+        Pool de processos para o modo com memória limitada (spawn; um job por processo,
+        assim a memória de cada PDF volta para o sistema ao terminar)
+        """
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                        max_tasks_per_child=1
+                    )
+        return self._executor
     
+    async def _run_bounded(self, job, *args) -> dict:
+        """Executar um job com memória limitada no pool de processos"""
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, job, *args)
+        except BrokenProcessPool:
+            # O processo morreu (ex.: OOM do sistema): recriar o pool na próxima chamada
+            self._executor = None
+            raise Exception("Processo de PDF encerrado inesperadamente (memória insuficiente?)")
+        current_span().set_attributes({"pdf.pages": result["num_pages"], "process.peak_rss_mb": result["peak_rss_mb"]})
+        return result
+    
+    @traced()
+    async def extract_text_bounded(self, file_path: str, output_path: str) -> dict:
+        """Extrair texto de um PDF grande para output_path, com memória limitada"""
+        try:
+            return await self._run_bounded(_extract_text_job, file_path, settings.LARGE_FILE_RSS_BUDGET,
+                                           settings.LARGE_FILE_PAGE_WINDOW, output_path)
+        except Exception as e:
+            raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
+    
+    @traced()
+    async def split_bounded(self, file_path: str, pages_per_chunk: int) -> list:
+        """Dividir PDF grande em partes de pages_per_chunk páginas, com memória limitada"""
+        # Pasta própria do job: divisões simultâneas do mesmo documento não se sobrescrevem
+        chunk_dir = tempfile.mkdtemp(prefix="split_", dir=self.temp_dir)
+        try:
+            result = await self._run_bounded(_split_job, file_path, max(1, pages_per_chunk), chunk_dir,
+                                             settings.LARGE_FILE_RSS_BUDGET, settings.LARGE_FILE_PAGE_WINDOW)
+        except Exception as e:
+            # Remover as partes já gravadas (ex.: limite de memória atingido no meio)
+            await asyncio.to_thread(shutil.rmtree, chunk_dir, True)
+            raise Exception(f"Erro ao dividir PDF: {str(e)}")
+        if result["chunks"] == [file_path]:
+            await asyncio.to_thread(shutil.rmtree, chunk_dir, True)
+        return result["chunks"]
+    
+    @traced()
+    async def compress_bounded(self, file_path: str, output_path: str) -> dict:
+        """Comprimir PDF grande, com memória limitada"""
+        try:
+            return await self._run_bounded(_compress_job, file_path, output_path, settings.LARGE_FILE_RSS_BUDGET,
+                                           settings.LARGE_FILE_PAGE_WINDOW)
+        except Exception as e:
+            raise Exception(f"Erro ao comprimir PDF: {str(e)}")
+    
+    def shutdown(self):
+        """Encerrar o pool de processos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+    
+    @traced()
     async def save_large_file(self, file_content: bytes, filename: str) -> Optional[str]:
         """
         Salva arquivo grande em chunks para evitar timeout
         """
         try:
+            current_span().set_attribute("file.size", len(file_content))
             if len(file_content) > self.max_size:
                 return None
             
@@ -26,12 +366,10 @@ class LargeFileHandler:
             # Salvar em chunks para não sobrecarregar a memória
             chunk_size = 1024 * 1024  # 1MB por chunk
             
-            with open(temp_path, 'wb') as f:
+            # Gravação assíncrona: o event loop segue atendendo outras requisições
+            async with aiofiles.open(temp_path, 'wb') as f:
                 for i in range(0, len(file_content), chunk_size):
-                    chunk = file_content[i:i + chunk_size]
-                    f.write(chunk)
-                    # Pequena pausa para não sobrecarregar
-                    await asyncio.sleep(0.01)
+                    await f.write(file_content[i:i + chunk_size])
             
             return temp_path
             
@@ -49,6 +387,17 @@ class LargeFileHandler:
         except Exception as e:
             print(f"Erro ao limpar arquivo temporário: {e}")
     
+    def cleanup_chunks(self, chunks: list):
+        """
+        Remove as partes geradas por split_large_pdf/split_bounded e a pasta do job
+        """
+        for chunk in chunks:
+            self.cleanup_temp_file(chunk)
+        chunk_dirs = {os.path.dirname(chunk) for chunk in chunks}
+        for chunk_dir in chunk_dirs:
+            if os.path.dirname(chunk_dir) == self.temp_dir and os.path.basename(chunk_dir).startswith("split_"):
+                shutil.rmtree(chunk_dir, ignore_errors=True)
+    
     def get_file_info(self, file_path: str) -> dict:
         """
         Obtém informações do arquivo
@@ -68,6 +417,7 @@ class LargeFileHandler:
                 "error": str(e)
             }
     
+    @traced()
     def split_large_pdf(self, file_path: str, max_pages: int = 50) -> list:
         """
         Divide PDF grande em partes menores
@@ -81,24 +431,26 @@ class LargeFileHandler:
             if total_pages <= max_pages:
                 return [file_path]
             
-            # Dividir em chunks
+            # Dividir em chunks (pasta própria: divisões simultâneas do mesmo arquivo não se sobrescrevem)
+            chunk_dir = tempfile.mkdtemp(prefix="split_", dir=self.temp_dir)
             chunks = []
-            for start in range(0, total_pages, max_pages):
-                end = min(start + max_pages, total_pages)
-                
-                writer = PdfWriter()
-                for page_num in range(start, end):
-                    writer.add_page(reader.pages[page_num])
-                
-                chunk_path = os.path.join(
-                    self.temp_dir, 
-                    f"chunk_{start}_{end}_{os.path.basename(file_path)}"
-                )
-                
-                with open(chunk_path, 'wb') as output_file:
-                    writer.write(output_file)
-                
-                chunks.append(chunk_path)
+            try:
+                for start in range(0, total_pages, max_pages):
+                    end = min(start + max_pages, total_pages)
+                    
+                    writer = PdfWriter()
+                    for page_num in range(start, end):
+                        writer.add_page(reader.pages[page_num])
+                    
+                    chunk_path = os.path.join(chunk_dir, f"chunk_{start}_{end}.pdf")
+                    
+                    with open(chunk_path, 'wb') as output_file:
+                        writer.write(output_file)
+                    
+                    chunks.append(chunk_path)
+            except Exception:
+                shutil.rmtree(chunk_dir, ignore_errors=True)
+                raise
             
             return chunks
             
@@ -106,6 +458,7 @@ class LargeFileHandler:
             print(f"Erro ao dividir PDF: {e}")
             return [file_path]
     
+    @traced()
     def compress_pdf(self, file_path: str) -> Optional[str]:
         """
         Comprime PDF para reduzir tamanho
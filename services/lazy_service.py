@@ -0,0 +1,45 @@
+"""
+Carregamento sob demanda de serviços (e das bibliotecas pesadas que eles importam)
+"""
+import importlib
+import threading
+import time
+
+
+class LazyService:
+    """
+    Proxy que importa o módulo e cria o serviço apenas no primeiro uso.
+    Os atributos são repassados ao serviço real, então o proxy pode ser
+    usado no lugar da instância.
+    """
+
+    # Tempo de carga (ms) de cada serviço já inicializado, para diagnóstico
+    load_times = {}
+
+    def __init__(self, module_name: str, class_name: str, **kwargs):
+        self._module_name = module_name
+        self._class_name = class_name
+        self._kwargs = kwargs
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def load(self):
+        """Importar o módulo e criar a instância (uma única vez)"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._module_name)
+                    instance = getattr(module, self._class_name)(**self._kwargs)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    LazyService.load_times[self._class_name] = round(elapsed, 1)
+                    print(f"Serviço {self._class_name} carregado em {elapsed:.0f} ms")
+                    self._instance = instance
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
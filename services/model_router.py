@@ -0,0 +1,126 @@
+"""
+Escolha do modelo de IA por operação: regras (operação -> perfil -> modelos por provedor)
+e estatísticas observadas de latência, custo e falhas de cada modelo
+"""
+import time
+import threading
+from typing import Optional
+
+from config import settings
+from services.ai_limiter import current_priority, PRIORITY_INTERACTIVE
+
+# O que cada perfil otimiza: "latency" (mais rápido), "cost" (mais barato) ou "quality" (ordem configurada)
+TIER_OBJECTIVES = {
+    "fast": "latency",
+    "standard": "cost",
+    "strong": "quality",
+}
+
+# Tokens assumidos para modelos ainda sem chamadas registradas (estimativa de custo)
+DEFAULT_INPUT_TOKENS = 1000
+DEFAULT_OUTPUT_TOKENS = 500
+# Taxa de falhas (média móvel) a partir da qual o modelo vai para o fim da fila
+FAILURE_THRESHOLD = 0.5
+# Sem chamadas novas, a taxa de falhas cai pela metade a cada FAILURE_HALF_LIFE segundos:
+# um modelo que foi para o fim da fila volta à sua posição depois que o problema passa
+FAILURE_HALF_LIFE = 60.0
+
+
+class ModelRouter:
+    def __init__(self, routes: Optional[dict] = None, tiers: Optional[dict] = None, prices: Optional[dict] = None):
+        self.routes = routes or settings.AI_ROUTES
+        self.tiers = tiers or settings.AI_MODEL_TIERS
+        self.prices = prices or settings.AI_MODEL_PRICES
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def tier_for(self, operation: str) -> str:
+        """Perfil da operação (operações sem regra usam "standard")"""
+        tier = self.routes.get(operation, self.routes.get("default", "standard"))
+        return tier if tier in self.tiers else "standard"
+
+    def candidates(self, operation: str, providers: list) -> list:
+        """
+        Modelos a tentar, em ordem: [(provedor, modelo)].
+        providers: provedores configurados, na ordem de preferência.
+        """
+        tier = self.tier_for(operation)
+        objective = TIER_OBJECTIVES.get(tier, "quality")
+        # Trabalhos em lote não têm ninguém esperando: priorizar o custo
+        if objective == "latency" and current_priority() > PRIORITY_INTERACTIVE:
+            objective = "cost"
+
+        options = []
+        for provider in providers:
+            models = self.tiers[tier].get(provider) or []
+            options.extend((provider, model) for model in ([models] if isinstance(models, str) else models))
+
+        now = time.monotonic()
+        with self._lock:
+            ranked = [(self._failing(option, now), self._score(option, objective), position, option)
+                      for position, option in enumerate(options)]
+        return [option for *_, option in sorted(ranked)]
+
+    def _failing(self, option: tuple, now: float) -> bool:
+        stats = self._stats.get(option)
+        return bool(stats) and _failure_rate(stats, now) >= FAILURE_THRESHOLD
+
+    def _score(self, option: tuple, objective: str) -> float:
+        """Menor é melhor; modelos sem histórico ficam na frente (para serem medidos)"""
+        stats = self._stats.get(option)
+        if objective == "latency":
+            return stats["latency"] if stats and stats["latency"] is not None else 0.0
+        if objective == "cost":
+            input_tokens = stats["input_tokens"] / stats["calls"] if stats and stats["calls"] else DEFAULT_INPUT_TOKENS
+            output_tokens = stats["output_tokens"] / stats["calls"] if stats and stats["calls"] else DEFAULT_OUTPUT_TOKENS
+            cost = self.cost(option[1], input_tokens, output_tokens)
+            return cost if cost is not None else float("inf")
+        return 0.0
+
+    def cost(self, model: str, input_tokens: float, output_tokens: float) -> Optional[float]:
+        """Custo estimado em dólares (None se o preço do modelo não estiver configurado)"""
+        price = self.prices.get(model)
+        if price is None:
+            return None
+        return (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+    def record(self, provider: str, model: str, latency: float, input_tokens: int = 0, output_tokens: int = 0,
+               failed: bool = False):
+        """Registrar o resultado de uma chamada"""
+        with self._lock:
+            now = time.monotonic()
+            stats = self._stats.setdefault((provider, model), {
+                "calls": 0, "failures": 0, "failure_rate": 0.0, "failure_updated": now, "latency": None,
+                "input_tokens": 0, "output_tokens": 0, "cost": 0.0
+            })
+            stats["failure_rate"] = 0.8 * _failure_rate(stats, now) + (0.2 if failed else 0.0)
+            stats["failure_updated"] = now
+            if failed:
+                stats["failures"] += 1
+                return
+            stats["calls"] += 1
+            stats["latency"] = latency if stats["latency"] is None else 0.8 * stats["latency"] + 0.2 * latency
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost"] += self.cost(model, input_tokens, output_tokens) or 0.0
+
+    def snapshot(self) -> dict:
+        """Regras e estatísticas por modelo (para monitoramento)"""
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                f"{provider}:{model}": {
+                    **{key: value for key, value in stats.items()
+                       if key not in ("latency", "cost", "failure_rate", "failure_updated")},
+                    "latency": round(stats["latency"], 3) if stats["latency"] is not None else None,
+                    "failure_rate": round(_failure_rate(stats, now), 3),
+                    "cost": round(stats["cost"], 6)
+                }
+                for (provider, model), stats in self._stats.items()
+            }
+        return {"routes": self.routes, "tiers": self.tiers, "models": models}
+
+
+def _failure_rate(stats: dict, now: float) -> float:
+    """Taxa de falhas com o decaimento do tempo passado desde a última chamada"""
+    return stats["failure_rate"] * 0.5 ** ((now - stats["failure_updated"]) / FAILURE_HALF_LIFE)
@@ -0,0 +1,130 @@
+"""
+Extração de texto com OCR para PDFs digitalizados (apenas nas páginas sem texto nativo)
+"""
+import os
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from config import settings
+
+
+def file_hash(file_path: str) -> str:
+    """Hash SHA-256 do conteúdo do arquivo (lido em blocos)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _ocr_page(args: tuple) -> str:
+    """Rasterizar uma única página e reconhecer o texto (executado em outro processo)"""
+    file_path, page_number, dpi, lang = args
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True)
+    return "\n".join(pytesseract.image_to_string(image, lang=lang) for image in images).strip()
+
+
+class OCRService:
+    def __init__(self, cache_dir: Optional[str] = None, dpi: int = 300, lang: Optional[str] = None,
+                 max_workers: Optional[int] = None, min_chars: int = 20):
+        self.cache_dir = cache_dir or settings.OCR_CACHE_DIR
+        self.dpi = dpi
+        self.lang = lang or settings.OCR_LANG
+        self.max_workers = max_workers or settings.OCR_WORKERS
+        # Páginas com menos caracteres nativos que isso são tratadas como imagem
+        self.min_chars = min_chars
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """
+        Pool de processos criado no primeiro uso e compartilhado por todas as requisições
+        (o total de processos de OCR fica limitado a OCR_WORKERS)
+        """
+        if self._executor is None:
+            # Primeiras chamadas simultâneas (threads do to_thread) não podem criar dois pools
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def _cache_path(self, doc_hash: str, page_number: int, dpi: int, lang: str) -> str:
+        """Arquivo de cache do texto OCR de uma página"""
+        return os.path.join(self.cache_dir, f"{doc_hash}_{page_number}_{dpi}_{lang}.txt")
+
+    def extract_text(self, file_path: str, dpi: Optional[int] = None, lang: Optional[str] = None) -> dict:
+        """
+        Extrair texto combinando texto nativo e OCR.
+        Só as páginas sem texto nativo são rasterizadas, em paralelo,
+        e o resultado de cada página fica em cache por documento/página/DPI/idioma.
+        """
+        try:
+            from PyPDF2 import PdfReader
+
+            dpi = dpi or self.dpi
+            lang = lang or self.lang
+            if not settings.OCR_MIN_DPI <= dpi <= settings.OCR_MAX_DPI:
+                raise Exception(f"DPI deve estar entre {settings.OCR_MIN_DPI} e {settings.OCR_MAX_DPI}")
+
+            reader = PdfReader(file_path)
+            page_texts = [(page.extract_text() or "").strip() for page in reader.pages]
+            image_pages = [i + 1 for i, text in enumerate(page_texts) if len(text) < self.min_chars]
+
+            sources = ["native"] * len(page_texts)
+            pending = []
+            if image_pages:
+                doc_hash = file_hash(file_path)
+                for page_number in image_pages:
+                    cache_path = self._cache_path(doc_hash, page_number, dpi, lang)
+                    if os.path.exists(cache_path):
+                        with open(cache_path, "r", encoding="utf-8") as f:
+                            page_texts[page_number - 1] = f.read()
+                        sources[page_number - 1] = "cache"
+                    else:
+                        pending.append(page_number)
+
+            if pending:
+                self._check_dependencies()
+                jobs = [(file_path, page_number, dpi, lang) for page_number in pending]
+                results = list(self.executor.map(_ocr_page, jobs))
+
+                for page_number, text in zip(pending, results):
+                    page_texts[page_number - 1] = text
+                    sources[page_number - 1] = "ocr"
+                    with open(self._cache_path(doc_hash, page_number, dpi, lang), "w", encoding="utf-8") as f:
+                        f.write(text)
+
+            return {
+                "text": "\n\n".join(text for text in page_texts if text),
+                "num_pages": len(page_texts),
+                "ocr_pages": len(pending),
+                "cached_pages": sources.count("cache"),
+                "pages": [{"page": i + 1, "source": source} for i, source in enumerate(sources)]
+            }
+        except Exception as e:
+            raise Exception(f"Erro ao extrair texto com OCR: {str(e)}")
+
+    def shutdown(self):
+        """Encerrar o pool de processos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _check_dependencies(self):
+        """Verificar se pytesseract/Tesseract e pdf2image/Poppler estão disponíveis"""
+        try:
+            import pytesseract
+            import pdf2image
+            pytesseract.get_tesseract_version()
+        except Exception:
+            raise Exception("OCR requer pytesseract com Tesseract e pdf2image com Poppler instalados")
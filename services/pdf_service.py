@@ -1,15 +1,35 @@
 import os
+import uuid
+import hashlib
+from typing import Optional
 from PyPDF2 import PdfReader, PdfWriter, PdfMerger
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.colors import Color
 import io
 
+from services.tracing import span, traced, current_span
+
+# Referências de volta na árvore do documento (não fazem parte dos recursos da página)
+_BACK_REFERENCES = {"/Parent", "/P"}
+# Programas de fonte embutidos: o texto extraído depende da codificação, não dos glifos
+_FONT_PROGRAMS = {"/FontFile", "/FontFile2", "/FontFile3"}
+
 class PDFService:
+    def _open(self, file_path: str) -> PdfReader:
+        """Abrir o PDF, registrando tamanho e número de páginas no trace"""
+        with span("PdfReader", attributes={"file.size": os.path.getsize(file_path)}) as active:
+            reader = PdfReader(file_path)
+            active.set_attribute("pdf.pages", len(reader.pages))
+        current_span().set_attribute("pdf.pages", len(reader.pages))
+        return reader
+    
+    @traced()
     def extract_text(self, file_path: str) -> str:
         """Extrair texto de um PDF"""
         try:
-            reader = PdfReader(file_path)
+            reader = self._open(file_path)
             text = ""
             for page in reader.pages:
                 text += page.extract_text() + "\n\n"
@@ -17,14 +37,95 @@ class PDFService:
         except Exception as e:
             raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
     
+    def _object_digest(self, obj, memo: dict, skip_data: bool = False) -> bytes:
+        """
+        Hash de um objeto do PDF e de tudo o que ele referencia (fontes com /Encoding e /ToUnicode,
+        Form XObjects e seus próprios recursos...). memo evita recalcular objetos compartilhados entre páginas.
+        """
+        if isinstance(obj, IndirectObject):
+            ref = (obj.idnum, obj.generation)
+            if ref not in memo:
+                memo[ref] = b"ciclo"
+                memo[ref] = self._object_digest(obj.get_object(), memo, skip_data)
+            return memo[ref]
+        
+        digest = hashlib.sha256()
+        if isinstance(obj, DictionaryObject):
+            digest.update(b"<<")
+            for name in sorted(obj.keys()):
+                if name in _BACK_REFERENCES:
+                    continue
+                digest.update(name.encode("utf-8"))
+                digest.update(self._object_digest(obj.raw_get(name), memo, name in _FONT_PROGRAMS))
+            # Imagens e programas de fonte não mudam o texto extraído: basta o dicionário
+            if isinstance(obj, StreamObject) and not skip_data and obj.get("/Subtype") != "/Image":
+                digest.update(obj.get_data())
+        elif isinstance(obj, ArrayObject):
+            digest.update(b"[")
+            for item in obj:
+                digest.update(self._object_digest(item, memo, skip_data))
+        else:
+            digest.update(f"{type(obj).__name__}:{obj!r}".encode("utf-8"))
+        return digest.digest()
+    
+    def _page_fingerprint(self, page, memo: Optional[dict] = None) -> bytes:
+        """
+        Hash do que determina o texto de uma página: fluxos de conteúdo, rotação e os recursos
+        efetivos (herdados inclusive), com fontes, codificações e Form XObjects
+        """
+        memo = {} if memo is None else memo
+        digest = hashlib.sha256()
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+        digest.update(f"rotate:{page.get('/Rotate', 0)}".encode("utf-8"))
+        
+        # O PdfReader copia /Resources herdados da árvore de páginas para cada página
+        resources = page.raw_get("/Resources") if "/Resources" in page else None
+        if resources is not None:
+            digest.update(self._object_digest(resources, memo))
+        return digest.digest()
+    
+    @traced()
+    def extract_pages_incremental(self, file_path: str, unit_cache) -> dict:
+        """
+        Extrair o texto de cada página reaproveitando páginas já extraídas antes
+        (mesmo conteúdo, em qualquer documento); só as páginas alteradas são processadas.
+        """
+        try:
+            from services.unit_cache import unit_key
+            
+            reader = self._open(file_path)
+            memo = {}
+            keys = [unit_key("pdf-page", self._page_fingerprint(page, memo)) for page in reader.pages]
+            known = unit_cache.get_many(keys)
+            
+            pages = []
+            new_results = {}
+            for page, key in zip(reader.pages, keys):
+                if key not in known and key not in new_results:
+                    new_results[key] = page.extract_text()
+                pages.append(known[key] if key in known else new_results[key])
+            unit_cache.put_many(new_results)
+            current_span().set_attribute("pdf.pages_reused", sum(1 for key in keys if key in known))
+            
+            return {
+                "pages": pages,
+                "reused": sum(1 for key in keys if key in known)
+            }
+        except Exception as e:
+            raise Exception(f"Erro ao extrair texto do PDF: {str(e)}")
+    
+    @traced()
     def merge_pdfs(self, file_paths: list, output_dir: str) -> str:
         """Mesclar múltiplos PDFs"""
         try:
+            current_span().set_attribute("pdf.files", len(file_paths))
             merger = PdfMerger()
             for pdf in file_paths:
                 merger.append(pdf)
             
-            output_path = os.path.join(output_dir, "merged.pdf")
+            output_path = os.path.join(output_dir, f"{uuid.uuid4().hex}.pdf")
             merger.write(output_path)
             merger.close()
             
@@ -32,17 +133,18 @@ class PDFService:
         except Exception as e:
             raise Exception(f"Erro ao mesclar PDFs: {str(e)}")
     
+    @traced()
     def split_pdf(self, file_path: str, pages: list, output_dir: str) -> str:
         """Dividir PDF em páginas específicas"""
         try:
-            reader = PdfReader(file_path)
+            reader = self._open(file_path)
             writer = PdfWriter()
             
             for page_num in pages:
                 if 0 < page_num <= len(reader.pages):
                     writer.add_page(reader.pages[page_num - 1])
             
-            output_path = os.path.join(output_dir, "split.pdf")
+            output_path = os.path.join(output_dir, f"{uuid.uuid4().hex}.pdf")
             with open(output_path, "wb") as output_file:
                 writer.write(output_file)
             
@@ -50,34 +152,38 @@ class PDFService:
         except Exception as e:
             raise Exception(f"Erro ao dividir PDF: {str(e)}")
     
+    def _watermark_page(self, watermark_text: str):
+        """Página com a marca d'água, gerada em memória"""
+        packet = io.BytesIO()
+        can = canvas.Canvas(packet, pagesize=letter)
+        can.setFont("Helvetica", 40)
+        can.setFillColor(Color(0.5, 0.5, 0.5, alpha=0.3))
+        can.saveState()
+        can.translate(300, 400)
+        can.rotate(45)
+        can.drawCentredString(0, 0, watermark_text)
+        can.restoreState()
+        can.save()
+        
+        packet.seek(0)
+        return PdfReader(packet).pages[0]
+    
+    @traced()
     def add_watermark(self, file_path: str, watermark_text: str, output_dir: str) -> str:
         """Adicionar marca d'água ao PDF"""
         try:
             # Criar marca d'água
-            packet = io.BytesIO()
-            can = canvas.Canvas(packet, pagesize=letter)
-            can.setFont("Helvetica", 40)
-            can.setFillColor(Color(0.5, 0.5, 0.5, alpha=0.3))
-            can.saveState()
-            can.translate(300, 400)
-            can.rotate(45)
-            can.drawCentredString(0, 0, watermark_text)
-            can.restoreState()
-            can.save()
-            
-            packet.seek(0)
-            watermark_pdf = PdfReader(packet)
-            watermark_page = watermark_pdf.pages[0]
+            watermark_page = self._watermark_page(watermark_text)
             
             # Aplicar marca d'água em todas as páginas
-            reader = PdfReader(file_path)
+            reader = self._open(file_path)
             writer = PdfWriter()
             
             for page in reader.pages:
                 page.merge_page(watermark_page)
                 writer.add_page(page)
             
-            output_path = os.path.join(output_dir, "watermarked.pdf")
+            output_path = os.path.join(output_dir, f"{uuid.uuid4().hex}.pdf")
             with open(output_path, "wb") as output_file:
                 writer.write(output_file)
             
@@ -85,10 +191,70 @@ class PDFService:
         except Exception as e:
             raise Exception(f"Erro ao adicionar marca d'água: {str(e)}")
     
+    @traced()
+    def run_pipeline(self, file_paths: list, steps: list, output_path: str) -> dict:
+        """
+        Executar uma sequência de operações (merge, split, watermark, compress)
+        sobre as páginas em memória, gravando apenas o resultado final.
+        O pipeline começa com as páginas do primeiro arquivo; merge acrescenta os demais.
+        """
+        try:
+            if not file_paths:
+                raise Exception("Nenhum arquivo de entrada")
+            readers = [self._open(path) for path in file_paths]
+            pages = list(readers[0].pages)
+            merged = {0}
+            compress = False
+            
+            for i, step in enumerate(steps):
+                op = step.get("op") if isinstance(step, dict) else None
+                if op == "merge":
+                    # "inputs": posições (a partir de 1) dos arquivos a acrescentar; padrão: os restantes
+                    positions = step.get("inputs") or [n + 1 for n in range(len(readers)) if n not in merged]
+                    for position in positions:
+                        if not 0 < position <= len(readers):
+                            raise Exception(f"Etapa {i + 1}: arquivo de entrada inválido: {position}")
+                        pages.extend(readers[position - 1].pages)
+                        merged.add(position - 1)
+                elif op == "split":
+                    selected = step.get("pages") or []
+                    pages = [pages[n - 1] for n in selected if 0 < n <= len(pages)]
+                    if not pages:
+                        raise Exception(f"Etapa {i + 1}: nenhuma página selecionada")
+                elif op == "watermark":
+                    if not step.get("text"):
+                        raise Exception(f"Etapa {i + 1}: informe o texto da marca d'água")
+                    watermark_page = self._watermark_page(step["text"])
+                    # A mesma página pode aparecer mais de uma vez: aplicar uma única vez por objeto
+                    for page in {id(page): page for page in pages}.values():
+                        page.merge_page(watermark_page)
+                elif op == "compress":
+                    # Compressão dos fluxos de conteúdo é feita ao gravar, depois de todas as etapas
+                    compress = True
+                else:
+                    raise Exception(f"Etapa {i + 1}: operação não suportada: {op}")
+            
+            if len(merged) < len(readers):
+                raise Exception("Use a operação merge para combinar vários arquivos")
+            
+            writer = PdfWriter()
+            for page in pages:
+                writer.add_page(page)
+            if compress:
+                for page in writer.pages:
+                    page.compress_content_streams()
+            
+            with open(output_path, "wb") as output_file:
+                writer.write(output_file)
+            
+            return {"num_pages": len(pages), "steps": len(steps)}
+        except Exception as e:
+            raise Exception(f"Erro ao executar pipeline: {str(e)}")
+    
     def get_pdf_info(self, file_path: str) -> dict:
         """Obter informações do PDF"""
         try:
-            reader = PdfReader(file_path)
+            reader = self._open(file_path)
             return {
                 "num_pages": len(reader.pages),
                 "metadata": reader.metadata,
@@ -1,48 +1,286 @@
 import os
+import io
+import copy
+import posixpath
+import threading
+import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Optional
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.enum.text import PP_ALIGN
 
+from config import settings
+from services.tracing import traced, current_span
+
+# Namespaces do OOXML usados na extração rápida
+_NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+_NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+_REL_NOTES = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+
+_A_P = f"{{{_NS_A}}}p"
+_A_T = f"{{{_NS_A}}}t"
+_A_BR = f"{{{_NS_A}}}br"
+_A_TBL = f"{{{_NS_A}}}tbl"
+_A_TR = f"{{{_NS_A}}}tr"
+_A_TC = f"{{{_NS_A}}}tc"
+_P_SP = f"{{{_NS_P}}}sp"
+_P_PH = f"{{{_NS_P}}}ph"
+
+# Placeholders que não fazem parte do conteúdo (número, data, rodapé...)
+_SKIPPED_PLACEHOLDERS = {"sldNum", "dt", "ftr", "hdr", "sldImg"}
+_TITLE_PLACEHOLDERS = {"title", "ctrTitle"}
+
+
+def _read_rels(zf: zipfile.ZipFile, part_name: str) -> dict:
+    """Ler relacionamentos de uma parte do pacote: rId -> (tipo, caminho)"""
+    rels_name = posixpath.join(posixpath.dirname(part_name), "_rels", posixpath.basename(part_name) + ".rels")
+    try:
+        root = ET.fromstring(zf.read(rels_name))
+    except KeyError:
+        return {}
+    
+    base_dir = posixpath.dirname(part_name)
+    rels = {}
+    for rel in root.iter(f"{{{_NS_PKG_REL}}}Relationship"):
+        target = rel.get("Target", "")
+        if rel.get("TargetMode") == "External":
+            continue
+        if target.startswith("/"):
+            path = target.lstrip("/")
+        else:
+            path = posixpath.normpath(posixpath.join(base_dir, target))
+        rels[rel.get("Id")] = (rel.get("Type"), path)
+    return rels
+
+
+def _parse_slide_xml(stream) -> dict:
+    """Ler título, textos e tabelas de um slide em streaming (iterparse)"""
+    title = ""
+    content = []
+    tables = []
+    
+    paragraphs = []
+    ph_type = None
+    table_depth = 0
+    cell_paragraphs = []
+    row = []
+    rows = []
+    
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == _P_SP:
+                paragraphs = []
+                ph_type = None
+            elif tag == _A_TBL:
+                table_depth += 1
+                rows = []
+            continue
+        
+        if tag == _A_P:
+            parts = []
+            for node in elem.iter():
+                if node.tag == _A_T:
+                    parts.append(node.text or "")
+                elif node.tag == _A_BR:
+                    parts.append("\n")
+            if table_depth:
+                cell_paragraphs.append("".join(parts))
+            else:
+                paragraphs.append("".join(parts))
+            elem.clear()
+        elif tag == _P_PH:
+            ph_type = elem.get("type", "body")
+        elif tag == _A_TC:
+            row.append("\n".join(cell_paragraphs))
+            cell_paragraphs = []
+        elif tag == _A_TR:
+            rows.append(row)
+            row = []
+        elif tag == _A_TBL:
+            table_depth -= 1
+            tables.append(rows)
+            rows = []
+            elem.clear()
+        elif tag == _P_SP:
+            text = "\n".join(paragraphs)
+            if ph_type in _TITLE_PLACEHOLDERS and not title:
+                title = text
+            elif ph_type not in _SKIPPED_PLACEHOLDERS and text.strip():
+                content.append(text)
+            paragraphs = []
+            ph_type = None
+            elem.clear()
+    
+    return {"title": title, "content": content, "tables": tables}
+
+
+def _extract_slides_from_package(zf: zipfile.ZipFile, slide_parts: list) -> list:
+    """Extrair os slides (e suas anotações) diretamente do ZIP"""
+    slides = []
+    for slide_part in slide_parts:
+        with zf.open(slide_part) as stream:
+            slide = _parse_slide_xml(stream)
+        
+        notes = ""
+        for rel_type, path in _read_rels(zf, slide_part).values():
+            if rel_type == _REL_NOTES:
+                with zf.open(path) as stream:
+                    notes_data = _parse_slide_xml(stream)
+                notes = "\n".join(notes_data["content"])
+                break
+        
+        slide["notes"] = notes
+        slides.append(slide)
+    return slides
+
+
+def _read_slide_part(zf: zipfile.ZipFile, slide_part: str) -> tuple:
+    """Bytes do XML de um slide e das suas anotações (b"" se não houver)"""
+    slide_bytes = zf.read(slide_part)
+    for rel_type, path in _read_rels(zf, slide_part).values():
+        if rel_type == _REL_NOTES:
+            return slide_bytes, zf.read(path)
+    return slide_bytes, b""
+
+
+def _parse_slide(slide_bytes: bytes, notes_bytes: bytes) -> dict:
+    """Título, textos, tabelas e anotações a partir do XML do slide e das anotações"""
+    slide = _parse_slide_xml(io.BytesIO(slide_bytes))
+    slide["notes"] = "\n".join(_parse_slide_xml(io.BytesIO(notes_bytes))["content"]) if notes_bytes else ""
+    return slide
+
+
 class PPTService:
-    def create_presentation(self, title: str, slides: list, output_dir: str) -> str:
+    def __init__(self, templates_dir: Optional[str] = None):
+        self.templates_dir = templates_dir or settings.TEMPLATES_DIR
+        # Templates já carregados (um por worker): nome -> Presentation base
+        self._template_cache = {}
+        self._template_lock = threading.Lock()
+    
+    def list_templates(self) -> list:
+        """Listar templates de escola disponíveis"""
+        if not os.path.isdir(self.templates_dir):
+            return []
+        return sorted(
+            os.path.splitext(name)[0]
+            for name in os.listdir(self.templates_dir)
+            if name.lower().endswith(".pptx")
+        )
+    
+    def _load_template(self, template: Optional[str] = None) -> Presentation:
+        """
+        Obter uma cópia de um template.
+        O template é lido e parseado apenas uma vez; cada requisição recebe
+        uma cópia própria, sem alterar o original em cache.
+        """
+        key = template or ""
+        base = self._template_cache.get(key)
+        if base is None:
+            with self._template_lock:
+                base = self._template_cache.get(key)
+                if base is None:
+                    if template:
+                        name = os.path.basename(template)
+                        if not name.lower().endswith(".pptx"):
+                            name += ".pptx"
+                        template_path = os.path.join(self.templates_dir, name)
+                        if not os.path.exists(template_path):
+                            raise Exception(f"Template não encontrado: {template}")
+                        base = Presentation(template_path)
+                    else:
+                        base = Presentation()
+                        base.slide_width = Inches(10)
+                        base.slide_height = Inches(7.5)
+                    self._template_cache[key] = base
+        # O lock só protege a leitura/preenchimento do cache: o Presentation em cache nunca é
+        # alterado, então as cópias (a parte cara) rodam em paralelo entre threads
+        return copy.deepcopy(base)
+    
+    def warm_templates(self) -> int:
+        """Pré-carregar o template padrão e todos os templates de escola"""
+        self._load_template()
+        names = self.list_templates()
+        for name in names:
+            self._load_template(name)
+        return len(names) + 1
+    
+    def _build_presentation(self, title: str, slides: list, template: Optional[str] = None) -> Presentation:
+        """Montar apresentação a partir de um template em cache"""
+        prs = self._load_template(template)
+        
+        # Slide de título
+        title_slide_layout = prs.slide_layouts[0]
+        slide = prs.slides.add_slide(title_slide_layout)
+        title_placeholder = slide.shapes.title
+        subtitle = slide.placeholders[1]
+        
+        title_placeholder.text = title
+        subtitle.text = "Material Pedagógico"
+        
+        # Adicionar slides de conteúdo
+        for slide_data in slides:
+            content_slide_layout = prs.slide_layouts[1]
+            slide = prs.slides.add_slide(content_slide_layout)
+            
+            slide_title = slide.shapes.title
+            slide_title.text = slide_data.get("title", "")
+            
+            # Adicionar conteúdo
+            content = slide_data.get("content", "")
+            if content:
+                content_box = slide.placeholders[1]
+                text_frame = content_box.text_frame
+                text_frame.text = content
+    
+        return prs
+    
+    @traced()
+    def create_presentation(self, title: str, slides: list, output_dir: str, template: Optional[str] = None) -> str:
         """Criar apresentação PowerPoint do zero"""
         try:
-            prs = Presentation()
-            prs.slide_width = Inches(10)
-            prs.slide_height = Inches(7.5)
-            
-            # Slide de título
-            title_slide_layout = prs.slide_layouts[0]
-            slide = prs.slides.add_slide(title_slide_layout)
-            title_placeholder = slide.shapes.title
-            subtitle = slide.placeholders[1]
-            
-            title_placeholder.text = title
-            subtitle.text = "Material Pedagógico"
-            
-            # Adicionar slides de conteúdo
-            for slide_data in slides:
-                content_slide_layout = prs.slide_layouts[1]
-                slide = prs.slides.add_slide(content_slide_layout)
-                
-                slide_title = slide.shapes.title
-                slide_title.text = slide_data.get("title", "")
-                
-                # Adicionar conteúdo
-                content = slide_data.get("content", "")
-                if content:
-                    content_box = slide.placeholders[1]
-                    text_frame = content_box.text_frame
-                    text_frame.text = content
+            prs = self._build_presentation(title, slides, template)
             
-            # Salvar apresentação
-            output_path = os.path.join(output_dir, f"{title}.pptx")
+            # Salvar apresentação (nome único; o título vai só no nome do download)
+            output_path = os.path.join(output_dir, f"{uuid.uuid4().hex}.pptx")
             prs.save(output_path)
             
             return output_path
         except Exception as e:
             raise Exception(f"Erro ao criar apresentação: {str(e)}")
     
+    @traced()
+    def create_presentations_bulk(self, decks: list, output_dir: str, zip_name: Optional[str] = None) -> str:
+        """Criar várias apresentações em uma única chamada e empacotar em ZIP"""
+        try:
+            # Nome único por chamada: requisições simultâneas não sobrescrevem o ZIP uma da outra
+            output_path = os.path.join(output_dir, zip_name or f"{uuid.uuid4().hex}.zip")
+            used_names = set()
+            
+            with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for i, deck in enumerate(decks):
+                    title = deck.get("title") or f"apresentacao_{i + 1}"
+                    prs = self._build_presentation(title, deck.get("slides", []), deck.get("template"))
+                    
+                    buffer = io.BytesIO()
+                    prs.save(buffer)
+                    
+                    # Evitar nomes repetidos dentro do ZIP
+                    name = os.path.basename(title)
+                    if name in used_names:
+                        name = f"{name}_{i + 1}"
+                    used_names.add(name)
+                    zipf.writestr(f"{name}.pptx", buffer.getvalue())
+            
+            return output_path
+        except Exception as e:
+            raise Exception(f"Erro ao criar apresentações em lote: {str(e)}")
+    
+    @traced()
     def extract_text(self, file_path: str) -> list:
         """Extrair texto de um PowerPoint"""
         try:
@@ -56,9 +294,11 @@ class PPTService:
                     "content": []
                 }
                 
+                # slide.shapes.title percorre todas as formas; calcular uma vez por slide
+                title_shape = slide.shapes.title
                 for shape in slide.shapes:
                     if hasattr(shape, "text"):
-                        if shape == slide.shapes.title:
+                        if shape == title_shape:
                             slide_text["title"] = shape.text
                         else:
                             if shape.text.strip():
@@ -66,34 +306,130 @@ class PPTService:
                 
                 slides_content.append(slide_text)
             
+            current_span().set_attribute("pptx.slides", len(slides_content))
             return slides_content
         except Exception as e:
             raise Exception(f"Erro ao extrair texto do PowerPoint: {str(e)}")
     
+    def _slide_parts(self, zf: zipfile.ZipFile) -> list:
+        """Listar as partes XML dos slides na ordem da apresentação"""
+        presentation_part = "ppt/presentation.xml"
+        rels = _read_rels(zf, presentation_part)
+        root = ET.fromstring(zf.read(presentation_part))
+        
+        parts = []
+        for sld_id in root.iter(f"{{{_NS_P}}}sldId"):
+            rel = rels.get(sld_id.get(f"{{{_NS_R}}}id"))
+            if rel:
+                parts.append(rel[1])
+        return parts
+    
+    @traced()
+    def extract_text_fast(self, file_path: str) -> list:
+        """
+        Extrair texto lendo o XML dos slides direto do pacote OOXML,
+        sem carregar o modelo de objetos do python-pptx.
+        Inclui também anotações do apresentador e o texto de tabelas.
+        """
+        try:
+            # Leitura sequencial em uma única abertura do ZIP: descompactar e interpretar o XML
+            # dependem do GIL, então dividir os slides entre threads não acelera nada
+            with zipfile.ZipFile(file_path) as zf:
+                slide_parts = self._slide_parts(zf)
+                current_span().set_attribute("pptx.slides", len(slide_parts))
+                slides = _extract_slides_from_package(zf, slide_parts)
+            
+            return [
+                {
+                    "slide_number": i + 1,
+                    "title": slide["title"],
+                    "content": slide["content"],
+                    "tables": slide["tables"],
+                    "notes": slide["notes"]
+                }
+                for i, slide in enumerate(slides)
+            ]
+        except Exception as e:
+            raise Exception(f"Erro ao extrair texto do PowerPoint: {str(e)}")
+    
+    @traced()
+    def extract_slides_incremental(self, file_path: str, unit_cache) -> dict:
+        """
+        Extração rápida reaproveitando slides já extraídos antes (mesmo XML de slide e anotações);
+        só os slides alterados são interpretados.
+        """
+        try:
+            from services.unit_cache import unit_key
+            
+            with zipfile.ZipFile(file_path) as zf:
+                parts = [_read_slide_part(zf, slide_part) for slide_part in self._slide_parts(zf)]
+            keys = [unit_key("pptx-slide", slide_bytes, notes_bytes) for slide_bytes, notes_bytes in parts]
+            known = unit_cache.get_many(keys)
+            
+            slides = []
+            new_results = {}
+            for i, ((slide_bytes, notes_bytes), key) in enumerate(zip(parts, keys)):
+                if key not in known and key not in new_results:
+                    new_results[key] = _parse_slide(slide_bytes, notes_bytes)
+                slide = known[key] if key in known else new_results[key]
+                slides.append({"slide_number": i + 1, **slide})
+            unit_cache.put_many(new_results)
+            current_span().set_attributes({"pptx.slides": len(slides),
+                                           "pptx.slides_reused": sum(1 for key in keys if key in known)})
+            
+            return {
+                "slides": slides,
+                "reused": sum(1 for key in keys if key in known)
+            }
+        except Exception as e:
+            raise Exception(f"Erro ao extrair texto do PowerPoint: {str(e)}")
+    
+    def _append_content_slide(self, prs: Presentation, slide_title: str, slide_content: str):
+        """Adicionar slide de conteúdo (título + texto) ao final da apresentação"""
+        content_slide_layout = prs.slide_layouts[1]
+        slide = prs.slides.add_slide(content_slide_layout)
+        
+        title = slide.shapes.title
+        title.text = slide_title
+        
+        content_box = slide.placeholders[1]
+        text_frame = content_box.text_frame
+        text_frame.text = slide_content
+        return slide
+    
+    def _update_slide(self, slide, new_title: Optional[str], new_content: Optional[str]):
+        """Alterar título e/ou primeiro bloco de texto de um slide"""
+        title_shape = slide.shapes.title
+        
+        # Modificar título
+        if title_shape and new_title is not None:
+            title_shape.text = new_title
+        
+        # Modificar conteúdo
+        if new_content is not None:
+            for shape in slide.shapes:
+                if hasattr(shape, "text") and shape != title_shape:
+                    shape.text = new_content
+                    break
+    
+    @traced()
     def add_slide(self, file_path: str, slide_title: str, slide_content: str, output_dir: str) -> str:
         """Adicionar slide a uma apresentação existente"""
         try:
             prs = Presentation(file_path)
             
             # Adicionar novo slide
-            content_slide_layout = prs.slide_layouts[1]
-            slide = prs.slides.add_slide(content_slide_layout)
-            
-            title = slide.shapes.title
-            title.text = slide_title
-            
-            content_box = slide.placeholders[1]
-            text_frame = content_box.text_frame
-            text_frame.text = slide_content
+            self._append_content_slide(prs, slide_title, slide_content)
             
             # Salvar apresentação
-            output_path = os.path.join(output_dir, "updated.pptx")
+            output_path = os.path.join(output_dir, f"{uuid.uuid4().hex}.pptx")
             prs.save(output_path)
             
             return output_path
         except Exception as e:
             raise Exception(f"Erro ao adicionar slide: {str(e)}")
     
+    @traced()
     def modify_slide(self, file_path: str, slide_number: int, new_title: str, new_content: str, output_dir: str) -> str:
         """Modificar um slide específico"""
         try:
@@ -102,26 +438,154 @@ class PPTService:
             if slide_number < 1 or slide_number > len(prs.slides):
                 raise Exception("Número de slide inválido")
             
-            slide = prs.slides[slide_number - 1]
-            
-            # Modificar título
-            if slide.shapes.title:
-                slide.shapes.title.text = new_title
-            
-            # Modificar conteúdo
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape != slide.shapes.title:
-                    shape.text = new_content
-                    break
+            self._update_slide(prs.slides[slide_number - 1], new_title, new_content)
             
             # Salvar apresentação
-            output_path = os.path.join(output_dir, "modified.pptx")
+            output_path = os.path.join(output_dir, f"{uuid.uuid4().hex}.pptx")
             prs.save(output_path)
             
             return output_path
         except Exception as e:
             raise Exception(f"Erro ao modificar slide: {str(e)}")
     
+    def _slide_index(self, prs: Presentation, slide_number) -> int:
+        """Converter número de slide (1-based) em índice, validando o intervalo"""
+        try:
+            slide_number = int(slide_number)
+        except (TypeError, ValueError):
+            raise Exception(f"Número de slide inválido: {slide_number}")
+        if slide_number < 1 or slide_number > len(prs.slides):
+            raise Exception(f"Número de slide inválido: {slide_number}")
+        return slide_number - 1
+    
+    def _move_slide(self, prs: Presentation, old_index: int, new_index: int):
+        """Mover um slide dentro da lista de slides da apresentação"""
+        sld_id_lst = prs.slides._sldIdLst
+        sld_id = sld_id_lst[old_index]
+        sld_id_lst.remove(sld_id)
+        sld_id_lst.insert(new_index, sld_id)
+    
+    def _delete_slide(self, prs: Presentation, index: int):
+        """Remover um slide e o relacionamento com sua parte no pacote"""
+        sld_id_lst = prs.slides._sldIdLst
+        sld_id = sld_id_lst[index]
+        prs.part.drop_rel(sld_id.rId)
+        sld_id_lst.remove(sld_id)
+        # Renumerar as partes restantes (slide1.xml, slide2.xml...): o próximo add_slide
+        # escolhe o nome pela quantidade de slides e repetiria um nome ainda em uso
+        prs.part.rename_slide_parts([sld_id.rId for sld_id in sld_id_lst])
+    
+    def _replace_text(self, slide, find: str, replace: str) -> int:
+        """Substituir texto nos parágrafos de um slide, preservando a formatação quando possível"""
+        count = 0
+        for shape in slide.shapes:
+            frames = []
+            if shape.has_text_frame:
+                frames.append(shape.text_frame)
+            if getattr(shape, "has_table", False) and shape.has_table:
+                frames.extend(cell.text_frame for row in shape.table.rows for cell in row.cells)
+            
+            for frame in frames:
+                for paragraph in frame.paragraphs:
+                    if find not in paragraph.text:
+                        continue
+                    replaced_in_runs = False
+                    for run in paragraph.runs:
+                        if find in run.text:
+                            count += run.text.count(find)
+                            run.text = run.text.replace(find, replace)
+                            replaced_in_runs = True
+                    if not replaced_in_runs and paragraph.runs:
+                        # Texto dividido entre runs: concentrar no primeiro run
+                        count += paragraph.text.count(find)
+                        full_text = paragraph.text.replace(find, replace)
+                        paragraph.runs[0].text = full_text
+                        for run in paragraph.runs[1:]:
+                            run.text = ""
+        return count
+    
+    @traced()
+    def apply_operations(self, file_path: str, operations: list, output_path: Optional[str] = None) -> dict:
+        """
+        Aplicar uma lista de operações em um único ciclo de leitura/gravação.
+        As operações são executadas em sequência; números de slide (1-based)
+        referem-se ao estado da apresentação após as operações anteriores.
+        
+        Operações suportadas:
+        - {"op": "add", "title": ..., "content": ..., "position": n}
+        - {"op": "modify", "slide": n, "title": ..., "content": ...}
+        - {"op": "delete", "slide": n}
+        - {"op": "reorder", "order": [3, 1, 2, ...]} ou {"op": "reorder", "slide": n, "position": m}
+        - {"op": "replace_text", "find": ..., "replace": ..., "slides": [n, ...]}
+        """
+        try:
+            prs = Presentation(file_path)
+            results = []
+            
+            for i, operation in enumerate(operations):
+                op = operation.get("op")
+                try:
+                    if op == "add":
+                        self._append_content_slide(prs, operation.get("title", ""), operation.get("content", ""))
+                        position = operation.get("position")
+                        if position is not None:
+                            new_index = min(max(int(position), 1), len(prs.slides)) - 1
+                            self._move_slide(prs, len(prs.slides) - 1, new_index)
+                        results.append({"op": op, "num_slides": len(prs.slides)})
+                    
+                    elif op == "modify":
+                        index = self._slide_index(prs, operation.get("slide"))
+                        self._update_slide(prs.slides[index], operation.get("title"), operation.get("content"))
+                        results.append({"op": op, "slide": index + 1})
+                    
+                    elif op == "delete":
+                        index = self._slide_index(prs, operation.get("slide"))
+                        self._delete_slide(prs, index)
+                        results.append({"op": op, "slide": index + 1, "num_slides": len(prs.slides)})
+                    
+                    elif op == "reorder":
+                        order = operation.get("order")
+                        if order is not None:
+                            indexes = [self._slide_index(prs, n) for n in order]
+                            if sorted(indexes) != list(range(len(prs.slides))):
+                                raise Exception("A nova ordem deve conter cada slide exatamente uma vez")
+                            sld_id_lst = prs.slides._sldIdLst
+                            sld_ids = list(sld_id_lst)
+                            for sld_id in sld_ids:
+                                sld_id_lst.remove(sld_id)
+                            for index in indexes:
+                                sld_id_lst.append(sld_ids[index])
+                        else:
+                            index = self._slide_index(prs, operation.get("slide"))
+                            new_index = self._slide_index(prs, operation.get("position"))
+                            self._move_slide(prs, index, new_index)
+                        results.append({"op": op})
+                    
+                    elif op == "replace_text":
+                        find = operation.get("find")
+                        if not find:
+                            raise Exception("Informe o texto a ser substituído ('find')")
+                        replace = operation.get("replace", "")
+                        slide_numbers = operation.get("slides")
+                        if slide_numbers:
+                            slides = [prs.slides[self._slide_index(prs, n)] for n in slide_numbers]
+                        else:
+                            slides = list(prs.slides)
+                        count = sum(self._replace_text(slide, find, replace) for slide in slides)
+                        results.append({"op": op, "replacements": count})
+                    
+                    else:
+                        raise Exception(f"Operação desconhecida: {op}")
+                except Exception as e:
+                    raise Exception(f"Operação {i + 1} ({op}): {str(e)}")
+            
+            # Salvar apresentação (uma única vez)
+            prs.save(output_path or file_path)
+            
+            return {"num_slides": len(prs.slides), "applied": results}
+        except Exception as e:
+            raise Exception(f"Erro ao editar apresentação: {str(e)}")
+    
     def get_presentation_info(self, file_path: str) -> dict:
         """Obter informações da apresentação"""
         try:
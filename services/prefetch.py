@@ -0,0 +1,154 @@
+"""
+Pré-cálculo especulativo das próximas operações de IA: após extrair o texto de um PDF,
+resumo e questões são gerados em segundo plano (prioridade mínima, só com capacidade ociosa)
+e guardados no cache de IA até o pedido do usuário chegar
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+from typing import Optional
+
+from config import settings
+from services.ai_limiter import ai_priority, has_idle_capacity, PRIORITY_BACKGROUND
+from services.token_budget import count_tokens
+from services.unit_cache import unit_key
+
+# Operações pré-calculadas, com os mesmos parâmetros padrão das rotas
+PREFETCH_OPERATIONS = {
+    "summarize": {"max_words": 200},
+    "generate_questions": {"num_questions": 5, "difficulty": "média"},
+}
+
+
+def prefetch_key(operation: str, text: str, params: dict) -> str:
+    """Chave do resultado: operação + parâmetros + texto (espaços normalizados)"""
+    return unit_key(f"prefetch-{operation}", json.dumps(params, sort_keys=True, ensure_ascii=False),
+                    re.sub(r"\s+", " ", text).strip())
+
+
+class Prefetcher:
+    def __init__(self, ai_service, ai_cache, max_tasks: Optional[int] = None):
+        self.ai_service = ai_service
+        self.ai_cache = ai_cache
+        self.max_tasks = max_tasks or settings.PREFETCH_MAX_TASKS
+        # chave -> tarefa em andamento; id do pré-cálculo -> chaves
+        self._tasks = {}
+        self._groups = {}
+        # chave -> prazo (monotônico) das chaves iniciadas neste worker e ainda não entregues:
+        # sem entrada aqui (nem prefetch_id), take responde None sem consultar o SQLite
+        self._known = {}
+
+    async def schedule(self, text: str) -> Optional[str]:
+        """
+        Iniciar o pré-cálculo para o texto, se houver capacidade ociosa.
+        Cada operação é marcada como em andamento no cache compartilhado antes de começar,
+        assim outro worker não repete o cálculo e o pedido do usuário em qualquer worker espera por ele.
+        Retorna o id do pré-cálculo (para cancelamento) ou None se nada foi iniciado.
+        """
+        if not text.strip() or count_tokens(text) > settings.MAX_INPUT_TOKENS:
+            return None
+
+        # Esquecer pré-cálculos já concluídos e chaves cujo resultado já expirou
+        self._groups = {gid: keys for gid, keys in self._groups.items() if any(key in self._tasks for key in keys)}
+        now = time.monotonic()
+        self._known = {key: expires for key, expires in self._known.items() if expires >= now}
+
+        prefetch_id = uuid.uuid4().hex
+        candidates = []
+        for operation, params in PREFETCH_OPERATIONS.items():
+            key = prefetch_key(operation, text, params)
+            if key in self._tasks:
+                continue
+            if len(self._tasks) + len(candidates) >= self.max_tasks or not has_idle_capacity():
+                break
+            candidates.append((key, operation, params))
+        if not candidates:
+            return None
+
+        claimed = await asyncio.to_thread(self.ai_cache.claim, [key for key, _, _ in candidates])
+        keys = []
+        for key, operation, params in candidates:
+            if key not in claimed or key in self._tasks:
+                continue
+            task = asyncio.get_running_loop().create_task(self._run(key, operation, text, params))
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+            self._tasks[key] = task
+            self._known[key] = time.monotonic() + settings.PREFETCH_WAIT + settings.PREFETCH_TTL
+            keys.append(key)
+
+        if not keys:
+            return None
+        self._groups[prefetch_id] = keys
+        return prefetch_id
+
+    async def _run(self, key: str, operation: str, text: str, params: dict):
+        try:
+            with ai_priority(PRIORITY_BACKGROUND):
+                result = await getattr(self.ai_service, operation)(text, **params)
+        except BaseException:
+            # Cancelado ou com falha: quem estiver esperando em outro worker segue sem o resultado
+            await asyncio.to_thread(self.ai_cache.release, key)
+            raise
+        await asyncio.to_thread(self.ai_cache.put, key, result)
+        return result
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._tasks.pop(key, None)
+        # Falhas do pré-cálculo não afetam ninguém: o pedido real chama a IA normalmente
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Aviso: falha no pré-cálculo: {task.exception()}")
+
+    async def take(self, operation: str, text: str, prefetch_id: Optional[str] = None, **params):
+        """
+        Resultado pré-calculado (aguarda o que ainda está em andamento); None se não houver.
+        Chaves iniciadas neste worker são conhecidas em memória; o cache compartilhado só é consultado
+        para elas ou quando o cliente informa o prefetch_id (pré-cálculo iniciado em outro worker)
+        """
+        key = prefetch_key(operation, text, params)
+        expires = self._known.pop(key, None)
+        if expires is None or expires < time.monotonic():
+            if not prefetch_id:
+                return None
+            return await self._wait_shared(key)
+
+        task = self._tasks.get(key)
+        if task is not None:
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            except Exception:
+                return None
+        return await asyncio.to_thread(self.ai_cache.take, key)
+
+    async def _wait_shared(self, key: str):
+        """Em andamento em outro worker: consultar o cache compartilhado até sair o resultado"""
+        deadline = time.monotonic() + settings.PREFETCH_WAIT
+        while True:
+            result = await asyncio.to_thread(self.ai_cache.take, key)
+            if result is not None or time.monotonic() >= deadline:
+                return result
+            if not await asyncio.to_thread(self.ai_cache.pending, key):
+                # Terminou entre as duas consultas (ou desistiu): última leitura
+                return await asyncio.to_thread(self.ai_cache.take, key)
+            await asyncio.sleep(settings.PREFETCH_POLL_INTERVAL)
+
+    def cancel(self, prefetch_id: str) -> int:
+        """Cancelar as operações ainda em andamento de um pré-cálculo; retorna quantas foram canceladas"""
+        cancelled = 0
+        for key in self._groups.pop(prefetch_id, []):
+            task = self._tasks.get(key)
+            if task is not None and not task.done():
+                task.cancel()
+                cancelled += 1
+        return cancelled
+
+    def shutdown(self):
+        """Cancelar todo o trabalho especulativo (encerramento)"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._groups.clear()
+        self._known.clear()
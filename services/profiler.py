@@ -0,0 +1,312 @@
+"""
+Perfilamento do worker em produção, sem reimplantar: amostragem estatística das pilhas de todas
+as threads (event loop e threads de PDF/PPTX) por uma janela de tempo ou só durante requisições
+de uma rota, com saída em pilhas "folded" (flamegraph.pl / speedscope) e os maiores alocadores
+de memória (tracemalloc)
+
+Cada perfilamento roda no worker que recebeu o pedido, mas sessão e resultado ficam em
+TEMP_DIR/profiles/<id>: com vários workers do Gunicorn, qualquer um deles responde a consultas
+e pedidos de parada pelo id.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+from config import settings
+
+# Perfilamentos mantidos em disco (os mais antigos são removidos ao iniciar um novo)
+PROFILE_KEEP = 20
+# Intervalo para o worker que perfila conferir se outro worker pediu a parada
+STOP_CHECK_INTERVAL = 0.5
+# Folga após o prazo para considerar perdido um perfilamento sem resultado (worker reciclado ou encerrado)
+LOST_GRACE = 30
+
+# Folhas de pilha que indicam thread ociosa (event loop esperando I/O, pool de threads sem trabalho...)
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+    ("tracing.py", "_run"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _write_json(path: str, data: dict):
+    """Gravar JSON de forma atômica (outros workers nunca leem um arquivo pela metade)"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class SamplingProfiler:
+    def __init__(self, profiles_dir: Optional[str] = None):
+        self.profiles_dir = profiles_dir or os.path.join(settings.TEMP_DIR, "profiles")
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.route = None
+        # Requisições em andamento na rota filtrada (amostras só são coletadas enquanto houver alguma)
+        self._matching = 0
+        self._session = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _dir(self, profile_id: str) -> str:
+        if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+            raise Exception("ID de perfilamento inválido")
+        return os.path.join(self.profiles_dir, profile_id)
+
+    def start(self, duration: float, interval: float, route: Optional[str] = None, memory: bool = False,
+              include_idle: bool = False) -> dict:
+        """Iniciar uma janela de perfilamento neste worker (uma por vez, por worker)"""
+        with self._lock:
+            if self.active:
+                raise Exception("Já existe um perfilamento em andamento neste worker")
+            duration = min(duration, settings.PROFILE_MAX_DURATION)
+            interval = max(interval, 0.001)
+            self._prune()
+            profile_id = uuid.uuid4().hex
+            os.makedirs(self._dir(profile_id))
+            self._stop.clear()
+            self.route = route or None
+            self._matching = 0
+            self._session = {
+                "id": profile_id,
+                "pid": os.getpid(),
+                "started_at": time.time(),
+                "duration": duration,
+                "interval": interval,
+                "route": self.route,
+                "memory": memory,
+                "include_idle": include_idle
+            }
+            _write_json(os.path.join(self._dir(profile_id), "session.json"), self._session)
+            self._thread = threading.Thread(target=self._run, args=(duration, interval, memory, include_idle),
+                                            name="profiler", daemon=True)
+            self._thread.start()
+            return self.status(profile_id)
+
+    def _prune(self):
+        """Remover os perfilamentos mais antigos, mantendo PROFILE_KEEP"""
+        profiles = self.list(limit=None)
+        for session in profiles[PROFILE_KEEP - 1:]:
+            shutil.rmtree(self._dir(session["id"]), ignore_errors=True)
+
+    def stop(self, profile_id: Optional[str] = None, timeout: float = 10) -> Optional[dict]:
+        """
+        Encerrar a janela antes do prazo. Sem id, encerra a deste worker. Com id, o pedido fica
+        registrado no disco e o worker dono o atende em até STOP_CHECK_INTERVAL segundos.
+        """
+        session = self._session
+        if profile_id is not None and (session is None or session["id"] != profile_id):
+            if _read_json(os.path.join(self._dir(profile_id), "session.json")) is None:
+                return None
+            open(os.path.join(self._dir(profile_id), "stop"), "w").close()
+            return self.status(profile_id)
+
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        return self.status(session["id"]) if session is not None else None
+
+    def result(self, profile_id: str) -> Optional[dict]:
+        """Resultado de um perfilamento concluído (de qualquer worker)"""
+        return _read_json(os.path.join(self._dir(profile_id), "result.json"))
+
+    def status(self, profile_id: str) -> Optional[dict]:
+        """
+        Estado de um perfilamento: running, finished ou lost (sem resultado muito depois do prazo:
+        o worker que perfilava foi reciclado ou encerrado). pid é o worker que perfila; served_by, quem respondeu.
+        """
+        session = _read_json(os.path.join(self._dir(profile_id), "session.json"))
+        if session is None:
+            return None
+        has_result = os.path.exists(os.path.join(self._dir(profile_id), "result.json"))
+        if has_result:
+            state = "finished"
+        elif time.time() > session["started_at"] + session["duration"] + LOST_GRACE:
+            state = "lost"
+        else:
+            state = "running"
+        return {"id": profile_id, "state": state, "pid": session["pid"], "served_by": os.getpid(),
+                "session": session, "has_result": has_result}
+
+    def list(self, limit: Optional[int] = 20) -> list:
+        """Sessões gravadas, da mais recente para a mais antiga"""
+        sessions = []
+        if os.path.isdir(self.profiles_dir):
+            for name in os.listdir(self.profiles_dir):
+                if re.fullmatch(r"[0-9a-f]{32}", name):
+                    session = _read_json(os.path.join(self.profiles_dir, name, "session.json"))
+                    if session is not None:
+                        sessions.append(session)
+        sessions.sort(key=lambda session: session["started_at"], reverse=True)
+        return sessions[:limit] if limit is not None else sessions
+
+    def request_started(self, path: str) -> bool:
+        """Chamado a cada requisição; indica se ela entra na contagem da rota filtrada"""
+        route = self.route
+        if route is None or not self.active or not path.startswith(route):
+            return False
+        with self._lock:
+            self._matching += 1
+        return True
+
+    def request_finished(self):
+        with self._lock:
+            self._matching -= 1
+
+    def _run(self, duration: float, interval: float, memory: bool, include_idle: bool):
+        own_id = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        skipped = 0
+        started_tracemalloc = False
+        baseline = None
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(settings.PROFILE_MEMORY_FRAMES)
+                started_tracemalloc = True
+            baseline = tracemalloc.take_snapshot()
+
+        profile_dir = self._dir(self._session["id"])
+        stop_path = os.path.join(profile_dir, "stop")
+        next_stop_check = 0.0
+        deadline = time.monotonic() + duration
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                if time.monotonic() >= next_stop_check:
+                    # Parada pedida por outro worker
+                    if os.path.exists(stop_path):
+                        break
+                    next_stop_check = time.monotonic() + STOP_CHECK_INTERVAL
+                if self.route is not None and self._matching <= 0:
+                    self._stop.wait(interval)
+                    continue
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    code = frame.f_code
+                    if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                        skipped += 1
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(f"thread:{names.get(thread_id, thread_id)}")
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                self._stop.wait(interval)
+
+            result = {**self._session, "finished_at": time.time(), "samples": samples, "idle_skipped": skipped,
+                      "stacks": dict(stacks.most_common())}
+            if memory:
+                result["memory"] = self._memory_report(baseline)
+        except Exception as e:
+            result = {**self._session, "error": str(e)}
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+        try:
+            _write_json(os.path.join(profile_dir, "result.json"), result)
+        except OSError as e:
+            print(f"Aviso: falha ao gravar resultado do perfilamento: {e}")
+
+    def _memory_report(self, baseline) -> dict:
+        """Maiores alocadores: memória ainda alocada ao fim da janela e crescimento durante ela"""
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        top = settings.PROFILE_MEMORY_TOP
+        return {
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top_allocators": [
+                {"location": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:top]
+            ],
+            "top_growth": [
+                {"location": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(baseline, "lineno")[:top] if stat.size_diff > 0
+            ]
+        }
+
+
+def folded(result: dict) -> str:
+    """Pilhas no formato "folded" (uma por linha: quadros;separados;por;ponto-e-vírgula contagem)"""
+    return "".join(f"{stack} {count}\n" for stack, count in result.get("stacks", {}).items())
+
+
+def top_functions(result: dict, limit: int = 30) -> list:
+    """
+    Funções com mais amostras próprias (no topo da pilha, onde a CPU estava),
+    com as inclusivas (em qualquer ponto da pilha) ao lado
+    """
+    own = Counter()
+    total = Counter()
+    for stack, count in result.get("stacks", {}).items():
+        frames = stack.split(";")[1:]
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    samples = sum(result.get("stacks", {}).values()) or 1
+    return [
+        {"function": function, "total": count, "total_pct": round(100 * count / samples, 1),
+         "self": own.get(function, 0), "self_pct": round(100 * own.get(function, 0) / samples, 1)}
+        for function, _ in own.most_common(limit)
+        for count in [total[function]]
+    ]
+
+
+class ProfilingMiddleware:
+    """Marca as requisições da rota filtrada enquanto um perfilamento por rota está ativo"""
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.profiler.route is None \
+                or not self.profiler.request_started(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.request_finished()
+
+
+profiler = SamplingProfiler()
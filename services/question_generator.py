@@ -0,0 +1,178 @@
+"""
+Geração de questões sobre documentos inteiros: seções com questões proporcionais ao tamanho,
+chamadas concorrentes e remoção de questões quase repetidas
+"""
+import math
+import asyncio
+from typing import Optional
+
+import numpy as np
+
+from config import settings
+from services.ai_limiter import ai_priority, PRIORITY_BATCH
+from services.token_budget import count_tokens, split_to_budget, max_questions_per_call
+from services.vector_index import local_embeddings
+
+# Seções menores que isso são agrupadas (evita chamadas com pouco conteúdo)
+MIN_SECTION_TOKENS = 1500
+# Questões extras pedidas por seção, para compensar as descartadas como repetidas
+OVERGENERATION = 1.3
+# Novas tentativas de uma chamada que falhou (só ela é repetida, não a prova inteira)
+SECTION_RETRIES = 1
+
+
+def build_sections(units: list, section_tokens: int) -> list:
+    """
+    Agrupar unidades consecutivas [(número da página/slide, texto)] em seções de até section_tokens.
+    Unidades maiores que o limite são divididas.
+    """
+    sections = []
+    current = None
+    for number, text in units:
+        text = text.strip()
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        if current is not None and current["tokens"] + tokens <= section_tokens:
+            current["end"] = number
+            current["text"] += "\n\n" + text
+            current["tokens"] += tokens
+            continue
+        parts = split_to_budget(text, section_tokens) if tokens > section_tokens else [text]
+        for part in parts:
+            current = {"start": number, "end": number, "text": part, "tokens": count_tokens(part)}
+            sections.append(current)
+    return sections
+
+
+def split_quota(count: int, per_call: int) -> list:
+    """Dividir um pedido de count questões em chamadas de até per_call (tamanhos parecidos)"""
+    if count <= 0:
+        return []
+    calls = math.ceil(count / per_call)
+    return [count // calls + (1 if i < count % calls else 0) for i in range(calls)]
+
+
+def allocate(weights: list, total: int) -> list:
+    """Distribuir total proporcionalmente aos pesos (maiores restos)"""
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        return [0] * len(weights)
+    quotas = [total * weight / weight_sum for weight in weights]
+    counts = [int(quota) for quota in quotas]
+    by_remainder = sorted(range(len(weights)), key=lambda i: quotas[i] - counts[i], reverse=True)
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+class QuestionGenerator:
+    def __init__(self, ai_service=None, max_concurrency: Optional[int] = None, similarity_threshold: float = 0.8):
+        if ai_service is None:
+            from services.ai_service import AIService
+            ai_service = AIService()
+        self.ai_service = ai_service
+        self.max_concurrency = max_concurrency or settings.QUESTION_CONCURRENCY
+        # Similaridade (cosseno) a partir da qual duas questões são consideradas a mesma
+        self.similarity_threshold = similarity_threshold
+
+    async def generate(self, units: list, num_questions: int = 20, difficulty: str = "média") -> dict:
+        """
+        Gerar num_questions questões cobrindo todo o documento.
+        units: [(número da página/slide, texto)] na ordem do documento.
+        """
+        try:
+            if num_questions < 1:
+                raise Exception("Número de questões deve ser positivo")
+            total_tokens = sum(count_tokens(text) for _, text in units)
+            if total_tokens == 0:
+                raise Exception("Documento sem texto")
+
+            # Seções grandes o bastante para render questões, sem passar do que cabe em uma chamada
+            section_tokens = max(MIN_SECTION_TOKENS, math.ceil(total_tokens / num_questions))
+            section_tokens = min(section_tokens, settings.MAX_INPUT_TOKENS)
+            sections = build_sections(units, section_tokens)
+            quotas = allocate([section["tokens"] for section in sections], num_questions)
+
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            per_call = max_questions_per_call()
+
+            async def call(section: dict, count: int) -> list:
+                """Uma chamada de até per_call questões, repetida sozinha se falhar"""
+                for attempt in range(SECTION_RETRIES + 1):
+                    try:
+                        async with semaphore:
+                            questions = await self.ai_service.generate_questions(section["text"], count, difficulty)
+                        return [q for q in questions if isinstance(q, dict) and q.get("question") and "error" not in q]
+                    except Exception:
+                        if attempt == SECTION_RETRIES:
+                            raise
+
+            async def run(section: dict, quota: int) -> tuple:
+                """Questões da seção e o erro, se alguma chamada falhou mesmo após repetir"""
+                counts = split_quota(math.ceil(quota * OVERGENERATION), per_call)
+                results = await asyncio.gather(*(call(section, count) for count in counts), return_exceptions=True)
+                questions = [q for result in results if not isinstance(result, BaseException) for q in result]
+                errors = [str(result) for result in results if isinstance(result, BaseException)]
+                return questions, "; ".join(errors) or None
+
+            # Muitas chamadas de uma vez: ficam atrás dos pedidos interativos na fila do provedor
+            with ai_priority(PRIORITY_BATCH):
+                outcomes = await asyncio.gather(*(run(s, q) for s, q in zip(sections, quotas)))
+            candidates = [questions for questions, _ in outcomes]
+            errors = [error for _, error in outcomes]
+            if not any(candidates) and any(errors):
+                raise Exception(next(error for error in errors if error))
+            selected = self._select(sections, quotas, candidates, num_questions)
+
+            report = []
+            for i, (s, quota, found, error) in enumerate(zip(sections, quotas, candidates, errors)):
+                entry = {"section": i + 1, "start": s["start"], "end": s["end"], "requested": quota,
+                         "generated": len(found), "selected": sum(1 for q in selected if q["section"] == i + 1)}
+                if error:
+                    entry["error"] = error
+                report.append(entry)
+            return {"questions": selected, "sections": report}
+        except Exception as e:
+            raise Exception(f"Erro ao gerar questões do documento: {str(e)}")
+
+    def _select(self, sections: list, quotas: list, candidates: list, num_questions: int) -> list:
+        """
+        Remover questões quase repetidas e respeitar a cota de cada seção;
+        vagas não preenchidas vão para as questões restantes das outras seções.
+        """
+        flat = [(i, question) for i, found in enumerate(candidates) for question in found]
+        if not flat:
+            return []
+        vectors = local_embeddings([question["question"] for _, question in flat])
+
+        kept_vectors = []
+        chosen = [[] for _ in sections]
+        leftovers = []
+        for (i, question), vector in zip(flat, vectors):
+            if kept_vectors and float(np.max(np.stack(kept_vectors) @ vector)) >= self.similarity_threshold:
+                continue
+            if len(chosen[i]) < quotas[i]:
+                chosen[i].append(question)
+                kept_vectors.append(vector)
+            else:
+                rank = sum(1 for item in leftovers if item[1] == i)
+                leftovers.append((rank, i, question, vector))
+
+        # Completar alternando entre as seções (a 1ª sobra de cada seção, depois a 2ª...)
+        leftovers.sort(key=lambda item: item[0])
+        missing = num_questions - sum(len(found) for found in chosen)
+        for _, i, question, vector in leftovers:
+            if missing <= 0:
+                break
+            if float(np.max(np.stack(kept_vectors) @ vector)) >= self.similarity_threshold:
+                continue
+            chosen[i].append(question)
+            kept_vectors.append(vector)
+            missing -= 1
+
+        selected = []
+        for i, found in enumerate(chosen):
+            for question in found:
+                selected.append({**question, "section": i + 1, "range": [sections[i]["start"], sections[i]["end"]]})
+        return selected
@@ -0,0 +1,169 @@
+"""
+Miniaturas de páginas de PDF com cache em disco e renderização antecipada
+"""
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional
+
+from config import settings
+from services.ocr_service import file_hash
+
+# Largura (px) de cada tamanho de miniatura
+THUMBNAIL_SIZES = {
+    "small": 160,
+    "medium": 320,
+    "large": 800,
+}
+
+
+class ThumbnailService:
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: Optional[int] = None):
+        self.cache_dir = cache_dir or settings.THUMBNAIL_CACHE_DIR
+        self.documents_dir = os.path.join(self.cache_dir, "documents")
+        os.makedirs(self.documents_dir, exist_ok=True)
+        self.max_workers = max_workers or settings.THUMBNAIL_WORKERS
+        self._executor = None
+        self._prefetch_executor = None
+        self._executor_lock = threading.Lock()
+        # Renderizações em andamento: chave do cache -> Future
+        self._in_flight = {}
+        self._lock = threading.RLock()
+        self._page_counts = {}
+        self._page_counts_lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Pool dos pedidos do usuário, criado no primeiro uso.
+        pdf2image roda o Poppler em subprocesso, então threads bastam para paralelizar.
+        """
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="thumbnails")
+        return self._executor
+
+    @property
+    def prefetch_executor(self) -> ThreadPoolExecutor:
+        """
+        Pool separado da renderização antecipada (criado no primeiro uso),
+        para que a página pedida não espere atrás da fila de pré-renderização
+        """
+        if self._prefetch_executor is None:
+            with self._executor_lock:
+                if self._prefetch_executor is None:
+                    self._prefetch_executor = ThreadPoolExecutor(max_workers=1,
+                                                                 thread_name_prefix="thumbnails-prefetch")
+        return self._prefetch_executor
+
+    def register_document(self, file_path: str) -> dict:
+        """Guardar o PDF pelo hash do conteúdo para gerar miniaturas sob demanda"""
+        try:
+            doc_hash = file_hash(file_path)
+            stored_path = self._document_path(doc_hash)
+            if not os.path.exists(stored_path):
+                shutil.copyfile(file_path, stored_path)
+            return {"doc_hash": doc_hash, "num_pages": self.page_count(doc_hash)}
+        except Exception as e:
+            raise Exception(f"Erro ao registrar documento: {str(e)}")
+
+    def _document_path(self, doc_hash: str) -> str:
+        """Caminho do PDF guardado (valida o hash)"""
+        if not re.fullmatch(r"[0-9a-f]{64}", doc_hash):
+            raise Exception("Identificador de documento inválido")
+        return os.path.join(self.documents_dir, f"{doc_hash}.pdf")
+
+    def page_count(self, doc_hash: str) -> int:
+        """Número de páginas de um documento registrado"""
+        with self._page_counts_lock:
+            count = self._page_counts.get(doc_hash)
+        if count is None:
+            from PyPDF2 import PdfReader
+
+            path = self._document_path(doc_hash)
+            if not os.path.exists(path):
+                raise Exception("Documento não encontrado")
+            # Leitura fora do lock (outras threads seguem); o mesmo PDF dá sempre o mesmo número
+            count = len(PdfReader(path).pages)
+            with self._page_counts_lock:
+                self._page_counts[doc_hash] = count
+        return count
+
+    def _thumbnail_path(self, doc_hash: str, page_number: int, size: str) -> str:
+        """Arquivo de cache de uma miniatura"""
+        return os.path.join(self.cache_dir, f"{doc_hash}_{page_number}_{size}.jpg")
+
+    def _render(self, doc_hash: str, page_number: int, size: str) -> str:
+        """Renderizar uma página e gravar no cache (gravação atômica)"""
+        from pdf2image import convert_from_path
+
+        output_path = self._thumbnail_path(doc_hash, page_number, size)
+        if os.path.exists(output_path):
+            return output_path
+
+        width = THUMBNAIL_SIZES[size]
+        images = convert_from_path(
+            self._document_path(doc_hash), first_page=page_number, last_page=page_number, size=(width, None)
+        )
+        temp_path = f"{output_path}.{threading.get_ident()}.tmp"
+        images[0].convert("RGB").save(temp_path, "JPEG", quality=80, optimize=True)
+        os.replace(temp_path, output_path)
+        return output_path
+
+    def _submit(self, doc_hash: str, page_number: int, size: str, background: bool = False) -> Future:
+        """Agendar renderização, reaproveitando uma já em andamento para a mesma miniatura"""
+        key = (doc_hash, page_number, size)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None and not background and future.cancel():
+                # Estava só na fila de pré-renderização: passar para o pool principal
+                future = None
+            if future is None:
+                executor = self.prefetch_executor if background else self.executor
+                future = executor.submit(self._render, doc_hash, page_number, size)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda done: self._discard(key, done))
+            return future
+
+    def _discard(self, key: tuple, future: Future):
+        """Remover renderização concluída da lista de andamento"""
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def get_thumbnail(self, doc_hash: str, page_number: int, size: str = "medium") -> Future:
+        """
+        Obter miniatura (Future com o caminho do arquivo).
+        Se já estiver no cache, retorna um Future concluído.
+        """
+        if size not in THUMBNAIL_SIZES:
+            raise Exception(f"Tamanho inválido: {size} (use {', '.join(THUMBNAIL_SIZES)})")
+        if page_number < 1 or page_number > self.page_count(doc_hash):
+            raise Exception("Número de página inválido")
+
+        output_path = self._thumbnail_path(doc_hash, page_number, size)
+        if os.path.exists(output_path):
+            future = Future()
+            future.set_result(output_path)
+            return future
+        return self._submit(doc_hash, page_number, size)
+
+    def prefetch(self, doc_hash: str, page_number: int, size: str = "medium", count: int = 5) -> int:
+        """Renderizar em segundo plano as próximas páginas (à frente da posição de rolagem)"""
+        last_page = min(self.page_count(doc_hash), page_number + count)
+        scheduled = 0
+        for next_page in range(page_number + 1, last_page + 1):
+            if not os.path.exists(self._thumbnail_path(doc_hash, next_page, size)):
+                self._submit(doc_hash, next_page, size, background=True)
+                scheduled += 1
+        return scheduled
+
+    def shutdown(self):
+        """Cancelar renderizações antecipadas pendentes"""
+        with self._executor_lock:
+            for executor in (self._prefetch_executor, self._executor):
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
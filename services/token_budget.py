@@ -0,0 +1,117 @@
+"""
+Orçamento de tokens para prompts: contagem local, corte de entradas e max_tokens por operação
+"""
+import math
+import re
+
+from config import settings
+
+# Média de caracteres por token para textos em português (estimativa sem tokenizer)
+CHARS_PER_TOKEN = 3.5
+
+# Janela de contexto por modelo (entrada + saída)
+CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-3.5-turbo": 16385,
+    "claude-3-5-sonnet-20241022": 200000,
+    "claude-3-haiku-20240307": 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 16385
+
+# Saída estimada por questão gerada (enunciado, 4 alternativas, resposta e explicação) e fixa por chamada
+QUESTION_OUTPUT_TOKENS = 200
+QUESTION_OUTPUT_OVERHEAD = 100
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Contar tokens localmente (tiktoken se instalado, senão estimativa)"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Estimativa: o maior entre caracteres/3.5 e palavras/pontuação * 1.3
+    by_chars = len(text) / CHARS_PER_TOKEN
+    by_words = len(_WORD_RE.findall(text)) * 1.3
+    return int(math.ceil(max(by_chars, by_words)))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cortar texto para caber em max_tokens, preferindo terminar em fim de parágrafo ou frase"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        truncated = _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        truncated = text[:int(max_tokens * CHARS_PER_TOKEN)]
+        # Garantir o limite também pela contagem por palavras
+        while count_tokens(truncated) > max_tokens:
+            truncated = truncated[:int(len(truncated) * 0.9)]
+
+    for separator in ("\n\n", ". ", "\n"):
+        cut = truncated.rfind(separator)
+        if cut > len(truncated) * 0.8:
+            return truncated[:cut + len(separator)].rstrip()
+    return truncated
+
+
+def split_to_budget(text: str, max_tokens: int) -> list:
+    """Dividir texto em partes de até max_tokens, respeitando parágrafos"""
+    from services.vector_index import chunk_text
+
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    parts = []
+    for chunk in chunk_text(text, max_chars=max_chars, overlap=0):
+        parts.append(truncate_to_tokens(chunk, max_tokens))
+    return parts
+
+
+def sample_to_budget(text: str, max_tokens: int) -> str:
+    """Reduzir texto ao orçamento mantendo trechos distribuídos pelo documento todo"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    parts = split_to_budget(text, max(max_tokens // 8, 200))
+    keep = max(1, int(len(parts) * max_tokens / max(count_tokens(text), 1)))
+    step = len(parts) / keep
+    selected = [parts[int(i * step)] for i in range(keep)]
+    return truncate_to_tokens("\n\n[...]\n\n".join(selected), max_tokens)
+
+
+def output_budget(operation: str, input_tokens: int = 0, **params) -> int:
+    """Calcular max_tokens de saída adequado para cada operação"""
+    if operation == "summarize":
+        # Português usa cerca de 1.6 tokens por palavra
+        budget = int(params.get("max_words", 200) * 1.6) + 60
+    elif operation == "generate_questions":
+        budget = params.get("num_questions", 5) * QUESTION_OUTPUT_TOKENS + QUESTION_OUTPUT_OVERHEAD
+    elif operation in ("improve_text", "translate", "correct_grammar", "simplify_text"):
+        # Saída aproximadamente do tamanho da entrada
+        budget = int(input_tokens * 1.3) + 100
+    elif operation == "generate_exercises":
+        budget = params.get("num_exercises", 10) * 220 + 150
+    elif operation == "generate_presentation_outline":
+        budget = params.get("num_slides", 10) * 130 + 100
+    else:
+        budget = settings.DEFAULT_OUTPUT_TOKENS
+    return max(64, min(budget, settings.MAX_OUTPUT_TOKENS))
+
+
+def max_questions_per_call() -> int:
+    """Quantas questões cabem em uma chamada sem a resposta ser cortada por MAX_OUTPUT_TOKENS"""
+    return max(1, (settings.MAX_OUTPUT_TOKENS - QUESTION_OUTPUT_OVERHEAD) // QUESTION_OUTPUT_TOKENS)
+
+
+def input_budget(max_output_tokens: int, model: str = "") -> int:
+    """Tokens disponíveis para a entrada, respeitando o limite configurado e a janela do modelo"""
+    window = CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return max(256, min(settings.MAX_INPUT_TOKENS, window - max_output_tokens))
@@ -0,0 +1,296 @@
+"""
+Rastreamento de requisições compatível com OpenTelemetry: spans por rota, método de serviço,
+consulta de cache e chamada de IA, gravados em JSONL no formato OTLP/JSON (cada linha é um
+ExportTraceServiceRequest, legível pelo receiver "otlpjsonfile" do OpenTelemetry Collector)
+"""
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+from config import settings
+
+SERVICE_NAME = "ia-pedagogico"
+
+_KINDS = {"internal": 1, "server": 2, "client": 3}
+_STATUS_OK, _STATUS_ERROR = 1, 2
+
+
+class Span:
+    recording = True
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], attributes: Optional[dict]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = _STATUS_OK
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict):
+        self.attributes.update(attributes)
+
+    def record_exception(self, error: BaseException):
+        self.status = _STATUS_ERROR
+        self.status_message = str(error)
+        self.events.append({
+            "timeUnixNano": str(time.time_ns()),
+            "name": "exception",
+            "attributes": _attributes({"exception.type": type(error).__name__, "exception.message": str(error)})
+        })
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": self.status, **({"message": self.status_message} if self.status_message else {})}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = self.events
+        return span
+
+
+class _NonRecordingSpan:
+    """Span que não é gravado (rastreamento desligado ou trace fora da amostragem)"""
+    recording = False
+
+    def __init__(self, trace_id: str = "0" * 32, span_id: str = "0" * 16):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_attributes(self, attributes: dict):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-00"
+
+
+_DISABLED = _NonRecordingSpan()
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+def _attributes(values: dict) -> list:
+    """Atributos no formato OTLP/JSON"""
+    result = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
+
+
+def _parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """(trace_id, span_id do pai, amostrado) de um cabeçalho W3C traceparent"""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or set(parts[1]) == {"0"}:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+class JsonlExporter:
+    """Grava os spans terminados em uma thread à parte (sem bloquear o event loop)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._resource = None
+
+    def export(self, span: Span):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    # PID do worker (o módulo pode ter sido importado no master do Gunicorn)
+                    self._resource = {"attributes": _attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})}
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.shutdown)
+        self._queue.put(span)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 512:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            spans = [span.to_otlp() for span in batch if span is not None]
+            if spans:
+                self._write(spans)
+            if stop:
+                return
+
+    def _write(self, spans: list):
+        line = json.dumps({"resourceSpans": [{
+            "resource": self._resource,
+            "scopeSpans": [{"scope": {"name": "services.tracing"}, "spans": spans}]
+        }]}, ensure_ascii=False) + "\n"
+        try:
+            # O_APPEND: vários workers podem gravar no mesmo arquivo
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"Aviso: falha ao gravar spans: {e}")
+
+    def shutdown(self):
+        """Gravar os spans pendentes e parar a thread"""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+
+exporter = JsonlExporter(settings.TRACE_PATH)
+
+
+def current_span():
+    """Span ativo (um span que não grava nada se não houver)"""
+    return _current.get() or _DISABLED
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", attributes: Optional[dict] = None, traceparent: Optional[str] = None):
+    """Abrir um span filho do span ativo (ou raiz, continuando o traceparent recebido, se houver)"""
+    parent = _current.get()
+    if not settings.TRACING_ENABLED or (parent is not None and not parent.recording):
+        yield parent or _DISABLED
+        return
+
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        incoming = _parse_traceparent(traceparent)
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < settings.TRACE_SAMPLE_RATE
+        if not sampled:
+            token = _current.set(_NonRecordingSpan(trace_id, os.urandom(8).hex()))
+            try:
+                yield _current.get()
+            finally:
+                _current.reset(token)
+            return
+
+    active = Span(name, kind, trace_id, parent_id, attributes)
+    token = _current.set(active)
+    try:
+        yield active
+    except BaseException as e:
+        if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            active.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        active.end_ns = time.time_ns()
+        exporter.export(active)
+
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """Decorador: executar a função (síncrona ou assíncrona) dentro de um span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """Span "server" por requisição HTTP; devolve o traceparent na resposta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        attributes = {"http.request.method": scope["method"], "url.path": scope["path"]}
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit():
+            attributes["http.request.body.size"] = int(content_length)
+
+        with span(f"{scope['method']} {scope['path']}", "server", attributes, traceparent) as active:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    active.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500 and active.recording:
+                        active.status = _STATUS_ERROR
+                    if active.recording:
+                        message.setdefault("headers", [])
+                        message["headers"] = [*message["headers"], (b"traceparent", active.traceparent().encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                # Nome pelo modelo da rota (ex.: "POST /api/documents/{document_id}"), conhecido após o roteamento
+                route = scope.get("route")
+                if active.recording and getattr(route, "path", None):
+                    active.name = f"{scope['method']} {route.path}"
+                    active.set_attribute("http.route", route.path)
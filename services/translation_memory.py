@@ -0,0 +1,130 @@
+"""
+Memória de tradução: segmentos já traduzidos, por idioma, em SQLite com LRU em memória
+"""
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import settings
+from services.tracing import traced, current_span
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    hash TEXT NOT NULL,
+    language TEXT NOT NULL,
+    source TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (hash, language)
+);
+"""
+
+# Consultas IN (...) em blocos (limite de parâmetros do SQLite)
+_QUERY_BATCH = 500
+
+
+def normalize_segment(segment: str) -> str:
+    """Forma canônica de um segmento (espaços colapsados), usada no hash"""
+    return re.sub(r"\s+", " ", segment).strip()
+
+
+def segment_hash(segment: str) -> str:
+    """Hash SHA-256 do segmento normalizado"""
+    return hashlib.sha256(normalize_segment(segment).encode("utf-8")).hexdigest()
+
+
+def normalize_language(language: str) -> str:
+    """Idioma de destino como chave ("Inglês " e "inglês" são o mesmo)"""
+    return language.strip().lower()
+
+
+class TranslationMemory:
+    def __init__(self, db_path: Optional[str] = None, cache_size: int = 20000):
+        self.db_path = db_path or settings.TRANSLATION_MEMORY_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Nova conexão por operação (seguro entre threads e workers), em uma transação"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key: tuple, translation: str):
+        """Guardar no LRU (chamar com o lock)"""
+        self._cache[key] = translation
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    @traced("cache.translation_memory")
+    def lookup(self, hashes: list, language: str) -> dict:
+        """Traduções conhecidas para os hashes informados: {hash: tradução}"""
+        language = normalize_language(language)
+        found = {}
+        missing = []
+        with self._lock:
+            for content_hash in dict.fromkeys(hashes):
+                key = (content_hash, language)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[content_hash] = self._cache[key]
+                else:
+                    missing.append(content_hash)
+
+        if missing:
+            with self._connect() as conn:
+                for start in range(0, len(missing), _QUERY_BATCH):
+                    batch = missing[start:start + _QUERY_BATCH]
+                    rows = conn.execute(
+                        f"SELECT hash, translation FROM segments WHERE language = ? "
+                        f"AND hash IN ({','.join('?' * len(batch))})",
+                        [language, *batch]
+                    ).fetchall()
+                    found.update(rows)
+            with self._lock:
+                for content_hash in missing:
+                    if content_hash in found:
+                        self._remember((content_hash, language), found[content_hash])
+        current_span().set_attributes({"cache.requested": len(hashes), "cache.hits": len(found)})
+        return found
+
+    def store(self, entries: list, language: str):
+        """Registrar traduções novas: [(segmento original, tradução)]"""
+        language = normalize_language(language)
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [(segment_hash(source), language, normalize_segment(source), translation, now)
+                for source, translation in entries]
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO segments (hash, language, source, translation, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        with self._lock:
+            for content_hash, _, _, translation, _ in rows:
+                self._remember((content_hash, language), translation)
+
+    def stats(self) -> dict:
+        """Quantidade de segmentos por idioma"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT language, COUNT(*) FROM segments GROUP BY language").fetchall()
+        return {"languages": dict(rows), "cached": len(self._cache)}
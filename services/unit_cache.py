@@ -0,0 +1,109 @@
+"""
+Cache de resultados por unidade (página de PDF / slide), indexado pelo hash do conteúdo da unidade:
+reenviar um documento com poucas alterações só reprocessa as unidades que mudaram
+"""
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import settings
+from services.tracing import traced, current_span
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS unit_results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+# Consultas IN (...) em blocos (limite de parâmetros do SQLite)
+_QUERY_BATCH = 500
+
+
+def unit_key(kind: str, *parts) -> str:
+    """Chave de cache: tipo do resultado + partes (bytes ou texto) que o determinam"""
+    digest = hashlib.sha256(kind.encode("utf-8"))
+    for part in parts:
+        digest.update(b"\x00")
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+    return f"{kind}:{digest.hexdigest()}"
+
+
+class UnitCache:
+    def __init__(self, db_path: Optional[str] = None, cache_size: int = 5000):
+        self.db_path = db_path or settings.UNIT_CACHE_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Nova conexão por operação (seguro entre threads e workers), em uma transação"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key: str, value):
+        """Guardar no LRU (chamar com o lock)"""
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    @traced("cache.units")
+    def get_many(self, keys: list) -> dict:
+        """Resultados já calculados: {chave: valor}"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+                else:
+                    missing.append(key)
+
+        if missing:
+            loaded = {}
+            with self._connect() as conn:
+                for start in range(0, len(missing), _QUERY_BATCH):
+                    batch = missing[start:start + _QUERY_BATCH]
+                    rows = conn.execute(
+                        f"SELECT key, value FROM unit_results WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    loaded.update((key, json.loads(value)) for key, value in rows)
+            with self._lock:
+                for key, value in loaded.items():
+                    self._remember(key, value)
+            found.update(loaded)
+        current_span().set_attributes({"cache.requested": len(keys), "cache.hits": len(found)})
+        return found
+
+    def put_many(self, values: dict):
+        """Registrar resultados novos: {chave: valor serializável em JSON}"""
+        if not values:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO unit_results (key, value, created_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False), now) for key, value in values.items()]
+            )
+        with self._lock:
+            for key, value in values.items():
+                self._remember(key, value)
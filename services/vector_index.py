@@ -0,0 +1,208 @@
+"""
+Índice vetorial local sobre materiais enviados (chunking, embeddings e busca top-k)
+"""
+import os
+import re
+import json
+import uuid
+import zlib
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from config import settings
+from services.ai_limiter import ai_priority, PRIORITY_BATCH
+
+# Dimensão dos embeddings locais (hashing de palavras), usados quando não há API configurada
+LOCAL_EMBEDDING_DIM = 512
+LOCAL_EMBEDDING_MODEL = "local-hashing-512"
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def chunk_text(text: str, max_chars: int = 1500, overlap: int = 200) -> list:
+    """
+    Dividir texto em trechos respeitando parágrafos e frases.
+    Parágrafos são agrupados até max_chars; parágrafos maiores são
+    quebrados por frases. Cada trecho repete o final do anterior (overlap).
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+    # Quebrar parágrafos longos em frases
+    pieces = []
+    for paragraph in paragraphs:
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence.strip():
+                pieces.append(sentence)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap else ""
+            current = f"{tail}\n\n{piece}" if tail else piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def local_embeddings(texts: list, dim: int = LOCAL_EMBEDDING_DIM) -> np.ndarray:
+    """Embeddings por hashing de palavras e bigramas (estável entre processos)"""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD_RE.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(matrix[row], hashes % dim, signs)
+    return _normalize(matrix)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """Normalizar linhas (norma L2) para que o produto escalar seja a similaridade cosseno"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def _top_k(vectors: np.ndarray, query_vector: np.ndarray, chunks: list, top_k: int) -> list:
+    """Trechos com maior similaridade, do mais para o menos similar"""
+    scores = vectors @ query_vector
+    top_k = max(1, min(top_k, len(scores)))
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    top = top[np.argsort(-scores[top])]
+    return [
+        {"position": int(i), "score": float(scores[i]), "text": chunks[i]}
+        for i in top
+    ]
+
+
+class VectorIndex:
+    def __init__(self, index_dir: Optional[str] = None, ai_service=None, batch_size: int = 64, max_open: int = 32):
+        self.index_dir = index_dir or settings.INDEX_DIR
+        self.ai_service = ai_service
+        self.batch_size = batch_size
+        # Índices abertos (LRU): id -> (matriz memory-mapped, metadados)
+        self._loaded = OrderedDict()
+        self._max_open = max_open
+        self._lock = threading.Lock()
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _paths(self, index_id: str) -> tuple:
+        """Arquivos de um índice: vetores (.npy) e metadados (.json)"""
+        if not re.fullmatch(r"[0-9a-f]{32}", index_id):
+            raise Exception("ID de índice inválido")
+        base = os.path.join(self.index_dir, index_id)
+        return f"{base}.npy", f"{base}.json"
+
+    def _embedding_model(self) -> str:
+        """Modelo de embeddings para novos índices (API se configurada, senão local)"""
+        if self.ai_service is not None and self.ai_service.openai_client:
+            return OPENAI_EMBEDDING_MODEL
+        return LOCAL_EMBEDDING_MODEL
+
+    async def embed(self, texts: list, model: str) -> np.ndarray:
+        """Gerar embeddings em lotes com o mesmo modelo usado pelo índice (cálculo local em outra thread)"""
+        if model == LOCAL_EMBEDDING_MODEL:
+            return await asyncio.to_thread(local_embeddings, texts)
+
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            batches.append(np.asarray(await self.ai_service.embed(batch, model), dtype=np.float32))
+        return await asyncio.to_thread(lambda: _normalize(np.vstack(batches)))
+
+    async def add_document(self, text: str, name: str = "", max_chars: int = 1500) -> dict:
+        """Indexar um documento extraído e persistir em disco"""
+        try:
+            chunks = await asyncio.to_thread(chunk_text, text, max_chars)
+            if not chunks:
+                raise Exception("Documento sem texto para indexar")
+
+            model = self._embedding_model()
+            # Indexação em lote: consultas do usuário passam na frente na fila do limitador
+            with ai_priority(PRIORITY_BATCH):
+                vectors = await self.embed(chunks, model)
+
+            index_id = uuid.uuid4().hex
+            meta = {
+                "index_id": index_id,
+                "name": name,
+                "model": model,
+                "dim": int(vectors.shape[1]),
+                "chunks": chunks
+            }
+            await asyncio.to_thread(self._write, index_id, vectors, meta)
+
+            return {"index_id": index_id, "name": name, "num_chunks": len(chunks), "model": model}
+        except Exception as e:
+            raise Exception(f"Erro ao indexar documento: {str(e)}")
+
+    def _write(self, index_id: str, vectors: np.ndarray, meta: dict):
+        """Gravar vetores e metadados (metadados por último: só então o índice passa a existir)"""
+        vectors_path, meta_path = self._paths(index_id)
+        np.save(vectors_path, vectors)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    def _load(self, index_id: str) -> tuple:
+        """
+        Abrir índice com memory-map (mantido aberto enquanto estiver entre os max_open mais usados).
+        O arquivo é conferido a cada uso: um índice removido por outro worker não é mais servido.
+        """
+        vectors_path, meta_path = self._paths(index_id)
+        if not os.path.exists(meta_path):
+            with self._lock:
+                self._loaded.pop(index_id, None)
+            raise Exception("Índice não encontrado")
+
+        with self._lock:
+            if index_id in self._loaded:
+                self._loaded.move_to_end(index_id)
+                return self._loaded[index_id]
+
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(vectors_path, mmap_mode="r")
+            self._loaded[index_id] = (vectors, meta)
+            while len(self._loaded) > self._max_open:
+                self._loaded.popitem(last=False)
+            return vectors, meta
+
+    async def search(self, index_id: str, query: str, top_k: int = 5) -> list:
+        """Buscar os trechos mais similares à consulta (leitura e cálculo fora do event loop)"""
+        vectors, meta = await asyncio.to_thread(self._load, index_id)
+        query_vector = (await self.embed([query], meta["model"]))[0]
+        return await asyncio.to_thread(_top_k, vectors, query_vector, meta["chunks"], top_k)
+
+    async def retrieve_text(self, index_id: str, query: str, top_k: int = 5) -> str:
+        """Montar um texto apenas com os trechos relevantes, na ordem do documento"""
+        results = await self.search(index_id, query, top_k)
+        results.sort(key=lambda r: r["position"])
+        return "\n\n".join(r["text"] for r in results)
+
+    def delete(self, index_id: str):
+        """Remover um índice do disco"""
+        vectors_path, meta_path = self._paths(index_id)
+        with self._lock:
+            self._loaded.pop(index_id, None)
+        for path in (vectors_path, meta_path):
+            if os.path.exists(path):
+                os.unlink(path)
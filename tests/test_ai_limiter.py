@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from config import settings
+from services.ai_limiter import call_with_limits, get_limiter, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, expected", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(408), True),
+    (StatusError(400), False),
+    (StatusError(401), False),
+    (TimeoutError(), True),
+    (asyncio.TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (APIConnectionError(), True),
+    (TypeError("argumento inválido"), False),
+    (KeyError("choices"), False),
+    (ValueError("resposta inválida"), False),
+])
+def test_retry_classification(error, expected):
+    assert is_retryable(error) is expected
+
+
+def _call(name, request):
+    return asyncio.run(call_with_limits("teste", name, request))
+
+
+def test_programming_error_is_not_retried_or_counted(monkeypatch):
+    monkeypatch.setattr(settings, "AI_RETRY_BASE_DELAY", 0)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        raise TypeError("bug")
+
+    with pytest.raises(TypeError):
+        _call("bug", request)
+    assert len(calls) == 1
+    assert get_limiter("teste", "bug").stats["errors"] == 0
+
+
+def test_server_error_is_retried(monkeypatch):
+    monkeypatch.setattr(settings, "AI_RETRY_BASE_DELAY", 0)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) < 3:
+            raise StatusError(503)
+        return "ok"
+
+    assert _call("instavel", request) == "ok"
+    assert len(calls) == 3
+    assert get_limiter("teste", "instavel").stats["errors"] == 2
@@ -0,0 +1,66 @@
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from services.compression import CompressionMiddleware
+
+
+async def _json(request):
+    return JSONResponse({"text": "a" * 5000})
+
+
+async def _pdf(request):
+    return Response(b"%PDF" * 1000, media_type="application/pdf")
+
+
+async def _stream(request):
+    async def lines():
+        for i in range(5):
+            yield b"linha %d\n" % i * 300
+    return StreamingResponse(lines(), media_type="text/plain")
+
+
+def _client(tmp_path=None):
+    routes = [Route("/json", _json), Route("/pdf", _pdf), Route("/stream", _stream)]
+    if tmp_path is not None:
+        text_file = tmp_path / "texto.txt"
+        text_file.write_text("conteúdo de texto\n" * 500)
+        routes.append(Route("/file", lambda request: FileResponse(text_file, media_type="text/plain")))
+    app = Starlette(routes=routes)
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return TestClient(app)
+
+
+def test_gzip_json_and_streams():
+    client = _client()
+    for path in ("/json", "/stream"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+    raw = client.get("/json", headers={"Accept-Encoding": "gzip"}).content
+    assert raw.startswith(b'{"text"')
+
+
+def test_compressed_formats_pass_through():
+    response = _client().get("/pdf", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in response.headers
+    assert response.content == b"%PDF" * 1000
+
+
+def test_compressed_file_gets_weak_etag_and_no_ranges(tmp_path):
+    client = _client(tmp_path)
+    plain = client.get("/file", headers={"Accept-Encoding": "identity"})
+    assert plain.headers["accept-ranges"] == "bytes"
+
+    response = client.get("/file", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == f"W/{plain.headers['etag']}"
+    assert "accept-ranges" not in response.headers
+
+
+def test_range_request_is_not_compressed(tmp_path):
+    response = _client(tmp_path).get("/file", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert len(response.content) == 10
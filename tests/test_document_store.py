@@ -0,0 +1,65 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.document_store import DocumentStore
+
+
+def test_save_above_max_size_keeps_nothing(tmp_path):
+    store = DocumentStore(store_dir=str(tmp_path))
+
+    with pytest.raises(ValueError, match="muito grande"):
+        store.save(io.BytesIO(b"x" * 3 * 1024 * 1024), "grande.pdf", max_size=2 * 1024 * 1024)
+
+    assert [files for _, _, files in os.walk(store.blobs_dir)] == [[]]
+    assert store.save(io.BytesIO(b"pequeno"), "pequeno.pdf", max_size=1024)["size"] == 7
+
+
+def _refcount(store, content_hash):
+    with store._connect() as conn:
+        row = conn.execute("SELECT refcount FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+    return None if row is None else row["refcount"]
+
+
+def test_same_content_shares_one_blob(tmp_path):
+    store = DocumentStore(store_dir=str(tmp_path))
+
+    first = store.save(io.BytesIO(b"mesmo conteudo"), "a.pdf")
+    second = store.save(io.BytesIO(b"mesmo conteudo"), "b.pdf")
+
+    assert not first["deduplicated"] and second["deduplicated"]
+    assert first["hash"] == second["hash"]
+    assert _refcount(store, first["hash"]) == 2
+    assert store.get(first["document_id"])["path"] == store.get(second["document_id"])["path"]
+
+
+def test_delete_keeps_shared_blob_until_last_reference(tmp_path):
+    store = DocumentStore(store_dir=str(tmp_path))
+    first = store.save(io.BytesIO(b"mesmo conteudo"), "a.pdf")
+    second = store.save(io.BytesIO(b"mesmo conteudo"), "b.pdf")
+    blob_path = store.get(second["document_id"])["path"]
+
+    assert store.delete(first["document_id"])
+    assert not store.delete(first["document_id"])
+    assert _refcount(store, first["hash"]) == 1
+    assert os.path.exists(blob_path)
+    assert store.get(second["document_id"]) is not None
+
+    assert store.delete(second["document_id"])
+    assert _refcount(store, first["hash"]) is None
+    assert not os.path.exists(blob_path)
+
+
+def test_concurrent_delete_of_same_document_decrements_once(tmp_path):
+    store = DocumentStore(store_dir=str(tmp_path))
+    first = store.save(io.BytesIO(b"mesmo conteudo"), "a.pdf")
+    second = store.save(io.BytesIO(b"mesmo conteudo"), "b.pdf")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(store.delete, [first["document_id"]] * 8))
+
+    assert results.count(True) == 1
+    assert _refcount(store, first["hash"]) == 1
+    assert os.path.exists(store.get(second["document_id"])["path"])
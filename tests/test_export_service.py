@@ -0,0 +1,55 @@
+import io
+import json
+import asyncio
+import zipfile
+
+import pytest
+
+from services.export_service import BatchExporter
+
+
+class FakeConversion:
+    def __init__(self, tmp_path, failing_title):
+        self.tmp_path = tmp_path
+        self.failing_title = failing_title
+
+    async def convert_content(self, kind, data, target, title="", template=None):
+        if title == self.failing_title:
+            raise Exception("falha ao renderizar")
+        path = self.tmp_path / f"{kind}_{title}.{target}"
+        path.write_bytes(b"conteudo")
+        return str(path)
+
+
+async def _collect(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+def test_invalid_item_rejected_before_streaming(tmp_path):
+    exporter = BatchExporter(FakeConversion(tmp_path, None))
+    items = [
+        {"kind": "lesson_plan", "title": "Plano", "data": {"title": "Plano"}},
+        {"kind": "exercises", "title": "Lista", "data": {"question": "não é lista"}},
+    ]
+
+    with pytest.raises(ValueError, match="Item 2"):
+        asyncio.run(exporter.export_zip(items, "docx"))
+
+
+def test_render_failure_goes_to_report(tmp_path):
+    exporter = BatchExporter(FakeConversion(tmp_path, "Quebrado"))
+    items = [
+        {"kind": "lesson_plan", "title": "Plano", "data": {"title": "Plano"}},
+        {"kind": "text", "title": "Quebrado", "data": "texto"},
+    ]
+
+    async def run():
+        return await _collect(await exporter.export_zip(items, "pdf"))
+
+    with zipfile.ZipFile(io.BytesIO(asyncio.run(run()))) as zf:
+        assert "Plano.pdf" in zf.namelist()
+        report = json.loads(zf.read("relatorio.json"))
+
+    assert [entry["success"] for entry in report] == [True, False]
+    assert report[1]["file"] == "Quebrado.pdf"
+    assert "falha ao renderizar" in report[1]["error"]
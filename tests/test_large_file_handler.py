@@ -0,0 +1,88 @@
+import os
+import sys
+import subprocess
+
+from PyPDF2 import PdfReader
+
+from services.large_file_handler import MB, _compress_job, _split_job
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _write_pdf(path, num_pages, image_size=1024):
+    """PDF com uma fonte compartilhada e, por página, um texto e uma imagem de image_size bytes"""
+    offsets = []
+    with open(path, "wb") as f:
+        def obj(num, body, stream=None):
+            offsets.append((num, f.tell()))
+            f.write(b"%d 0 obj\n" % num + body)
+            if stream is not None:
+                f.write(b"\nstream\n" + stream + b"\nendstream")
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = b" ".join(b"%d 0 R" % (4 + 3 * i) for i in range(num_pages))
+        obj(1, b"<</Type /Catalog /Pages 2 0 R>>")
+        obj(2, b"<</Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 612 792]>>" % (kids, num_pages))
+        obj(3, b"<</Type /Font /Subtype /Type1 /BaseFont /Helvetica>>")
+        for i in range(num_pages):
+            page, content, image = 4 + 3 * i, 5 + 3 * i, 6 + 3 * i
+            obj(page, b"<</Type /Page /Parent 2 0 R /Contents %d 0 R /Resources <</Font <</F1 3 0 R>> "
+                      b"/XObject <</Im1 %d 0 R>>>>>>" % (content, image))
+            text = b"BT /F1 12 Tf 72 720 Td (Pagina %d) Tj ET" % (i + 1)
+            obj(content, b"<</Length %d>>" % len(text), text)
+            data = os.urandom(image_size)
+            obj(image, b"<</Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray "
+                       b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d>>" % len(data), data)
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        for _, offset in sorted(offsets):
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<</Size %d /Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+
+
+def _peak_rss_mb(job_call):
+    """Executar o job em um processo novo e retornar o pico de memória residente (MB)"""
+    # VmHWM (e não ru_maxrss, que herda o pico do processo do pytest no fork)
+    code = (
+        "from services.large_file_handler import MB, _compress_job, _split_job\n"
+        f"{job_call}\n"
+        "status = open('/proc/self/status').read()\n"
+        "print(int(status.split('VmHWM:')[1].split()[0]) // 1024)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+def test_compress_keeps_pages_and_compresses_content(tmp_path):
+    source, output = str(tmp_path / "in.pdf"), str(tmp_path / "out.pdf")
+    _write_pdf(source, 5)
+
+    result = _compress_job(source, output, 256 * MB, 2)
+
+    reader = PdfReader(output)
+    assert result["num_pages"] == len(reader.pages) == 5
+    assert [page.extract_text() for page in reader.pages] == [f"Pagina {i}" for i in range(1, 6)]
+    assert reader.pages[0].get_contents().get("/Filter") == "/FlateDecode"
+
+
+def test_split_writes_only_each_chunk_pages(tmp_path):
+    source = str(tmp_path / "in.pdf")
+    _write_pdf(source, 5)
+
+    result = _split_job(source, 2, str(tmp_path), 256 * MB, 2)
+
+    texts = [[page.extract_text() for page in PdfReader(chunk).pages] for chunk in result["chunks"]]
+    assert texts == [["Pagina 1", "Pagina 2"], ["Pagina 3", "Pagina 4"], ["Pagina 5"]]
+
+
+def test_large_jobs_stay_within_rss_budget(tmp_path):
+    source = str(tmp_path / "big.pdf")
+    _write_pdf(source, 96, image_size=MB)
+    budget_mb = 64
+
+    compress_peak = _peak_rss_mb(f"_compress_job({source!r}, {str(tmp_path / 'out.pdf')!r}, {budget_mb} * MB, 4)")
+    split_peak = _peak_rss_mb(f"_split_job({source!r}, 48, {str(tmp_path)!r}, {budget_mb} * MB, 4)")
+
+    assert compress_peak < budget_mb
+    assert split_peak < budget_mb
@@ -0,0 +1,25 @@
+from services import model_router
+from services.model_router import ModelRouter, FAILURE_HALF_LIFE
+
+TIERS = {"standard": {"openai": ["barato", "caro"]}}
+PRICES = {"barato": (0.1, 0.1), "caro": (10.0, 10.0)}
+
+
+def _router():
+    return ModelRouter(routes={"default": "standard"}, tiers=TIERS, prices=PRICES)
+
+
+def test_failing_model_regains_position_after_failures_decay(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(model_router.time, "monotonic", lambda: clock[0])
+    router = _router()
+    assert router.candidates("summarize", ["openai"])[0] == ("openai", "barato")
+
+    for _ in range(5):
+        router.record("openai", "barato", 1.0, failed=True)
+    assert router.candidates("summarize", ["openai"])[0] == ("openai", "caro")
+
+    # Nenhuma chamada nova ao modelo: só o tempo passando o devolve à frente
+    clock[0] += 2 * FAILURE_HALF_LIFE
+    assert router.candidates("summarize", ["openai"])[0] == ("openai", "barato")
+    assert router.snapshot()["models"]["openai:barato"]["failure_rate"] < model_router.FAILURE_THRESHOLD
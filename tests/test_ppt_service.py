@@ -0,0 +1,35 @@
+import zipfile
+import warnings
+
+from pptx import Presentation
+
+from services.ppt_service import PPTService
+
+
+def _slide_titles(path):
+    return [slide.shapes.title.text for slide in Presentation(path).slides]
+
+
+def test_apply_operations_delete_then_add(tmp_path):
+    service = PPTService(templates_dir=str(tmp_path))
+    source = service.create_presentation("Deck", [
+        {"title": "S1", "content": "a"},
+        {"title": "S2", "content": "b"},
+    ], str(tmp_path))
+    output = str(tmp_path / "edited.pptx")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = service.apply_operations(source, [
+            {"op": "delete", "slide": 1},
+            {"op": "add", "title": "NEW", "content": "c"},
+        ], output)
+
+    assert result["num_slides"] == 3
+    assert _slide_titles(output) == ["S1", "S2", "NEW"]
+    with zipfile.ZipFile(output) as zf:
+        names = zf.namelist()
+    assert len(names) == len(set(names))
+    assert sorted(n for n in names if n.startswith("ppt/slides/slide")) == [
+        "ppt/slides/slide1.xml", "ppt/slides/slide2.xml", "ppt/slides/slide3.xml"
+    ]
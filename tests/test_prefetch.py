@@ -0,0 +1,76 @@
+import asyncio
+
+from services import prefetch as prefetch_module
+from services.prefetch import Prefetcher
+
+
+class FakeAI:
+    async def summarize(self, text, max_words=200):
+        return f"resumo de {len(text.split())} palavras"
+
+    async def generate_questions(self, text, num_questions=5, difficulty="média"):
+        return [{"question": "?"}] * num_questions
+
+
+class FakeCache:
+    """Cache em memória que registra cada acesso (cada um seria uma ida ao SQLite)"""
+
+    def __init__(self):
+        self.results = {}
+        self.calls = []
+
+    def claim(self, keys):
+        self.calls.append("claim")
+        return list(keys)
+
+    def release(self, key):
+        self.calls.append("release")
+
+    def pending(self, key):
+        self.calls.append("pending")
+        return False
+
+    def put(self, key, value):
+        self.calls.append("put")
+        self.results[key] = value
+
+    def take(self, key):
+        self.calls.append("take")
+        return self.results.pop(key, None)
+
+
+def _prefetcher(monkeypatch):
+    monkeypatch.setattr(prefetch_module, "has_idle_capacity", lambda: True)
+    return Prefetcher(FakeAI(), FakeCache(), max_tasks=4)
+
+
+def test_take_without_prefetch_skips_shared_cache(monkeypatch):
+    prefetcher = _prefetcher(monkeypatch)
+
+    assert asyncio.run(prefetcher.take("summarize", "texto qualquer", max_words=200)) is None
+    assert prefetcher.ai_cache.calls == []
+
+
+def test_take_returns_result_scheduled_in_this_worker(monkeypatch):
+    prefetcher = _prefetcher(monkeypatch)
+
+    async def run():
+        assert await prefetcher.schedule("um texto para resumir")
+        first = await prefetcher.take("summarize", "um texto para resumir", max_words=200)
+        second = await prefetcher.take("summarize", "um texto para resumir", max_words=200)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == "resumo de 4 palavras"
+    # Entregue uma única vez; a segunda chamada nem consulta o cache
+    assert second is None
+    assert prefetcher.ai_cache.calls.count("take") == 1
+
+
+def test_take_with_prefetch_id_reads_shared_cache(monkeypatch):
+    prefetcher = _prefetcher(monkeypatch)
+    key = prefetch_module.prefetch_key("summarize", "texto de outro worker", {"max_words": 200})
+    prefetcher.ai_cache.results[key] = "resumo pronto"
+
+    result = asyncio.run(prefetcher.take("summarize", "texto de outro worker", prefetch_id="abc", max_words=200))
+    assert result == "resumo pronto"
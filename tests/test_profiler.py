@@ -0,0 +1,22 @@
+import time
+
+from services.profiler import SamplingProfiler
+
+
+def test_profile_is_visible_and_stoppable_from_another_worker(tmp_path):
+    owner = SamplingProfiler(profiles_dir=str(tmp_path))
+    other = SamplingProfiler(profiles_dir=str(tmp_path))
+
+    started = owner.start(duration=30, interval=0.01)
+    profile_id = started["id"]
+    assert other.status(profile_id)["state"] == "running"
+    assert other.status(profile_id)["pid"] == started["pid"]
+
+    other.stop(profile_id)
+    deadline = time.monotonic() + 5
+    while other.result(profile_id) is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert other.status(profile_id)["state"] == "finished"
+    assert other.result(profile_id)["id"] == profile_id
+    assert not owner.active
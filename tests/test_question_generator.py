@@ -0,0 +1,54 @@
+import asyncio
+
+from config import settings
+from services.question_generator import QuestionGenerator, split_quota
+
+TOPICS = ["fotossíntese nas plantas", "revolução francesa", "frações e decimais", "placas tectônicas"]
+
+
+class FakeAI:
+    def __init__(self, failing=None, fail_times=0):
+        self.failing = failing
+        self.fail_times = fail_times
+        self.requests = []
+
+    async def generate_questions(self, text, num_questions=5, difficulty="média"):
+        self.requests.append((text[:20], num_questions))
+        if self.failing and self.failing in text and self.fail_times > 0:
+            self.fail_times -= 1
+            raise Exception("provedor indisponível")
+        topic = text.split()[1]
+        return [{"question": f"Questão {i} {topic} {' '.join(['x'] * i)}?"} for i in range(num_questions)]
+
+
+def _units():
+    return [(i + 1, f"Sobre {topic}. " + "conteúdo " * 500) for i, topic in enumerate(TOPICS)]
+
+
+def test_failed_section_is_reported_without_failing_exam():
+    ai = FakeAI(failing="revolução", fail_times=10)
+    result = asyncio.run(QuestionGenerator(ai, similarity_threshold=1.1).generate(_units(), 8))
+
+    sections = {s["section"]: s for s in result["sections"]}
+    assert "provedor indisponível" in sections[2]["error"]
+    assert all("error" not in s for n, s in sections.items() if n != 2)
+    assert result["questions"]
+    assert all(q["section"] != 2 for q in result["questions"])
+
+
+def test_failed_call_is_retried_alone():
+    ai = FakeAI(failing="revolução", fail_times=1)
+    result = asyncio.run(QuestionGenerator(ai, similarity_threshold=1.1).generate(_units(), 8))
+
+    assert all("error" not in s for s in result["sections"])
+    assert len(result["questions"]) == 8
+    assert len(ai.requests) == len(result["sections"]) + 1
+
+
+def test_large_quotas_are_split_under_output_cap(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_OUTPUT_TOKENS", 1100)
+    ai = FakeAI()
+    asyncio.run(QuestionGenerator(ai, similarity_threshold=1.1).generate(_units()[:1], 20))
+
+    assert sorted(count for _, count in ai.requests) == [4, 4, 4, 4, 5, 5]
+    assert split_quota(26, 5) == [5, 5, 4, 4, 4, 4]
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from services.vector_index import VectorIndex
+
+
+TEXT = "\n\n".join([
+    "A fotossíntese transforma luz solar em energia química nas folhas das plantas.",
+    "A Revolução Francesa começou em 1789 com a queda da Bastilha.",
+    "Frações representam partes de um inteiro, como um meio ou três quartos.",
+])
+
+
+def test_add_and_search_round_trip(tmp_path):
+    index = VectorIndex(index_dir=str(tmp_path))
+
+    async def run():
+        added = await index.add_document(TEXT, "aula", max_chars=100)
+        results = await index.search(added["index_id"], "luz solar nas folhas das plantas", top_k=2)
+        return added, results
+
+    added, results = asyncio.run(run())
+
+    assert added["num_chunks"] == 3
+    assert len(results) == 2
+    assert "fotossíntese" in results[0]["text"]
+    assert results[0]["score"] >= results[1]["score"]
+
+
+def test_deleted_index_is_not_served_from_memory(tmp_path):
+    writer = VectorIndex(index_dir=str(tmp_path))
+    reader = VectorIndex(index_dir=str(tmp_path))
+
+    index_id = asyncio.run(writer.add_document(TEXT, "aula", max_chars=100))["index_id"]
+    asyncio.run(reader.search(index_id, "frações"))
+    writer.delete(index_id)
+
+    with pytest.raises(Exception, match="Índice não encontrado"):
+        asyncio.run(reader.search(index_id, "frações"))
+
+
+def test_open_indexes_are_bounded(tmp_path):
+    index = VectorIndex(index_dir=str(tmp_path), max_open=2)
+
+    async def run():
+        ids = [(await index.add_document(TEXT, f"aula {i}"))["index_id"] for i in range(3)]
+        for index_id in ids:
+            await index.search(index_id, "frações")
+        return ids
+
+    ids = asyncio.run(run())
+    assert list(index._loaded) == ids[1:]